@@ -23,6 +23,7 @@ document.addEventListener("DOMContentLoaded", () => {
     const zoomOutBtn = document.getElementById("zoom-out");
     const zoomInBtn = document.getElementById("zoom-in");
     const zoomLevel = document.getElementById("zoom-level");
+    const bookSelect = document.getElementById("book-select");
 
     // ========================================
     // RESIZABLE DIVIDER FUNCTIONALITY
@@ -69,14 +70,33 @@ document.addEventListener("DOMContentLoaded", () => {
     let totalPages = 0;
     let currentZoom = 1.0;
 
+    // Active book in the server-side library
+    let currentBookId = null;
+
     // ========================================
     // WEBSOCKET FUNCTIONS
     // ========================================
 
+    // The session survives reloads and reconnects, so the server can restore the
+    // conversation whichever worker the socket lands on
+    function getSessionId() {
+        let sessionId = localStorage.getItem("chatSessionId");
+        if (!sessionId) {
+            sessionId = window.crypto && crypto.randomUUID
+                ? crypto.randomUUID()
+                : Date.now().toString(36) + Math.random().toString(36).slice(2);
+            localStorage.setItem("chatSessionId", sessionId);
+        }
+        return sessionId;
+    }
+
     // Establishes WebSocket connection with automatic reconnection
     function connectWebSocket() {
         const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
-        socket = new WebSocket(`${protocol}//${window.location.host}/ws`);
+        const sessionId = encodeURIComponent(getSessionId());
+        socket = new WebSocket(
+            `${protocol}//${window.location.host}/ws?session_id=${sessionId}`
+        );
 
         socket.addEventListener("open", (event) => {
             isConnected = true;
@@ -139,6 +159,7 @@ document.addEventListener("DOMContentLoaded", () => {
                 content: message,
                 current_page: currentPage,
                 total_pages: totalPages,
+                book_id: currentBookId,
             };
 
             socket.send(JSON.stringify(messageData));
@@ -146,6 +167,23 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     }
 
+    /**
+     * Tells the backend which page the reader is on, so that it can prefetch
+     * context for the characters on the pages just read
+     */
+    function notifyPageChange() {
+        if (!isConnected || !currentBookId) return;
+
+        socket.send(
+            JSON.stringify({
+                type: "page_change",
+                current_page: currentPage,
+                total_pages: totalPages,
+                book_id: currentBookId,
+            })
+        );
+    }
+
     /**
      * Appends a user message to the chat
      * @param {string} message - The message text
@@ -255,8 +293,14 @@ document.addEventListener("DOMContentLoaded", () => {
             pdfjsLib.GlobalWorkerOptions.workerSrc =
                 "https://cdnjs.cloudflare.com/ajax/libs/pdf.js/3.11.174/pdf.worker.min.js";
 
-            // Load the PDF
-            const pdf = await pdfjsLib.getDocument(pdfUrl).promise;
+            // Load the PDF. The server supports byte-range requests, so only the
+            // parts needed for the pages being viewed are fetched.
+            const pdf = await pdfjsLib.getDocument({
+                url: pdfUrl,
+                disableAutoFetch: true,
+                disableStream: true,
+                rangeChunkSize: 65536,
+            }).promise;
             currentPdf = pdf;
             totalPages = pdf.numPages;
             currentPage = 1;
@@ -301,6 +345,7 @@ document.addEventListener("DOMContentLoaded", () => {
             await page.render(renderContext).promise;
             currentPage = pageNum;
             updatePageInfo();
+            notifyPageChange();
         } catch (error) {
             console.error("Error rendering page:", error);
         }
@@ -383,7 +428,8 @@ document.addEventListener("DOMContentLoaded", () => {
         formData.append("pdf", file);
 
         try {
-            const response = await fetch("/upload-pdf", {
+            const sessionId = encodeURIComponent(getSessionId());
+            const response = await fetch(`/upload-pdf?session_id=${sessionId}`, {
                 method: "POST",
                 body: formData,
             });
@@ -394,6 +440,8 @@ document.addEventListener("DOMContentLoaded", () => {
                 appendBotMessage(
                     `PDF "${file.name}" uploaded successfully! The document contains ${result.pages} pages.`
                 );
+                currentBookId = result.book_id;
+                await refreshLibrary();
 
                 // Load and display the PDF
                 if (result.pdf_url) {
@@ -415,6 +463,71 @@ document.addEventListener("DOMContentLoaded", () => {
         scrollToBottom();
     }
 
+    // ========================================
+    // LIBRARY FUNCTIONS
+    // ========================================
+
+    /**
+     * Populates the book selector from the server-side library
+     */
+    async function refreshLibrary() {
+        try {
+            const sessionId = encodeURIComponent(getSessionId());
+            const response = await fetch(`/books?session_id=${sessionId}`);
+            const result = await response.json();
+
+            // After a reload, reopen the book this session was reading
+            if (!currentBookId && result.active_book_id) {
+                const book = result.books.find(
+                    (book) => book.book_id === result.active_book_id
+                );
+                if (book) {
+                    currentBookId = book.book_id;
+                    await loadPDF(book.pdf_url);
+                }
+            }
+
+            bookSelect.innerHTML = '<option value="">Library</option>';
+            for (const book of result.books) {
+                const option = document.createElement("option");
+                option.value = book.book_id;
+                option.textContent = book.source;
+                bookSelect.appendChild(option);
+            }
+            bookSelect.value = currentBookId || "";
+        } catch (error) {
+            console.error("Error loading library:", error);
+        }
+    }
+
+    /**
+     * Switches to a book that is already in the library
+     * @param {string} bookId - The library ID of the book
+     */
+    async function selectBook(bookId) {
+        if (!bookId || bookId === currentBookId) return;
+
+        try {
+            const sessionId = encodeURIComponent(getSessionId());
+            const response = await fetch(
+                `/books/${bookId}/select?session_id=${sessionId}`,
+                { method: "POST" }
+            );
+            const result = await response.json();
+
+            if (response.ok) {
+                currentBookId = result.book_id;
+                appendBotMessage(`Switched to "${result.filename}".`);
+                await loadPDF(result.pdf_url);
+            } else {
+                appendBotMessage(`Error switching book: ${result.detail}`);
+            }
+        } catch (error) {
+            appendBotMessage(`Error switching book: ${error.message}`);
+        }
+        scrollToBottom();
+    }
+
     // ========================================
     // INITIALIZATION & EVENT LISTENERS
     // ========================================
@@ -423,6 +536,7 @@ document.addEventListener("DOMContentLoaded", () => {
      * Initialize WebSocket connection
      */
     connectWebSocket();
+    refreshLibrary();
 
     /**
      * Set up event listeners for user interactions
@@ -451,6 +565,11 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     });
 
+    // Library selector
+    bookSelect.addEventListener("change", (event) => {
+        selectBook(event.target.value);
+    });
+
     // PDF control event listeners
     prevPageBtn.addEventListener("click", goToPreviousPage);
     nextPageBtn.addEventListener("click", goToNextPage);
@@ -1,6 +1,11 @@
 import io
+import logging
+import math
 import os
+import re
+import threading
 
+import numpy as np
 import PyPDF2
 from dotenv import load_dotenv
 from fastapi import UploadFile
@@ -11,10 +16,81 @@ from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_huggingface import HuggingFaceEndpointEmbeddings
 
-from backend.config import EMBEDDING_MODEL_ID, MODEL_ID
+from backend.cache import CachedQueryEmbeddings, LRUCache, SemanticAnswerCache
+from backend.chapters import detect_chapters, route_chapters
+from backend.cleaning import drop_duplicate_chunks, strip_page_boilerplate
+from backend.config import (
+    ADAPTIVE_K,
+    ANALYSIS_FIRST_CHUNKS,
+    ANALYSIS_PROBES,
+    ANALYSIS_RECENT_CHUNKS,
+    ANALYSIS_RELEVANT_CHUNKS,
+    ANSWER_CACHE_MAX_PAGE_GAP,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_THRESHOLD,
+    CHAPTER_SUMMARY_CHARS,
+    CHAPTER_TOP_K,
+    CHUNKING_STRATEGY,
+    CONTEXT_TOKEN_BUDGET,
+    DEDUPLICATE_CHUNKS,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_ID,
+    FLAT_INDEX_DTYPE,
+    INDEX_BACKEND,
+    INGEST_EMBED_BATCH_SIZE,
+    LLM_TIMEOUT_S,
+    MIN_RELEVANCE_SCORE,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    RANKED_CACHE_DEPTH,
+    RANKED_CACHE_SIZE,
+    RETRIEVAL_CACHE_SIZE,
+    RETRIEVAL_MIN_K,
+    RETRIEVAL_MODE,
+    STRIP_BOILERPLATE,
+    TASK_PROFILES,
+)
+from backend.embeddings import (
+    EMBEDDING_BACKENDS,
+    HashingEmbeddings,
+    RateLimitedEmbeddings,
+    embedding_model_name,
+    shared_local_embeddings,
+)
+from backend.flat_index import FlatVectorIndex
+from backend.http_pool import configure_http_pool
+from backend.memory import StageMemory, index_memory
+from backend.postings import CharacterPostings
+from backend.prefetch import extract_names, rank_recent_names
+from backend.resilience import CallCancelledError, inference_caller
+from backend.singleflight import SingleFlight, normalize_query
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 HF_API_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
+# Sends chat and embedding requests elsewhere instead, such as to the local fake
+# server used by experiments/load_generator.py
+HF_INFERENCE_BASE_URL = os.getenv("HF_INFERENCE_BASE_URL")
+
+# Chat, analysis and remote embedding requests all share one connection pool
+configure_http_pool()
+
+# A query's embedding only depends on the model, so all books using the same
+# embedding backend share one cache
+query_embedding_caches = {
+    backend: LRUCache(QUERY_EMBEDDING_CACHE_SIZE, f"query_embeddings_{backend}")
+    for backend in EMBEDDING_BACKENDS
+}
+
+# Shared by every embedding function created in this process when set; batch
+# ingestion (backend/ingest.py) sets one limiter for all of its worker processes
+embedding_rate_limiter = None
+
+
+def set_embedding_rate_limiter(limiter):
+    """Limit the embedding requests of EmbeddedPDFs created from now on."""
+    global embedding_rate_limiter
+    embedding_rate_limiter = limiter
 
 
 async def file_to_langchain_doc(pdf: UploadFile) -> list[Document]:
@@ -28,7 +104,13 @@ async def file_to_langchain_doc(pdf: UploadFile) -> list[Document]:
         list[Document]: A list of langchain Document objects, each representing a page in the PDF.
     """
     content = await pdf.read()
+    return pdf_bytes_to_langchain_doc(content, pdf.filename)
+
 
+def pdf_bytes_to_langchain_doc(content: bytes, filename: str) -> list[Document]:
+    """
+    Like file_to_langchain_doc, for a PDF that has already been read into memory.
+    """
     pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
     pages = []
 
@@ -37,7 +119,7 @@ async def file_to_langchain_doc(pdf: UploadFile) -> list[Document]:
         doc = Document(
             page_content=page_text,
             metadata={
-                "source": pdf.filename,
+                "source": filename,
                 "page": page_num,
                 "total_pages": len(pdf_reader.pages),
             },
@@ -47,11 +129,75 @@ async def file_to_langchain_doc(pdf: UploadFile) -> list[Document]:
     return pages
 
 
+CHUNKING_STRATEGIES = ("recursive", "sentence", "page")
+
+# End of a sentence (with any closing quotes or brackets) or a blank line
+_SENTENCE_BOUNDARY = re.compile(r"[.!?]+[\"'\u201d\u2019)\]]*\s+|\n\s*\n")
+
+
+def _split_sentences(text: str) -> list[tuple[int, str]]:
+    """Split text into (start offset, segment) pairs at sentence and paragraph ends."""
+    segments = []
+    start = 0
+    for match in _SENTENCE_BOUNDARY.finditer(text):
+        segments.append((start, text[start : match.end()]))
+        start = match.end()
+    if start < len(text):
+        segments.append((start, text[start:]))
+    return segments
+
+
+def _pack_segments(
+    segments: list[tuple[int, str]], chunk_size: int, chunk_overlap: int
+) -> list[tuple[int, str]]:
+    """
+    Greedily pack segments into chunks of at most chunk_size characters.
+
+    Each chunk starts with as many trailing segments of the previous chunk as fit in
+    chunk_overlap characters. Segments longer than chunk_size are cut into pieces.
+    """
+    pieces = []
+    for start, segment in segments:
+        for offset in range(0, len(segment), chunk_size):
+            pieces.append((start + offset, segment[offset : offset + chunk_size]))
+
+    chunks = []
+    current: list[tuple[int, str]] = []
+    length = 0
+    for piece in pieces:
+        if current and length + len(piece[1]) > chunk_size:
+            chunks.append(current)
+            # Carry over trailing segments, but never the whole chunk
+            overlap: list[tuple[int, str]] = []
+            overlap_length = 0
+            for previous in reversed(current[1:]):
+                if overlap_length + len(previous[1]) > chunk_overlap:
+                    break
+                overlap.insert(0, previous)
+                overlap_length += len(previous[1])
+            if overlap_length + len(piece[1]) > chunk_size:
+                overlap, overlap_length = [], 0
+            current, length = overlap, overlap_length
+        current.append(piece)
+        length += len(piece[1])
+    if current:
+        chunks.append(current)
+
+    packed = []
+    for chunk in chunks:
+        text = "".join(segment for _, segment in chunk)
+        stripped = text.lstrip()
+        if stripped.strip():
+            packed.append((chunk[0][0] + len(text) - len(stripped), stripped.rstrip()))
+    return packed
+
+
 def chunk_langchain_pages(
     pages: list[Document],
     chunk_size: int = 1000,
     chunk_overlap: int = 500,
     add_start_index: bool = True,
+    strategy: str = "recursive",
 ) -> list[Document]:
     """
     Splits a list of langchain Document objects into smaller chunks.
@@ -61,41 +207,256 @@ def chunk_langchain_pages(
         chunk_size (int): Maximum size of each chunk
         chunk_overlap (int): Number of characters to overlap between chunks
         add_start_index (bool): Whether to add start index to metadata
+        strategy (str): "recursive" for langchain's RecursiveCharacterTextSplitter,
+            "sentence" to pack whole sentences and paragraphs in a single pass, or
+            "page" to use every page as one chunk (chunk_size is then ignored)
 
     Returns:
         list[Document]: List of chunked Document objects
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-        add_start_index=add_start_index,
-    )
-    chunks = splitter.split_documents(pages)
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+
+    if strategy == "recursive":
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            add_start_index=add_start_index,
+        )
+        return splitter.split_documents(pages)
+
+    chunks = []
+    for page in pages:
+        if strategy == "page":
+            pieces = [(0, page.page_content)] if page.page_content.strip() else []
+        else:
+            pieces = _pack_segments(
+                _split_sentences(page.page_content), chunk_size, chunk_overlap
+            )
+        for start, text in pieces:
+            metadata = dict(page.metadata)
+            if add_start_index:
+                metadata["start_index"] = start
+            chunks.append(Document(page_content=text, metadata=metadata))
     return chunks
 
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def elbow_cutoff(scores: list[float], min_depth: float = 0.1) -> int:
+    """
+    Number of leading results to keep from scores sorted best first.
+
+    Finds the knee of the descending score curve: the point furthest below the
+    straight line from the best to the worst score, once both axes are scaled to
+    [0, 1]. Everything from the knee on is cut. If no point lies at least min_depth
+    below the line (the scores fall evenly, or not at all), nothing is cut.
+    """
+    n = len(scores)
+    if n < 3 or scores[0] - scores[-1] <= 1e-9:
+        return n
+
+    best, best_depth = n, min_depth
+    for i, score in enumerate(scores):
+        x = i / (n - 1)
+        y = (score - scores[-1]) / (scores[0] - scores[-1])
+        depth = (1 - x) - y
+        if depth > best_depth:
+            best, best_depth = i, depth
+    return best
+
+
+def select_context(
+    results: list[tuple[Document, float | None]],
+    min_relevance: float | None = MIN_RELEVANCE_SCORE,
+    token_budget: int | None = CONTEXT_TOKEN_BUDGET,
+    adaptive_k: bool = ADAPTIVE_K,
+    min_k: int = RETRIEVAL_MIN_K,
+) -> tuple[list[tuple[Document, float | None]], int]:
+    """
+    Choose which retrieved chunks go into the prompt.
+
+    Results (best first) below min_relevance are dropped, and with adaptive_k the
+    list is cut at the elbow of the score curve, but never below min_k results.
+    The survivors are then packed greedily, best first, into token_budget; a chunk
+    that does not fit is skipped in favour of smaller ones further down. Results
+    without scores (MMR) are only packed.
+
+    Returns:
+        The chosen results in rank order, and their estimated token count.
+    """
+    scored = all(score is not None for _, score in results)
+    if scored and results:
+        keep = len(results)
+        if min_relevance is not None:
+            keep = sum(score >= min_relevance for _, score in results)
+        if adaptive_k:
+            keep = min(keep, elbow_cutoff([score for _, score in results]))
+        results = results[: max(keep, min(min_k, len(results)))]
+
+    chosen, tokens = [], 0
+    for doc, score in results:
+        cost = estimate_tokens(doc.page_content) + 8  # "[Page n]" header and separator
+        if token_budget is not None and tokens + cost > token_budget:
+            continue
+        chosen.append((doc, score))
+        tokens += cost
+    return chosen, tokens
+
+
+def format_chunks(chunks: list[Document]) -> str:
+    """Chunks as prompt context, each headed by its (1-indexed) page number."""
+    return "\n\n---\n\n".join(
+        f"[Page {chunk.metadata.get('page', 'N/A') + 1}]\n{chunk.page_content}"
+        for chunk in chunks
+    )
+
+
+def task_options(task: str) -> dict:
+    """
+    Chat completion arguments for a task (see TASK_PROFILES): the model and its
+    temperature, and max_tokens and stop unless they are None.
+    """
+    if task not in TASK_PROFILES:
+        raise ValueError(f"Unknown task: {task}")
+    return {
+        key: value for key, value in TASK_PROFILES[task].items() if value is not None
+    }
+
+
+def create_embeddings(backend: str = EMBEDDING_BACKEND):
+    """
+    The embedding model of a backend (see EMBEDDING_BACKEND).
+
+    The local model is loaded once per process and shared by every book.
+    """
+    if backend == "remote":
+        model = EMBEDDING_MODEL_ID
+        if HF_INFERENCE_BASE_URL:
+            model = f"{HF_INFERENCE_BASE_URL.rstrip('/')}/models/{EMBEDDING_MODEL_ID}"
+        return HuggingFaceEndpointEmbeddings(
+            model=model,
+            huggingfacehub_api_token=HF_API_TOKEN,
+        )
+    if backend == "local":
+        return shared_local_embeddings()
+    if backend == "hashing":
+        return HashingEmbeddings()
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
 class EmbeddedPDF:
     """Manages PDF processing, vector database, and character analysis."""
 
+    RETRIEVAL_MODES = ("similarity", "mmr", "hierarchical")
+    INDEX_BACKENDS = ("chroma", "flat")
+
     def __init__(
         self,
         num_return_chunks=50,
         chunk_size=1000,
+        chunk_overlap=500,
+        chunking_strategy=CHUNKING_STRATEGY,
+        retrieval_mode=RETRIEVAL_MODE,
+        book_id: str | None = None,
+        index_backend=INDEX_BACKEND,
+        index_dtype=FLAT_INDEX_DTYPE,
+        min_relevance: float | None = MIN_RELEVANCE_SCORE,
+        context_token_budget: int | None = CONTEXT_TOKEN_BUDGET,
+        adaptive_k: bool = ADAPTIVE_K,
+        embedding_backend: str = EMBEDDING_BACKEND,
+        strip_boilerplate: bool = STRIP_BOILERPLATE,
+        deduplicate_chunks: bool = DEDUPLICATE_CHUNKS,
+        top_chapters: int = CHAPTER_TOP_K,
+        analysis_probes: bool = ANALYSIS_PROBES,
     ):
-        self.db: Chroma | None = None
+        if retrieval_mode not in self.RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        if chunking_strategy not in CHUNKING_STRATEGIES:
+            raise ValueError(f"Unknown chunking strategy: {chunking_strategy}")
+        if index_backend not in self.INDEX_BACKENDS:
+            raise ValueError(f"Unknown index backend: {index_backend}")
+        if embedding_backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {embedding_backend}")
+
+        self.db: Chroma | FlatVectorIndex | None = None
         self.embedding_function = None
         self._total_pages = 0
         self._current_page = 0
 
         self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunking_strategy = chunking_strategy
+        # Cleaning before embedding (see embed_pdf)
+        self.strip_boilerplate = strip_boilerplate
+        self.deduplicate_chunks = deduplicate_chunks
+        self.cleaning_report: dict | None = None
         self.num_return_chunks = num_return_chunks
+        self.retrieval_mode = retrieval_mode
+        # Chapters of the book, and how many of them a "hierarchical" search visits
+        self.chapters: list[dict] = []
+        self.top_chapters = top_chapters
+        self._routing_vectors: np.ndarray | None = None
+        # Character analyses retrieve first and recent mentions from the chunk
+        # postings of every name (see character_context)
+        self.analysis_probes = analysis_probes
+        self._postings: CharacterPostings | None = None
+        # Set when the book lives in a shared multi-book store; retrieval is then
+        # restricted to this book's chunks
+        self.book_id = book_id
+        # "chroma" for the Chroma vector store, "flat" for the in-process NumPy index
+        self.index_backend = index_backend
+        self.index_dtype = index_dtype
+        # Which of the num_return_chunks retrieved chunks make it into the prompt
+        # (see select_context)
+        self.min_relevance = min_relevance
+        self.context_token_budget = context_token_budget
+        self.adaptive_k = adaptive_k
+        self._selection_lock = threading.Lock()
+        self._selection = {
+            "searches": 0,
+            "candidates": 0,
+            "chosen": 0,
+            "tokens": 0,
+            "routed": 0,
+            "chapters": 0,
+            "scored": 0,
+            "skipped": 0,
+        }
 
-        self.client = InferenceClient(api_key=HF_API_TOKEN)
-        self.embedding_function = HuggingFaceEndpointEmbeddings(
-            model=EMBEDDING_MODEL_ID,
-            huggingfacehub_api_token=HF_API_TOKEN,
+        self.client = InferenceClient(
+            base_url=HF_INFERENCE_BASE_URL, api_key=HF_API_TOKEN, timeout=LLM_TIMEOUT_S
+        )
+        # An index must be queried with the backend it was built with
+        self.embedding_backend = embedding_backend
+        embeddings = create_embeddings(embedding_backend)
+        if embedding_rate_limiter is not None:
+            embeddings = RateLimitedEmbeddings(embeddings, embedding_rate_limiter)
+        self.embedding_function = CachedQueryEmbeddings(
+            embeddings, query_embedding_caches[embedding_backend]
+        )
+
+        # Identical concurrent searches and LLM calls share one underlying call
+        self.search_flight = SingleFlight("semantic_search")
+        self.llm_flight = SingleFlight("llm", private_errors=(CallCancelledError,))
+        # Finished searches, keyed like search_flight; cleared when the index changes
+        self.retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE, "retrieval")
+        # Full-book rankings by normalised query, shared by all page bounds (see
+        # _ranked_hits); cleared with the retrieval cache when the index changes
+        self.ranked_cache = LRUCache(RANKED_CACHE_SIZE, "ranked")
+        self.ranked_depth = RANKED_CACHE_DEPTH
+        self._ranked_fallbacks = 0
+        # Chat answers about this book, for similar questions (see main.answer_message)
+        self.answer_cache = SemanticAnswerCache(
+            ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_PAGE_GAP
         )
+        # Likely character names per page (0-indexed), found at ingestion
+        self.page_names: list[list[str]] = []
+        self._memory_estimate: tuple | None = None
 
     def set_current_page(self, page: int):
         self._current_page = page
@@ -103,40 +464,326 @@ class EmbeddedPDF:
     def set_total_pages(self, total_pages: int):
         self._total_pages = total_pages
 
-    def embed_pdf(self, pages: list[Document]) -> dict:
-        """Embed a list of langchain Document objects into a vector database."""
+    def set_page_texts(self, texts: list[str]):
+        """Extract the likely character names of every page."""
+        self.page_names = [extract_names(text) for text in texts]
+
+    def set_page_names(self, page_names: list[list[str]]):
+        """Use character names extracted earlier (see set_page_texts)."""
+        self.page_names = page_names
+
+    def set_chapters(self, chapters: list[dict]):
+        """Use chapters found earlier (see detect_chapters)."""
+        self.chapters = chapters
+        self._routing_vectors = None
+        self.retrieval_cache.clear()
+
+    def index_settings(self) -> dict:
+        """
+        Everything an index depends on besides the book.
+
+        An index built with other settings would be searched with the wrong
+        embeddings, or hold chunks unlike those of books ingested here.
+        """
+        return {
+            "embedding_backend": self.embedding_backend,
+            "embedding_model": embedding_model_name(self.embedding_backend),
+            "chunking_strategy": self.chunking_strategy,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "strip_boilerplate": self.strip_boilerplate,
+            "deduplicate_chunks": self.deduplicate_chunks,
+        }
+
+    def recent_names(self, current_page: int, lookback: int) -> list[str]:
+        """Names on the lookback pages up to current_page, most prominent first."""
+        return rank_recent_names(self.page_names, current_page, lookback)
+
+    def names_before(self, current_page: int) -> set[str]:
+        """Every name found on the pages up to current_page."""
+        return {name for names in self.page_names[:current_page] for name in names}
+
+    def embed_pdf(
+        self,
+        pages: list[Document],
+        persist_directory: str | None = None,
+        memory: StageMemory | None = None,
+    ) -> dict:
+        """
+        Embed a list of langchain Document objects into a vector database.
+
+        Args:
+            pages (list[Document]): The pages of the book
+            persist_directory (str | None): If given, the index is written to this
+                directory so that it can be reopened with load_index.
+            memory (StageMemory | None): Records memory use after each stage
+
+        Running headers and footers are stripped from the pages before chunking,
+        and chunks with identical text are embedded once. The result's "cleaning"
+        entry reports what that saved.
+        """
         try:
             # Chunk the content of the pdf
-            chunks = chunk_langchain_pages(pages)
+            cleaned, chunks, self.cleaning_report = self._clean_and_chunk(pages)
+            if self.book_id is not None:
+                for chunk in chunks:
+                    chunk.metadata["book_id"] = self.book_id
+            if memory is not None:
+                memory.mark("chunk")
 
             # Embed the chunks to create the vector database
-            self.db = Chroma.from_documents(chunks, self.embedding_function)
+            if self.index_backend == "flat":
+                self.db = FlatVectorIndex.from_documents(
+                    chunks, self.embedding_function, dtype=self.index_dtype
+                )
+                if persist_directory is not None:
+                    self.db.save(persist_directory)
+                    # Serve from the saved file; the in-memory matrix can go
+                    self.db = FlatVectorIndex.load(
+                        persist_directory, self.embedding_function
+                    )
+            elif persist_directory is None:
+                self.db = Chroma.from_documents(chunks, self.embedding_function)
+            else:
+                self.db = Chroma.from_documents(
+                    chunks, self.embedding_function, persist_directory=persist_directory
+                )
+            del chunks
+            self._memory_estimate = None
+            self._postings = None
+            if isinstance(self.db, FlatVectorIndex):
+                self._character_postings()
+            if memory is not None:
+                memory.mark("embed")
             self.set_total_pages(len(pages))
+            self.set_page_texts([page.page_content for page in cleaned])
+            self.set_chapters(detect_chapters([page.page_content for page in pages]))
+            self.retrieval_cache.clear()
+            self.ranked_cache.clear()
+            self.answer_cache.clear()
 
             return {
                 "success": True,
                 "pages": len(pages),
                 "message": "PDF processed successfully",
+                "cleaning": self.cleaning_report,
             }
 
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _clean_and_chunk(self, pages: list[Document]):
+        """
+        Strip page boilerplate, chunk, and drop duplicate chunks.
+
+        Returns:
+            tuple: The cleaned pages, the chunks to embed, and a report of the
+                chunks, embedding requests and characters saved by cleaning.
+        """
+
+        def chunk(pages: list[Document]) -> list[Document]:
+            return chunk_langchain_pages(
+                pages,
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                strategy=self.chunking_strategy,
+            )
+
+        report = {"boilerplate_lines": 0, "boilerplate_chars": 0}
+        cleaned = pages
+        if self.strip_boilerplate:
+            cleaned, stripped = strip_page_boilerplate(pages)
+            report.update(stripped)
+        chunks = chunk(cleaned)
+        # The raw pages are chunked again only to report the savings; chunking is
+        # cheap next to embedding
+        uncleaned = chunk(pages) if report["boilerplate_lines"] else chunks
+        report["duplicate_chunks"] = 0
+        if self.deduplicate_chunks:
+            chunks, report["duplicate_chunks"] = drop_duplicate_chunks(chunks)
+
+        batch = INGEST_EMBED_BATCH_SIZE
+        report.update(
+            chunks=len(chunks),
+            chunks_saved=len(uncleaned) - len(chunks),
+            embedding_requests_saved=math.ceil(len(uncleaned) / batch)
+            - math.ceil(len(chunks) / batch),
+            embedded_chars_saved=sum(len(doc.page_content) for doc in uncleaned)
+            - sum(len(doc.page_content) for doc in chunks),
+        )
+        logger.info(f"Cleaning {self.book_id or 'book'}: {report}")
+        return cleaned, chunks, report
+
+    def attach(self, db: Chroma | FlatVectorIndex, total_pages: int = 0):
+        """Use an existing database instead of creating one."""
+        self.db = db
+        self.set_total_pages(total_pages)
+        self._routing_vectors = None
+        self._postings = None
+        self.retrieval_cache.clear()
+        self.ranked_cache.clear()
+        self.answer_cache.clear()
+
+    def load_index(self, persist_directory: str, total_pages: int):
+        """Reopen an index previously written by embed_pdf, without re-embedding."""
+        if self.index_backend == "flat":
+            self.db = FlatVectorIndex.load(persist_directory, self.embedding_function)
+        else:
+            self.db = Chroma(
+                persist_directory=persist_directory,
+                embedding_function=self.embedding_function,
+            )
+        self.set_total_pages(total_pages)
+        self._routing_vectors = None
+        self._postings = None
+        self.retrieval_cache.clear()
+        self.ranked_cache.clear()
+        self.answer_cache.clear()
+
     def semantic_search(
-        self, character_name: str, k: int = 50, full_book: bool = False
+        self,
+        character_name: str,
+        k: int = 50,
+        full_book: bool = False,
+        current_page: int | None = None,
     ) -> str:
-        """Search for character-related context in the database."""
+        """
+        Search for character-related context in the database.
+
+        Identical searches (same normalised query, k and page bound) that arrive
+        while one is already running are coalesced into a single search, and
+        finished searches are kept in an LRU cache.
+
+        Args:
+            character_name (str): The query to search for
+            k (int): Number of chunks to retrieve
+            full_book (bool): Whether to search the whole book regardless of the current page
+            current_page (int | None): Page bound for this search. Defaults to the page
+                set with set_current_page.
+        """
 
         if self.db is None:
             raise ValueError("No PDF has been processed yet")
 
+        page_limit = self._page_limit(full_book, current_page)
+        key = (normalize_query(character_name), k, page_limit)
+
+        retrieval = self.retrieval_cache.get(key)
+        if retrieval is None:
+            retrieval = self.search_flight.do(
+                key, self._semantic_search, character_name, k, page_limit
+            )
+            self.retrieval_cache.put(key, retrieval)
+        return retrieval
+
+    def semantic_search_many(
+        self,
+        queries: list[str],
+        k: int = 50,
+        full_book: bool = False,
+        current_page: int | None = None,
+    ) -> dict[str, str]:
+        """
+        semantic_search for several queries with the same page bound.
+
+        Queries that are not cached are embedded together in one request and then
+        searched by vector.
+
+        Returns:
+            dict[str, str]: The retrieval for every query
+        """
+        if self.db is None:
+            raise ValueError("No PDF has been processed yet")
+
+        page_limit = self._page_limit(full_book, current_page)
+        keys = {query: (normalize_query(query), k, page_limit) for query in queries}
+
+        results = {}
+        for query in queries:
+            retrieval = self.retrieval_cache.get(keys[query])
+            if retrieval is not None:
+                results[query] = retrieval
+
+        missing = [query for query in dict.fromkeys(queries) if query not in results]
+        if missing:
+            for query, vector in zip(missing, self._embed_queries(missing)):
+                retrieval = self.search_flight.do(
+                    keys[query], self._semantic_search, query, k, page_limit, vector
+                )
+                self.retrieval_cache.put(keys[query], retrieval)
+                results[query] = retrieval
+
+        return {query: results[query] for query in queries}
+
+    def _embed_queries(self, queries: list[str]) -> list[list[float]]:
+        embed_queries = getattr(self.embedding_function, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(queries)
+        return [self.embedding_function.embed_query(query) for query in queries]
+
+    def is_search_cached(
+        self,
+        character_name: str,
+        k: int = 50,
+        full_book: bool = False,
+        current_page: int | None = None,
+    ) -> bool:
+        """Whether semantic_search with these arguments would be a cache hit."""
+        page_limit = self._page_limit(full_book, current_page)
+        return (normalize_query(character_name), k, page_limit) in self.retrieval_cache
+
+    def _page_limit(self, full_book: bool, current_page: int | None) -> int:
         if full_book:
-            page_limit = self._total_pages
-        else:
-            page_limit = self._current_page
+            return self._total_pages
+        if current_page is not None:
+            return current_page
+        return self._current_page
+
+    def _search_filter(self, page_limit: int) -> dict:
+        """Metadata filter restricting a search to this book, below the page bound."""
+        page_filter = {"page": {"$lt": page_limit}}
+        if self.book_id is None:
+            return page_filter
+        return {"$and": [{"book_id": {"$eq": self.book_id}}, page_filter]}
 
-        # Search entire book
-        results = self.db.similarity_search_with_relevance_scores(character_name, k=k)
+    def _semantic_search(
+        self,
+        character_name: str,
+        k: int,
+        page_limit: int,
+        query_vector: list[float] | None = None,
+    ) -> str:
+        # Search this book up to the page bound, by the precomputed query embedding
+        # if there is one
+        search_filter = self._search_filter(page_limit)
+        if self.retrieval_mode == "mmr":
+            # Maximal marginal relevance trades some similarity for diversity
+            if query_vector is None:
+                pages = self.db.max_marginal_relevance_search(
+                    character_name, k=k, fetch_k=4 * k, filter=search_filter
+                )
+            else:
+                pages = self.db.max_marginal_relevance_search_by_vector(
+                    query_vector, k=k, fetch_k=4 * k, filter=search_filter
+                )
+            results = [(page, None) for page in pages]
+        elif self.retrieval_mode == "hierarchical" and self._can_route():
+            results = self._hierarchical_search(
+                character_name, k, page_limit, query_vector
+            )
+        elif isinstance(self.db, FlatVectorIndex):
+            hits = self._ranked_hits(character_name, k, page_limit, query_vector)
+            results = [(self.db.documents[i], score) for i, score in hits]
+        elif query_vector is None or isinstance(self.db, Chroma):
+            # Searched by vector, Chroma scores by distance rather than relevance,
+            # so it is searched by the query, whose embedding is cached
+            results = self.db.similarity_search_with_relevance_scores(
+                character_name, k=k, filter=search_filter
+            )
+        else:
+            results = self.db.similarity_search_by_vector_with_relevance_scores(
+                query_vector, k=k, filter=search_filter
+            )
 
         # Filter results to only include pages within the page_limit
         filtered_results = [
@@ -144,22 +791,378 @@ class EmbeddedPDF:
             for page, score in results
             if page.metadata.get("page", 0) < page_limit
         ]
-        retrieval = "\n\n---\n\n".join(
+        chosen, tokens = select_context(
+            filtered_results,
+            min_relevance=self.min_relevance,
+            token_budget=self.context_token_budget,
+            adaptive_k=self.adaptive_k,
+        )
+        self._record_selection(character_name, len(filtered_results), chosen, tokens)
+
+        return format_chunks([page for page, _ in chosen])
+
+    def _ranked_hits(
+        self,
+        query: str,
+        k: int,
+        page_limit: int,
+        query_vector: list[float] | None = None,
+    ) -> list[tuple[int, float]]:
+        """
+        Top-k (position, score) pairs below the page bound, from the query's cached
+        full-book ranking.
+
+        Readers at different pages asking the same question share one ranking. If
+        fewer than k of its ranked_depth chunks lie below the bound, and the ranking
+        does not cover the whole book, a page-bounded search is run instead.
+        """
+
+        def vector():
+            embedding = query_vector
+            if embedding is None:
+                embedding = self.embedding_function.embed_query(query)
+            return self.db.normalise(embedding)
+
+        key = normalize_query(query)
+        ranking = self.ranked_cache.get(key)
+        if ranking is None:
+            ranking = self.db.ranking(vector(), self.ranked_depth, self.book_id)
+            self.ranked_cache.put(key, ranking)
+
+        positions, scores = ranking
+        below = positions < self.db.row_range(0, page_limit)[1]
+        if below.sum() >= k or self.ranked_depth >= len(self.db):
+            return list(zip(positions[below][:k].tolist(), scores[below][:k].tolist()))
+
+        with self._selection_lock:
+            self._ranked_fallbacks += 1
+        return self.db.search_by_vector(vector(), k, page_limit, self.book_id)
+
+    def _can_route(self) -> bool:
+        """Chapter routing needs chapters and the flat index; otherwise search flat."""
+        return isinstance(self.db, FlatVectorIndex) and len(self.chapters) > 1
+
+    def _routing(self) -> np.ndarray:
+        """
+        One vector per chapter to route queries by: the centroid of its chunks,
+        averaged with the embedding of its summary if it has one.
+        """
+        vectors = self._routing_vectors
+        if vectors is None:
+            vectors = self.db.centroids(
+                [
+                    self.db.row_range(chapter["first_page"], chapter["end_page"])
+                    for chapter in self.chapters
+                ]
+            )
+            for i, chapter in enumerate(self.chapters):
+                if chapter.get("summary_embedding") is not None:
+                    vectors[i] = self.db.normalise(
+                        vectors[i] + self.db.normalise(chapter["summary_embedding"])
+                    )
+            self._routing_vectors = vectors
+        return vectors
+
+    def _hierarchical_search(
+        self,
+        query: str,
+        k: int,
+        page_limit: int,
+        query_vector: list[float] | None = None,
+    ) -> list[tuple[Document, float]]:
+        """
+        Two-stage search: choose chapters by their routing vectors, then search the
+        chunks of those chapters only, below the page bound.
+        """
+        if query_vector is None:
+            query_vector = self.embedding_function.embed_query(query)
+        vector = self.db.normalise(query_vector)
+
+        chosen = route_chapters(
+            self.chapters, self._routing(), vector, page_limit, self.top_chapters
+        )
+        row_ranges = [
+            self.db.row_range(
+                self.chapters[i]["first_page"],
+                min(self.chapters[i]["end_page"], page_limit),
+            )
+            for i in chosen
+        ]
+        hits = self.db.search_by_vector_in_rows(vector, k, row_ranges)
+
+        scored = sum(stop - start for start, stop in row_ranges)
+        below_bound = self.db.row_range(0, page_limit)[1]
+        with self._selection_lock:
+            self._selection["routed"] += 1
+            self._selection["chapters"] += len(chosen)
+            self._selection["scored"] += scored
+            self._selection["skipped"] += below_bound - scored
+        return [(self.db.documents[i], score) for i, score in hits]
+
+    def summarize_chapters(self, max_chars: int = CHAPTER_SUMMARY_CHARS):
+        """
+        Write an LLM summary of every chapter, and embed the summaries for routing.
+
+        Each summary is written from up to max_chars characters of the chapter's
+        chunks. Only takes effect with the flat index.
+        """
+        if not self._can_route():
+            return
+
+        PROMPT_TEMPLATE = """
+        You are a helpful book assistant. Summarise the following chapter of a novel in at most five sentences, naming the characters involved and what happens to them.
+
+        Chapter: {chapter}
+        """
+
+        prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+        summaries = []
+        for chapter in self.chapters:
+            start, stop = self.db.row_range(chapter["first_page"], chapter["end_page"])
+            text = "\n".join(doc.page_content for doc in self.db.documents[start:stop])
+            if not text.strip():
+                summaries.append("")
+                continue
+            prompt = prompt_template.format(chapter=text[:max_chars])
+            summaries.append(self._complete(prompt, task="chapter_summary"))
+
+        embeddings = self.embedding_function.embed_documents(
+            [summary for summary in summaries if summary]
+        )
+        embeddings = iter(embeddings)
+        self.set_chapters(
             [
-                f"[Page {page.metadata.get('page', 'N/A') + 1}]\n{page.page_content}"
-                for page, _ in filtered_results
+                {
+                    **chapter,
+                    "summary": summary,
+                    "summary_embedding": next(embeddings) if summary else None,
+                }
+                for chapter, summary in zip(self.chapters, summaries)
             ]
         )
 
-        return retrieval
+    def _record_selection(self, query: str, candidates: int, chosen, tokens: int):
+        logger.info(
+            f"Retrieval for {query!r}: {len(chosen)} of {candidates} chunks, "
+            f"~{tokens} tokens"
+        )
+        with self._selection_lock:
+            self._selection["searches"] += 1
+            self._selection["candidates"] += candidates
+            self._selection["chosen"] += len(chosen)
+            self._selection["tokens"] += tokens
+
+    def selection_stats(self) -> dict:
+        """
+        Mean number of candidate and chosen chunks and context tokens per search,
+        and of chapters visited and chunks scored or skipped per hierarchical search.
+        """
+        with self._selection_lock:
+            stats = dict(self._selection)
+        searches = stats["searches"] or 1
+        routed = stats["routed"] or 1
+        return {
+            "searches": stats["searches"],
+            "mean_candidates": stats["candidates"] / searches,
+            "mean_k": stats["chosen"] / searches,
+            "mean_tokens": stats["tokens"] / searches,
+            "routed_searches": stats["routed"],
+            "mean_chapters": stats["chapters"] / routed,
+            "mean_scored_chunks": stats["scored"] / routed,
+            "mean_skipped_chunks": stats["skipped"] / routed,
+        }
+
+    def _complete(
+        self,
+        prompt: str,
+        cancel: threading.Event | None = None,
+        task: str = "character_analysis",
+    ) -> str:
+        """
+        Send a single-prompt chat completion with the task's generation profile.
+
+        Identical in-flight prompts are coalesced, and the call goes through the shared
+        resilience policy (deadline, retries, circuit breaker). Setting cancel
+        abandons the call (see ResilientCaller.call).
+        """
+        options = task_options(task)
+        response = self.llm_flight.do(
+            (task, prompt),
+            inference_caller.call,
+            self.client.chat.completions.create,
+            cancel=cancel,
+            messages=[{"role": "user", "content": prompt}],
+            **options,
+        )
+
+        return response.choices[0].message.content or ""
+
+    def coalescing_stats(self) -> dict:
+        """Counters for coalesced searches and LLM calls."""
+        return {
+            "semantic_search": self.search_flight.stats(),
+            "llm": self.llm_flight.stats(),
+        }
+
+    def memory_estimate(self) -> dict:
+        """Approximate bytes held by this book's index (see index_memory)."""
+        collection = getattr(self.db, "_collection", None)
+        if collection is None:
+            # Measuring a flat index walks its documents, so it is done once per
+            # index (embed_pdf resets it when it adds documents)
+            db = self.db
+            if self._memory_estimate is None or self._memory_estimate[0] is not db:
+                self._memory_estimate = (db, index_memory(db))
+            return self._memory_estimate[1]
+
+        # A Chroma collection, possibly shared with other books
+        where = {"book_id": self.book_id} if self.book_id is not None else None
+        count = len(collection.get(where=where, include=[])["ids"])
+        sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        dim = len(sample[0]) if sample is not None and len(sample) else None
+        return index_memory(self.db, count=count, dim=dim)
+
+    def cache_stats(self) -> dict:
+        """
+        Hit and miss counters of the retrieval, full-book ranking, chat answer and
+        query-embedding caches, and how often a ranking had too few chunks below the
+        page bound.
+        """
+        with self._selection_lock:
+            fallbacks = self._ranked_fallbacks
+        return {
+            "retrieval": self.retrieval_cache.stats(),
+            "ranked": {**self.ranked_cache.stats(), "fallbacks": fallbacks},
+            "answers": self.answer_cache.stats(),
+            "query_embeddings": query_embedding_caches[self.embedding_backend].stats(),
+        }
 
     def generate_character_analysis(
-        self, character_name: str, full_book: bool = False
+        self,
+        character_name: str,
+        full_book: bool = False,
+        current_page: int | None = None,
     ) -> str:
         """Generate character analysis using the LLM."""
-        context = self.semantic_search(
-            character_name, k=self.num_return_chunks, full_book=full_book
+        context = self.character_context(
+            character_name, full_book=full_book, current_page=current_page
+        )
+        return self.character_analysis_from_context(character_name, context)
+
+    def character_context(
+        self,
+        character_name: str,
+        full_book: bool = False,
+        current_page: int | None = None,
+    ) -> str:
+        """
+        Retrieve the context for a character analysis.
+
+        With the flat index this is three small probes below the page bound: the
+        first chunks naming the character, the latest ones, and a few similarity
+        hits for the summary (see _probe_context). Otherwise it is a semantic_search
+        for num_return_chunks chunks. Cached and coalesced like semantic_search.
+        """
+        return self.character_contexts([character_name], full_book, current_page)[
+            character_name
+        ]
+
+    def character_contexts(
+        self,
+        character_names: list[str],
+        full_book: bool = False,
+        current_page: int | None = None,
+    ) -> dict[str, str]:
+        """character_context for several characters, embedded in one request."""
+        if self.db is None:
+            raise ValueError("No PDF has been processed yet")
+        if not self._can_probe():
+            return self.semantic_search_many(
+                character_names,
+                k=self.num_return_chunks,
+                full_book=full_book,
+                current_page=current_page,
+            )
+
+        page_limit = self._page_limit(full_book, current_page)
+        keys = {
+            name: ("probes", normalize_query(name), page_limit)
+            for name in character_names
+        }
+        results = {}
+        for name in character_names:
+            context = self.retrieval_cache.get(keys[name])
+            if context is not None:
+                results[name] = context
+
+        missing = [
+            name for name in dict.fromkeys(character_names) if name not in results
+        ]
+        if missing:
+            for name, vector in zip(missing, self._embed_queries(missing)):
+                context = self.search_flight.do(
+                    keys[name], self._probe_context, name, page_limit, vector
+                )
+                self.retrieval_cache.put(keys[name], context)
+                results[name] = context
+
+        return {name: results[name] for name in character_names}
+
+    def _can_probe(self) -> bool:
+        """The postings hold positions in the flat index's page-ordered chunks."""
+        return self.analysis_probes and isinstance(self.db, FlatVectorIndex)
+
+    def _character_postings(self) -> CharacterPostings:
+        postings = self._postings
+        if postings is None:
+            postings = self._postings = CharacterPostings(self.db.documents)
+        return postings
+
+    def _probe_context(
+        self, character_name: str, page_limit: int, query_vector: list[float]
+    ) -> str:
+        """
+        The earliest and latest chunks naming a character below the page bound,
+        found by bisecting its postings, and the most similar other chunks.
+        """
+        stop = self.db.row_range(0, page_limit)[1]
+        earliest, latest = self._character_postings().mentions(
+            character_name, stop, ANALYSIS_FIRST_CHUNKS, ANALYSIS_RECENT_CHUNKS
+        )
+        mentioned = set(earliest) | set(latest)
+        hits = self._ranked_hits(
+            character_name,
+            ANALYSIS_RELEVANT_CHUNKS + len(mentioned),
+            page_limit,
+            query_vector,
         )
+        relevant = [i for i, _ in hits if i not in mentioned]
+        relevant = sorted(relevant[:ANALYSIS_RELEVANT_CHUNKS])
+
+        sections = []
+        for title, positions in (
+            ("First mentions", earliest),
+            ("Most recent mentions", latest),
+            ("Other relevant excerpts", relevant),
+        ):
+            if positions:
+                chunks = format_chunks([self.db.documents[i] for i in positions])
+                sections.append(f"{title}:\n\n{chunks}")
+        context = "\n\n---\n\n".join(sections)
+
+        chosen = earliest + latest + relevant
+        self._record_selection(
+            character_name, len(mentioned) + len(hits), chosen, estimate_tokens(context)
+        )
+        return context
+
+    def character_analysis_from_context(
+        self,
+        character_name: str,
+        context: str,
+        cancel: threading.Event | None = None,
+    ) -> str:
+        """Generate character analysis from an already retrieved context."""
 
         PROMPT_TEMPLATE = """
         You are a helpful book assistant. Given the following excerpts from a novel, provide the user information about a specified character as clearly and concisely as possible, using only the provided text.
@@ -183,13 +1186,7 @@ class EmbeddedPDF:
         prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
         prompt = prompt_template.format(context=context, query=character_name)
 
-        response = self.client.chat.completions.create(
-            model=MODEL_ID,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-        )
-
-        return response.choices[0].message.content or ""
+        return self._complete(prompt, cancel=cancel, task="character_analysis")
 
     def has_documents(self) -> bool:
         """Check if the database has any documents."""
@@ -209,13 +1206,7 @@ class EmbeddedPDF:
         prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
         prompt = prompt_template.format(pdf_page=page)
 
-        response = self.client.chat.completions.create(
-            model=MODEL_ID,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-        )
-
-        return response.choices[0].message.content or ""
+        return self._complete(prompt, task="page_characters")
 
     def get_character_first_mention(
         self,
@@ -240,14 +1231,8 @@ class EmbeddedPDF:
         prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
         prompt = prompt_template.format(context=context, query=character_name)
 
-        response = self.client.chat.completions.create(
-            model=MODEL_ID,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-        )
-
         # Extract page number from response
-        text = response.choices[0].message.content or ""
+        text = self._complete(prompt, task="first_mention")
 
         if "PAGE:" in text:
             try:
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import zipfile
+from pathlib import Path
+
+from backend.config import LIBRARY_DIR, PREBUILT_BUNDLE_DIR
+
+BUNDLE_FORMAT = "charmem-book"
+# Raised whenever the layout changes; older versions stay readable
+BUNDLE_VERSION = 1
+BUNDLE_SUFFIX = ".charmem"
+MANIFEST_FILE = "bundle.json"
+
+# Files of a book's library directory that go into a bundle, in the same layout
+REQUIRED_FILES = ("index/index.json", "index/vectors.bin", "pages.json", "names.json")
+OPTIONAL_FILES = ("index/scales.bin", "book.pdf", "chapters.json")
+# Manifest entries an import relies on, and their types
+MANIFEST_FIELDS = {"source": str, "total_pages": int, "settings": dict}
+
+
+class BundleError(ValueError):
+    """A bundle that is malformed or was built for another setup."""
+
+
+def write_bundle(path: str | Path, book_dir: Path, manifest: dict) -> Path:
+    """
+    Pack a book's library directory into one compressed bundle file.
+
+    Args:
+        path (str | Path): The bundle to write
+        book_dir (Path): The book's directory in the library
+        manifest (dict): Book metadata and index settings, stored as bundle.json
+
+    Returns:
+        Path: The written bundle
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr(
+            MANIFEST_FILE,
+            json.dumps(
+                {"format": BUNDLE_FORMAT, "version": BUNDLE_VERSION, **manifest},
+                indent=2,
+            ),
+        )
+        for name in REQUIRED_FILES + OPTIONAL_FILES:
+            if (book_dir / name).exists():
+                bundle.write(book_dir / name, name)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_manifest(path: str | Path) -> dict:
+    """
+    The manifest of a bundle.
+
+    Raises:
+        BundleError: If the file is not a bundle, lacks a file or manifest entry,
+            or was written by a newer version.
+    """
+    try:
+        with zipfile.ZipFile(path) as bundle:
+            manifest = json.loads(bundle.read(MANIFEST_FILE))
+            names = set(bundle.namelist())
+    except (OSError, zipfile.BadZipFile, KeyError, json.JSONDecodeError) as e:
+        raise BundleError(f"Not a book bundle: {path}") from e
+
+    if not isinstance(manifest, dict) or manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"Not a book bundle: {path}")
+    version = manifest.get("version")
+    if not isinstance(version, int) or version > BUNDLE_VERSION:
+        raise BundleError(
+            f"Bundle version {version} is not supported (up to {BUNDLE_VERSION})"
+        )
+    missing = [name for name in REQUIRED_FILES if name not in names]
+    if missing:
+        raise BundleError(f"Bundle is missing {', '.join(missing)}")
+    for key, kind in MANIFEST_FIELDS.items():
+        if not isinstance(manifest.get(key), kind):
+            raise BundleError(f"Bundle manifest has no valid {key}")
+    return manifest
+
+
+def check_settings(manifest: dict, expected: dict):
+    """
+    Refuse a bundle whose index was built with other settings.
+
+    Args:
+        manifest (dict): The bundle's manifest (see read_manifest)
+        expected (dict): EmbeddedPDF.index_settings of the importing side
+
+    Raises:
+        BundleError: Listing every setting that differs.
+    """
+    settings = manifest.get("settings", {})
+    mismatches = [
+        f"{key} is {settings.get(key)!r}, expected {value!r}"
+        for key, value in expected.items()
+        if settings.get(key) != value
+    ]
+    if mismatches:
+        raise BundleError(
+            "Bundle was built with other settings: " + "; ".join(mismatches)
+        )
+
+
+def extract_bundle(path: str | Path, book_dir: Path):
+    """Unpack a bundle's files into a book's library directory."""
+    with zipfile.ZipFile(path) as bundle:
+        names = set(bundle.namelist())
+        # Only known names are extracted, so a bundle cannot write elsewhere
+        for name in REQUIRED_FILES + OPTIONAL_FILES:
+            if name in names:
+                bundle.extract(name, book_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export library books to bundles, or import bundles into a library."
+    )
+    parser.add_argument("--library", default=LIBRARY_DIR, help="Library directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Write books to bundle files")
+    export.add_argument("book_ids", nargs="*", help="Books to export (default: all)")
+    export.add_argument("--output", default=PREBUILT_BUNDLE_DIR, help="Directory")
+
+    import_ = commands.add_parser("import", help="Add bundle files to the library")
+    import_.add_argument("bundles", nargs="+", type=Path)
+
+    inspect = commands.add_parser("inspect", help="Print the manifest of bundles")
+    inspect.add_argument("bundles", nargs="+", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "inspect":
+        for path in args.bundles:
+            print(json.dumps(read_manifest(path), indent=2))
+        return
+
+    # The library pulls in the RAG stack, which the inspect command does not need
+    from backend.library import BookLibrary
+
+    library = BookLibrary(args.library)
+    if args.command == "export":
+        book_ids = args.book_ids or [book["book_id"] for book in library.list_books()]
+        for book_id in book_ids:
+            path = library.export_bundle(
+                book_id, Path(args.output) / f"{book_id}{BUNDLE_SUFFIX}"
+            )
+            print(f"{book_id}: {path} ({path.stat().st_size / 1e6:.1f} MB)")
+    else:
+        for path in args.bundles:
+            result = library.import_bundle(path)
+            status = "already in library" if result["cached"] else "imported"
+            print(f"{result['book_id']}: {status} from {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+import numpy as np
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe bounded mapping that evicts the least recently used entry.
+
+    Keeps hit, miss and eviction counters so that its usefulness can be monitored.
+    """
+
+    def __init__(self, max_size: int, name: str = ""):
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        self.name = name
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (marking it recently used) or default."""
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Membership test that does not count as a hit or miss."""
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+class CachedQueryEmbeddings:
+    """
+    Wraps a LangChain embedding function and caches its query embeddings.
+
+    Document embeddings are passed straight through; they are only computed once,
+    at ingestion.
+
+    embed_queries sends all uncached queries in a single embed_documents request.
+    For symmetric models such as all-MiniLM-L6-v2, a query embeds exactly as a
+    document would.
+    """
+
+    def __init__(self, embeddings, cache: LRUCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(text, vector)
+        return vector
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several queries with at most one request to the model."""
+        vectors = {text: self.cache.get(text) for text in dict.fromkeys(texts)}
+        missing = [text for text, vector in vectors.items() if vector is None]
+        if missing:
+            for text, vector in zip(missing, self.embeddings.embed_documents(missing)):
+                self.cache.put(text, vector)
+                vectors[text] = vector
+        return [vectors[text] for text in texts]
+
+
+# "[Page 12]" headers of retrieved chunks (see format_chunks)
+_PAGE_TAG = re.compile(r"\[Page (\d+)\]")
+
+
+class SemanticAnswerCache:
+    """
+    Chat answers of one book, looked up by the similarity of the question's embedding.
+
+    "Who's Snape?" and "Tell me about Professor Snape" can share an answer. An
+    answer is only reused for a reader who has read every page its context was
+    retrieved from, so it cannot give anything away, and who is at most
+    max_page_gap pages further on, so that it is not missing much of what they have
+    read since. Evicts the least recently used answer.
+    """
+
+    def __init__(self, max_size: int, threshold: float, max_page_gap: int):
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        self.max_size = max_size
+        self.threshold = threshold
+        self.max_page_gap = max_page_gap
+        self._entries: OrderedDict[int, dict] = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Similar questions not answered from the cache because of the reader's page
+        self.spoiler_blocked = 0
+        self.stale = 0
+
+    @staticmethod
+    def _normalise(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, vector, current_page: int) -> str | None:
+        """The answer to the most similar question usable at current_page, if any."""
+        query = self._normalise(vector)
+        with self._lock:
+            best, best_score = None, self.threshold
+            spoiler = stale = False
+            for key, entry in self._entries.items():
+                score = float(entry["vector"] @ query)
+                if score < best_score:
+                    continue
+                if entry["last_page"] > current_page:
+                    spoiler = True
+                elif current_page - entry["current_page"] > self.max_page_gap:
+                    stale = True
+                else:
+                    best, best_score = key, score
+
+            if best is None:
+                self.misses += 1
+                self.spoiler_blocked += spoiler
+                self.stale += stale
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best]["answer"]
+
+    def put(self, vector, answer: str, context: str, current_page: int):
+        """
+        Cache an answer generated at current_page from context, whose chunks are
+        headed by their page numbers.
+        """
+        pages = [int(page) for page in _PAGE_TAG.findall(context)]
+        entry = {
+            "vector": self._normalise(vector),
+            "answer": answer,
+            "last_page": max(pages, default=0),
+            "current_page": current_page,
+        }
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "spoiler_blocked": self.spoiler_blocked,
+                "stale": self.stale,
+            }
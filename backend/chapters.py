@@ -0,0 +1,91 @@
+import re
+
+import numpy as np
+
+from backend.config import CHAPTER_FALLBACK_PAGES, CHAPTER_SCAN_LINES
+
+# "CHAPTER ONE", "Chapter 12", "PART II", possibly framed by dashes
+_HEADING = re.compile(r"^\W*((?:chapter|part|book)\s+[\w-]+)\W*$", re.IGNORECASE)
+
+
+def detect_chapters(
+    texts: list[str],
+    scan_lines: int = CHAPTER_SCAN_LINES,
+    fallback_pages: int = CHAPTER_FALLBACK_PAGES,
+) -> list[dict]:
+    """
+    Split a book into chapters from the headings at the top of pages.
+
+    A page starts a chapter if one of its first scan_lines non-blank lines is a
+    heading such as "— CHAPTER ONE —"; a short line after it is taken as the title.
+    Pages before the first chapter form a section of their own. A book without
+    headings is cut into sections of fallback_pages pages.
+
+    Returns:
+        list[dict]: Chapters in page order, each with a "title" and its
+            "first_page" and "end_page" (0-indexed, end exclusive).
+    """
+    starts = []
+    for page, text in enumerate(texts):
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        lines = lines[:scan_lines]
+        for i, line in enumerate(lines):
+            match = _HEADING.match(line)
+            if match is None:
+                continue
+            title = match.group(1)
+            if i + 1 < len(lines) and len(lines[i + 1]) <= 80:
+                title = f"{title}: {lines[i + 1]}"
+            starts.append((page, title))
+            break
+
+    if not starts:
+        starts = [
+            (page, f"Pages {page + 1}-{min(page + fallback_pages, len(texts))}")
+            for page in range(0, len(texts), fallback_pages)
+        ]
+    elif starts[0][0] > 0:
+        starts.insert(0, (0, "Front matter"))
+
+    ends = [page for page, _ in starts[1:]] + [len(texts)]
+    return [
+        {"title": title, "first_page": page, "end_page": end}
+        for (page, title), end in zip(starts, ends)
+    ]
+
+
+def route_chapters(
+    chapters: list[dict],
+    vectors: np.ndarray,
+    query: np.ndarray,
+    page_limit: int,
+    top_k: int,
+) -> list[int]:
+    """
+    The chapters a page-bounded search should look in, in page order.
+
+    The chapter being read (the one the page bound falls into) is always included,
+    and is not ranked: its centroid would reflect pages not read yet. The other
+    chapters below the bound are ranked by the similarity of their routing vectors
+    to the query, and the best fill the remaining places.
+
+    Args:
+        chapters (list[dict]): See detect_chapters
+        vectors (np.ndarray): One normalised routing vector per chapter
+        query (np.ndarray): The normalised query embedding
+        page_limit (int): Only pages below it may be searched
+        top_k (int): Number of chapters to choose
+    """
+    started = [
+        i for i, chapter in enumerate(chapters) if chapter["first_page"] < page_limit
+    ]
+    if len(started) <= top_k:
+        return started
+
+    chosen = []
+    if chapters[started[-1]]["end_page"] > page_limit:
+        chosen.append(started.pop())
+    candidates = np.array(started)
+    scores = vectors[candidates] @ query
+    best = candidates[np.argsort(-scores, kind="stable")[: top_k - len(chosen)]]
+    return sorted(chosen + best.tolist())
@@ -0,0 +1,128 @@
+import hashlib
+import re
+from collections import Counter
+
+from langchain_core.documents import Document
+
+from backend.config import (
+    BOILERPLATE_MIN_DENSITY,
+    BOILERPLATE_MIN_FRACTION,
+    BOILERPLATE_MIN_PAGES,
+    BOILERPLATE_SCAN_LINES,
+)
+
+_DIGITS = re.compile(r"\d+")
+_SPACE = re.compile(r"\s+")
+
+
+def _line_key(line: str) -> str:
+    """
+    A line with page numbers and spacing ignored.
+
+    Extracted headers come with varying spaces ("32 H ARRY  POTTER"), so all
+    whitespace is dropped.
+    """
+    return _SPACE.sub("", _DIGITS.sub("#", line)).lower()
+
+
+def _edge_lines(lines: list[str], scan_lines: int) -> list[int]:
+    """Indices of the first and last scan_lines non-blank lines of a page."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return sorted(set(filled[:scan_lines] + filled[-scan_lines:]))
+
+
+def find_boilerplate(
+    texts: list[str],
+    scan_lines: int = BOILERPLATE_SCAN_LINES,
+    min_pages: int = BOILERPLATE_MIN_PAGES,
+    min_fraction: float = BOILERPLATE_MIN_FRACTION,
+    min_density: float = BOILERPLATE_MIN_DENSITY,
+) -> set[str]:
+    """
+    Lines that head or foot many pages, such as running titles and page numbers.
+
+    A line counts if, ignoring digits and whitespace, it is among the first or
+    last scan_lines non-blank lines of at least min_pages pages, and of either
+    min_fraction of all pages or min_density of the pages from its first
+    appearance to its last. A fixed count alone would also strip a short line that
+    happens to open a few pages of a long book.
+    """
+    counts = Counter()
+    first_page, last_page = {}, {}
+    for page, text in enumerate(texts):
+        lines = text.splitlines()
+        keys = {_line_key(lines[i]) for i in _edge_lines(lines, scan_lines)}
+        counts.update(keys)
+        for key in keys:
+            first_page.setdefault(key, page)
+            last_page[key] = page
+
+    common = min_fraction * len(texts)
+    return {
+        key
+        for key, count in counts.items()
+        if count >= min_pages
+        and (
+            count >= common
+            or count >= min_density * (last_page[key] - first_page[key] + 1)
+        )
+    }
+
+
+def strip_page_boilerplate(
+    pages: list[Document],
+    scan_lines: int = BOILERPLATE_SCAN_LINES,
+    min_pages: int = BOILERPLATE_MIN_PAGES,
+) -> tuple[list[Document], dict]:
+    """
+    Remove running headers, footers and page numbers from every page.
+
+    The page Documents are not modified; cleaned copies are returned. A page whose
+    only line looks like boilerplate is kept as it is.
+
+    Returns:
+        tuple[list[Document], dict]: The cleaned pages, and the number of distinct
+            boilerplate lines found and of lines and characters removed.
+    """
+    boilerplate = find_boilerplate(
+        [page.page_content for page in pages], scan_lines, min_pages
+    )
+    cleaned = []
+    removed_lines = removed_chars = 0
+    for page in pages:
+        lines = page.page_content.splitlines(keepends=True)
+        edges = _edge_lines(lines, scan_lines)
+        drop = {i for i in edges if _line_key(lines[i]) in boilerplate}
+        if len(drop) == sum(1 for line in lines if line.strip()):
+            drop = set()
+        removed_lines += len(drop)
+        removed_chars += sum(len(lines[i]) for i in drop)
+        text = "".join(line for i, line in enumerate(lines) if i not in drop)
+        cleaned.append(Document(page_content=text, metadata=dict(page.metadata)))
+
+    return cleaned, {
+        "boilerplate_patterns": len(boilerplate),
+        "boilerplate_lines": removed_lines,
+        "boilerplate_chars": removed_chars,
+    }
+
+
+def drop_duplicate_chunks(chunks: list[Document]) -> tuple[list[Document], int]:
+    """
+    Keep only the first of chunks with the same text (up to whitespace).
+
+    Chunks are in page order, so the copy that is kept is the earliest one, and
+    page-bounded searches still find it as soon as possible.
+
+    Returns:
+        tuple[list[Document], int]: The unique chunks, and how many were dropped.
+    """
+    seen = set()
+    unique = []
+    for chunk in chunks:
+        text = _SPACE.sub(" ", chunk.page_content).strip()
+        digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(chunk)
+    return unique, len(chunks) - len(unique)
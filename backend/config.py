@@ -1,3 +1,205 @@
 MODEL_ID = "Qwen/Qwen3-235B-A22B"
 # MODEL_ID = "Qwen/Qwen2.5-VL-72B-Instruct"
+# Small, fast model for short extraction tasks
+FAST_MODEL_ID = "Qwen/Qwen2.5-7B-Instruct"
 EMBEDDING_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Generation settings per task: model, max_tokens and stop sequences (None for no
+# limit) and temperature. Narrative answers use MODEL_ID; extraction tasks, which
+# answer with a name list or "PAGE: n", use FAST_MODEL_ID
+TASK_PROFILES = {
+    "chat": {
+        "model": MODEL_ID,
+        "max_tokens": 1000,
+        "temperature": 0.7,
+        "stop": None,
+    },
+    "character_analysis": {
+        "model": MODEL_ID,
+        "max_tokens": 1000,
+        "temperature": 0.7,
+        "stop": None,
+    },
+    "chapter_summary": {
+        "model": FAST_MODEL_ID,
+        "max_tokens": 300,
+        "temperature": 0.3,
+        "stop": None,
+    },
+    "page_characters": {
+        "model": FAST_MODEL_ID,
+        "max_tokens": 64,
+        "temperature": 0.0,
+        "stop": None,
+    },
+    "first_mention": {
+        "model": FAST_MODEL_ID,
+        "max_tokens": 16,
+        "temperature": 0.0,
+        "stop": ["\n"],
+    },
+}
+
+# Embedding backend: "remote" (Hugging Face inference endpoint), "local" (in-process
+# SentenceTransformer, loaded once and shared by every book) or "hashing"
+# (deterministic feature hashing, for offline tests and benchmarks)
+EMBEDDING_BACKEND = "remote"
+EMBEDDING_DEVICE = "cpu"
+# Local backend: texts per encode batch, and threads encoding the batches of a call
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_THREADS = 2
+HASHING_EMBEDDING_DIM = 384
+
+# Resilience policy for calls to the inference provider
+LLM_TIMEOUT_S = 60.0
+LLM_MAX_RETRIES = 2
+LLM_BACKOFF_BASE_S = 0.5
+LLM_BACKOFF_MAX_S = 8.0
+LLM_HEDGE_REQUESTS = False
+LLM_HEDGE_MIN_DELAY_S = 5.0
+LLM_MAX_CONCURRENCY = 16
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT_S = 30.0
+
+# Connection pool shared by every Hugging Face request in the process (chat, analysis
+# and embeddings): hosts kept, and keep-alive connections per host. With
+# HTTP_POOL_BLOCK a request waits for a free connection rather than opening more, so
+# keep HTTP_POOL_MAXSIZE above LLM_MAX_CONCURRENCY plus the embedding threads
+HTTP_POOL_HOSTS = 10
+HTTP_POOL_MAXSIZE = 32
+HTTP_POOL_BLOCK = True
+
+# Most characters one /query-characters request may ask about
+BATCH_MAX_CHARACTERS = 50
+
+# Replies waiting to be sent on one websocket before the sender applies backpressure
+WS_SEND_QUEUE_SIZE = 32
+
+# Context selection. Of the chunks retrieved, those below MIN_RELEVANCE_SCORE are
+# dropped (cosine similarity for the flat index, 1 - squared L2 distance / sqrt(2)
+# for Chroma; below 0 is unrelated on both), ADAPTIVE_K cuts the rest at the elbow of
+# the score curve (keeping at least RETRIEVAL_MIN_K), and what remains is packed best
+# first into CONTEXT_TOKEN_BUDGET tokens
+MIN_RELEVANCE_SCORE = 0.0
+ADAPTIVE_K = True
+RETRIEVAL_MIN_K = 5
+CONTEXT_TOKEN_BUDGET = 6000
+
+# Retrieval mode: "similarity", "mmr" or "hierarchical". Hierarchical search first picks
+# the CHAPTER_TOP_K chapters whose centroid embedding is closest to the query (always
+# including the chapter being read), and then searches chunks only within them.
+# Chapters are found at ingestion from headings such as "CHAPTER ONE" among the first
+# CHAPTER_SCAN_LINES lines of a page; books without them get sections of
+# CHAPTER_FALLBACK_PAGES pages
+RETRIEVAL_MODE = "similarity"
+CHAPTER_TOP_K = 3
+CHAPTER_SCAN_LINES = 5
+CHAPTER_FALLBACK_PAGES = 10
+# Optionally, one LLM summary per chapter is written at ingestion, from up to
+# CHAPTER_SUMMARY_CHARS characters of it, and also used for routing
+CHAPTER_SUMMARIES = False
+CHAPTER_SUMMARY_CHARS = 12000
+
+# Character analyses retrieve, below the page bound, the ANALYSIS_FIRST_CHUNKS earliest
+# and ANALYSIS_RECENT_CHUNKS latest chunks naming the character (from postings built
+# at ingestion) and ANALYSIS_RELEVANT_CHUNKS similarity hits, instead of one large
+# similarity search. Only with the flat index
+ANALYSIS_PROBES = True
+ANALYSIS_FIRST_CHUNKS = 2
+ANALYSIS_RECENT_CHUNKS = 3
+ANALYSIS_RELEVANT_CHUNKS = 3
+
+# Caches of finished retrievals (per book) and of query embeddings (shared)
+RETRIEVAL_CACHE_SIZE = 256
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+# Full-book rankings of the RANKED_CACHE_DEPTH best chunks (positions and scores) per
+# book and query, filtered down to the results for any page bound. When fewer than k
+# ranked chunks lie below the bound, a page-bounded search runs instead. Flat index
+# only
+RANKED_CACHE_SIZE = 256
+RANKED_CACHE_DEPTH = 2000
+
+# Chat answers are reused for a similar question about the same book (cosine similarity
+# of the question embeddings of at least ANSWER_CACHE_THRESHOLD), if the asker has read
+# every page the answer's context came from and is at most ANSWER_CACHE_MAX_PAGE_GAP
+# pages further on. Only questions that stand on their own are cached, and a message
+# with "use_cache": false bypasses the cache
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_THRESHOLD = 0.9
+ANSWER_CACHE_MAX_PAGE_GAP = 10
+
+# A chat message reuses the previous retrieval, which is still in the conversation, if
+# it is about the same book and page and its embedding has a cosine similarity of at
+# least FOLLOWUP_THRESHOLD with the previous message's, or of at least
+# FOLLOWUP_REFERRING_THRESHOLD if it refers back ("and his wand?") without naming anyone
+FOLLOWUP_THRESHOLD = 0.8
+FOLLOWUP_REFERRING_THRESHOLD = 0.5
+
+# Background retrieval for names on the pages the reader has just read
+PREFETCH_LOOKBACK_PAGES = 3
+PREFETCH_MAX_NAMES = 8
+PREFETCH_BUDGET_S = 2.0
+
+# How book pages are split into chunks: "recursive", "sentence" or "page"
+CHUNKING_STRATEGY = "recursive"
+
+# Cleaning before chunking: a line among the first or last BOILERPLATE_SCAN_LINES lines
+# of at least BOILERPLATE_MIN_PAGES pages (ignoring digits) is a running header or
+# footer and is stripped if it is on BOILERPLATE_MIN_FRACTION of all pages (the book's
+# title, page numbers) or on BOILERPLATE_MIN_DENSITY of the pages from its first
+# appearance to its last (a chapter's title, on every other page of the chapter). A
+# line repeated here and there through a long book is kept. Chunks with identical text
+# are embedded once
+STRIP_BOILERPLATE = True
+BOILERPLATE_SCAN_LINES = 2
+BOILERPLATE_MIN_PAGES = 4
+BOILERPLATE_MIN_FRACTION = 0.1
+BOILERPLATE_MIN_DENSITY = 0.4
+DEDUPLICATE_CHUNKS = True
+
+# Persistent multi-book index store
+LIBRARY_DIR = "library"
+
+# Batch ingestion (python -m backend.ingest): worker processes, and embedding requests
+# per second shared by all of them, in bursts of up to INGEST_EMBED_BURST requests
+INGEST_WORKERS = 4
+INGEST_EMBED_RATE = 5.0
+INGEST_EMBED_BURST = 5
+
+# Prebuilt book bundles (see backend/bundle.py), imported into the library when it is
+# first opened, so that books shipped with the image need no embedding
+PREBUILT_BUNDLE_DIR = "bundles"
+
+# Sessions and conversations, shared by all worker processes (SQLite in WAL mode).
+# Sessions idle for longer than SESSION_MAX_AGE_S are deleted at startup
+SESSION_DB_PATH = "library/sessions.db"
+SESSION_MAX_AGE_S = 30 * 24 * 3600
+
+# Each chat message is sent with the most recent messages of its conversation that fit
+# in about CHAT_HISTORY_TOKEN_BUDGET tokens. Keep it well above CONTEXT_TOKEN_BUDGET,
+# so that a follow-up question still sees the excerpts it reuses
+CHAT_HISTORY_TOKEN_BUDGET = 12000
+
+# HTTP caching of library pages and page images (book IDs are content hashes)
+BOOK_CACHE_MAX_AGE_S = 365 * 24 * 3600
+PAGE_IMAGE_MAX_WIDTH = 2000
+
+# Memory. MEMORY_BUDGET_BYTES bounds what one process holds in index memory plus
+# ingestions in progress (None for no limit). An upload that would exceed it waits up
+# to MEMORY_QUEUE_TIMEOUT_S for memory to be released, and is then refused
+MEMORY_BUDGET_BYTES = 2 * 1024**3
+MEMORY_QUEUE_TIMEOUT_S = 30.0
+# Upper bound on the characters of text per byte of PDF, for reserving memory before
+# an upload is parsed. Compressed text streams can hold more than a character per byte
+PDF_TEXT_CHARS_PER_BYTE = 2.0
+# Trace Python allocations with tracemalloc (slows the process down noticeably) and
+# log the MEMORY_SNAPSHOT_TOP allocation sites that grew most in each ingestion stage
+MEMORY_TRACING = False
+MEMORY_SNAPSHOT_TOP = 5
+# Texts per embedding call while a book is ingested
+INGEST_EMBED_BATCH_SIZE = 256
+
+# Vector index backend: "chroma" or "flat" (in-process NumPy matrix)
+INDEX_BACKEND = "chroma"
+# Storage precision of the flat index: "float32", "float16" or "int8"
+FLAT_INDEX_DTYPE = "float32"
@@ -0,0 +1,155 @@
+import hashlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from backend.config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_DEVICE,
+    EMBEDDING_MODEL_ID,
+    EMBEDDING_THREADS,
+    HASHING_EMBEDDING_DIM,
+)
+
+EMBEDDING_BACKENDS = ("remote", "local", "hashing")
+
+_TOKEN = re.compile(r"\w+")
+
+
+def embedding_model_name(backend: str) -> str:
+    """
+    The model behind an embedding backend.
+
+    Vectors are only comparable if they come from the same model: "remote" and
+    "local" run EMBEDDING_MODEL_ID, while hashing embeddings depend only on their
+    dimension.
+    """
+    if backend == "hashing":
+        return f"hashing-{HASHING_EMBEDDING_DIM}"
+    return EMBEDDING_MODEL_ID
+
+
+def _load_sentence_transformer(model_id: str, device: str):
+    # Imported on demand: sentence-transformers pulls in PyTorch, which takes
+    # seconds to import and is only needed by the "local" backend
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise RuntimeError(
+            "The local embedding backend requires sentence-transformers"
+        ) from None
+    return SentenceTransformer(model_id, device=device)
+
+
+class LocalEmbeddings:
+    """
+    A SentenceTransformer running in this process.
+
+    Texts are encoded in batches of batch_size, and the batches of one call are
+    spread over a small thread pool; PyTorch releases the GIL while it computes.
+    Embeddings are normalised, like those of the remote endpoint.
+
+    Use shared_local_embeddings rather than creating instances, so that the model
+    is loaded once per process.
+    """
+
+    def __init__(
+        self,
+        model_id: str = EMBEDDING_MODEL_ID,
+        device: str = EMBEDDING_DEVICE,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        threads: int = EMBEDDING_THREADS,
+    ):
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.model = _load_sentence_transformer(model_id, device)
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="embedding"
+        )
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        vectors = self._executor.map(self._encode, batches)
+        return np.concatenate(list(vectors)).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._encode([text])[0].tolist()
+
+
+_local_models: dict[tuple[str, str], LocalEmbeddings] = {}
+_local_models_lock = threading.Lock()
+
+
+def shared_local_embeddings(
+    model_id: str = EMBEDDING_MODEL_ID, device: str = EMBEDDING_DEVICE
+) -> LocalEmbeddings:
+    """The process-wide LocalEmbeddings for a model, loaded on first use."""
+    with _local_models_lock:
+        key = (model_id, device)
+        if key not in _local_models:
+            _local_models[key] = LocalEmbeddings(model_id, device)
+        return _local_models[key]
+
+
+class HashingEmbeddings:
+    """
+    Deterministic bag-of-words embeddings by feature hashing.
+
+    Needs no model and no network, and gives the same vectors in every process, so
+    that tests and benchmarks run offline. Texts sharing words are similar; there is
+    no notion of meaning beyond that.
+    """
+
+    def __init__(self, dim: int = HASHING_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in _TOKEN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+class RateLimitedEmbeddings:
+    """
+    Passes every call of an embedding function through a RateLimiter.
+
+    Each call is one request to the model, however many texts it embeds.
+    """
+
+    def __init__(self, embeddings, limiter):
+        self.embeddings = embeddings
+        self.limiter = limiter
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.limiter.acquire()
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        self.limiter.acquire()
+        return self.embeddings.embed_query(text)
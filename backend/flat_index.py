@@ -0,0 +1,380 @@
+import json
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+
+from backend.config import INGEST_EMBED_BATCH_SIZE
+
+
+class FlatVectorIndex:
+    """
+    Brute-force in-process vector index for a single book.
+
+    Embeddings are L2-normalised and stored in one contiguous matrix sorted by page, so
+    a page-bounded query only has to look at a prefix of the matrix: one slice, one
+    matrix-vector product and an argpartition. At the scale of a book (a few thousand
+    384-dimensional vectors) this is faster and far lighter than an HNSW index.
+
+    Vectors can be stored as float32, float16 or int8 (symmetric per-row quantisation)
+    and saved to disk so that load() maps them with np.memmap instead of reading them.
+
+    The search methods mirror the parts of the Chroma interface used by EmbeddedPDF,
+    including the {"page": {"$lt": n}} and {"book_id": {"$eq": id}} filters. Relevance
+    scores are cosine similarities.
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+    VECTORS_FILE = "vectors.bin"
+    SCALES_FILE = "scales.bin"
+    META_FILE = "index.json"
+
+    def __init__(self, embedding_function, dtype: str = "float32"):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+
+        self.embedding_function = embedding_function
+        self.dtype = dtype
+        self.documents: list[Document] = []
+        self._vectors = np.empty((0, 0), dtype=dtype)
+        self._scales: np.ndarray | None = None
+        self._pages = np.empty(0, dtype=np.int64)
+        self._book_ids = np.empty(0, dtype=object)
+        # The book every chunk is tagged with, if they all share one
+        self._only_book: str | None = None
+
+    @classmethod
+    def from_documents(
+        cls, documents: list[Document], embedding_function, dtype: str = "float32"
+    ) -> "FlatVectorIndex":
+        """Embed documents and build an index over them."""
+        index = cls(embedding_function, dtype=dtype)
+        index.add_documents(documents)
+        return index
+
+    @classmethod
+    def from_embeddings(
+        cls,
+        documents: list[Document],
+        embeddings,
+        embedding_function,
+        dtype: str = "float32",
+    ) -> "FlatVectorIndex":
+        """Build an index from precomputed embeddings, without calling the model."""
+        index = cls(embedding_function, dtype=dtype)
+        index._build(documents, np.asarray(embeddings, dtype=np.float32))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the vector matrix and its side arrays."""
+        scales = self._scales.nbytes if self._scales is not None else 0
+        return self._vectors.nbytes + scales + self._pages.nbytes
+
+    @property
+    def mapped(self) -> bool:
+        """Whether the vectors are memory-mapped from disk rather than in memory."""
+        return isinstance(self._vectors, np.memmap)
+
+    def add_documents(
+        self, documents: list[Document], batch_size: int = INGEST_EMBED_BATCH_SIZE
+    ):
+        """
+        Embed and add documents, keeping the matrix sorted by page.
+
+        Texts are embedded batch_size at a time and every batch is converted to
+        float32 at once. The model returns lists of Python floats, about eight times
+        larger, and these never exist for all the documents together.
+        """
+        if not documents:
+            return
+        new_vectors = None
+        for start in range(0, len(documents), batch_size):
+            batch = np.asarray(
+                self.embedding_function.embed_documents(
+                    [doc.page_content for doc in documents[start : start + batch_size]]
+                ),
+                dtype=np.float32,
+            )
+            if new_vectors is None:
+                new_vectors = np.empty((len(documents), batch.shape[1]), np.float32)
+            new_vectors[start : start + len(batch)] = batch
+
+        all_documents = self.documents + list(documents)
+        if len(self.documents):
+            new_vectors = np.vstack([self.embeddings(), new_vectors])
+        self._build(all_documents, new_vectors)
+
+    def embeddings(self) -> np.ndarray:
+        """The stored (normalised) embeddings as float32, in page order."""
+        if self.dtype == "int8":
+            return self._vectors.astype(np.float32) * self._scales[:, None]
+        return np.asarray(self._vectors, dtype=np.float32)
+
+    def _build(self, documents: list[Document], vectors: np.ndarray):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        pages = np.array([doc.metadata.get("page", 0) for doc in documents])
+        order = np.argsort(pages, kind="stable")
+
+        self.documents = [documents[i] for i in order]
+        self._pages = pages[order].astype(np.int64)
+        self._index_book_ids()
+        vectors = np.ascontiguousarray(vectors[order])
+
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self._vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales = scales.astype(np.float32)
+        else:
+            self._vectors = vectors.astype(self.dtype)
+            self._scales = None
+
+    def _index_book_ids(self):
+        self._book_ids = np.array(
+            [doc.metadata.get("book_id") for doc in self.documents], dtype=object
+        )
+        books = set(self._book_ids.tolist())
+        self._only_book = books.pop() if len(books) == 1 else None
+
+    def _prefix_length(self, page_limit: int | None) -> int:
+        if page_limit is None:
+            return len(self.documents)
+        return int(np.searchsorted(self._pages, page_limit, side="left"))
+
+    def _scores(self, query: np.ndarray, n: int, start: int = 0) -> np.ndarray:
+        rows = self._vectors[start:n]
+        if self.dtype == "float32":
+            return rows @ query
+        scores = rows.astype(np.float32) @ query
+        if self._scales is not None:
+            scores *= self._scales[start:n]
+        return scores
+
+    def row_range(self, first_page: int, end_page: int) -> tuple[int, int]:
+        """The rows holding chunks of pages first_page to end_page (exclusive)."""
+        return (
+            int(np.searchsorted(self._pages, first_page, side="left")),
+            int(np.searchsorted(self._pages, end_page, side="left")),
+        )
+
+    def centroids(self, row_ranges: list[tuple[int, int]]) -> np.ndarray:
+        """Normalised mean embedding of each row range; zeros for an empty range."""
+        dim = self._vectors.shape[1] if self._vectors.ndim == 2 else 0
+        centroids = np.zeros((len(row_ranges), dim), dtype=np.float32)
+        for i, (start, stop) in enumerate(row_ranges):
+            if stop > start:
+                rows = self._vectors[start:stop].astype(np.float32)
+                if self._scales is not None:
+                    rows *= self._scales[start:stop, None]
+                centroids[i] = self.normalise(rows.mean(axis=0))
+        return centroids
+
+    def search_by_vector_in_rows(
+        self, vector, k: int, row_ranges: list[tuple[int, int]]
+    ) -> list[tuple[int, float]]:
+        """
+        Top-k (position, score) pairs among the given row ranges only.
+
+        The other rows are not scored at all (see row_range).
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        ranges = [(start, stop) for start, stop in row_ranges if stop > start]
+        if not ranges or k <= 0:
+            return []
+        positions = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+        scores = np.concatenate(
+            [self._scores(query, stop, start) for start, stop in ranges]
+        )
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(k)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(positions[i]), float(scores[i])) for i in top]
+
+    @staticmethod
+    def normalise(embedding) -> np.ndarray:
+        """An embedding scaled to unit length, as search_by_vector takes it."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def search_by_vector(
+        self, vector, k: int, page_limit: int | None = None, book_id: str | None = None
+    ) -> list[tuple[int, float]]:
+        """
+        Top-k (position, score) pairs for a normalised query vector.
+
+        Args:
+            vector: Query embedding, already normalised
+            k (int): Number of results
+            page_limit (int | None): Only chunks with page < page_limit are considered
+            book_id (str | None): Only chunks tagged with this book are considered.
+                No mask is built when every chunk is of this book, as in the
+                per-book indexes of the library.
+        """
+        n = self._prefix_length(page_limit)
+        if n == 0 or k <= 0:
+            return []
+
+        scores = self._scores(np.asarray(vector, dtype=np.float32), n)
+        if book_id is not None and book_id != self._only_book:
+            scores = np.where(self._book_ids[:n] == book_id, scores, -np.inf)
+
+        k = min(k, n)
+        if k < n:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(n)
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [(int(i), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def ranking(
+        self, vector, depth: int, book_id: str | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Positions and scores of the depth best chunks of the whole book, best first.
+
+        The chunks are sorted by page, so the top k below a page bound are the first
+        k of these before the bound's row (see row_range), if there are k of them.
+        """
+        hits = self.search_by_vector(vector, depth, book_id=book_id)
+        positions = np.array([i for i, _ in hits], dtype=np.int64)
+        scores = np.array([score for _, score in hits], dtype=np.float32)
+        return positions, scores
+
+    @staticmethod
+    def _parse_filter(filter: dict | None) -> tuple[int | None, str | None]:
+        """Extract the page bound and book ID from a Chroma-style filter."""
+        page_limit = None
+        book_id = None
+        clauses = filter.get("$and", [filter]) if filter else []
+        for clause in clauses:
+            for field, condition in clause.items():
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                if field == "page" and "$lt" in condition:
+                    page_limit = condition["$lt"]
+                elif field == "page" and "$lte" in condition:
+                    page_limit = condition["$lte"] + 1
+                elif field == "book_id" and "$eq" in condition:
+                    book_id = condition["$eq"]
+                else:
+                    raise ValueError(f"Unsupported filter on {field}: {condition}")
+        return page_limit, book_id
+
+    def similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, filter: dict | None = None
+    ) -> list[tuple[Document, float]]:
+        """Chroma-compatible page-bounded similarity search."""
+        return self.similarity_search_by_vector_with_relevance_scores(
+            self.embedding_function.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding, k: int = 4, filter: dict | None = None
+    ) -> list[tuple[Document, float]]:
+        """Similarity search for a precomputed query embedding."""
+        page_limit, book_id = self._parse_filter(filter)
+        hits = self.search_by_vector(self.normalise(embedding), k, page_limit, book_id)
+        return [(self.documents[i], score) for i, score in hits]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: dict | None = None,
+    ) -> list[Document]:
+        """Chroma-compatible maximal marginal relevance search."""
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding_function.embed_query(query),
+            k=k,
+            fetch_k=fetch_k,
+            lambda_mult=lambda_mult,
+            filter=filter,
+        )
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: dict | None = None,
+    ) -> list[Document]:
+        """Maximal marginal relevance search for a precomputed query embedding."""
+        page_limit, book_id = self._parse_filter(filter)
+        query_vector = self.normalise(embedding)
+        candidates = self.search_by_vector(query_vector, fetch_k, page_limit, book_id)
+        if not candidates:
+            return []
+
+        positions = np.array([i for i, _ in candidates])
+        relevance = np.array([score for _, score in candidates])
+        vectors = self.embeddings()[positions]
+
+        selected: list[int] = []
+        remaining = list(range(len(positions)))
+        while remaining and len(selected) < k:
+            if selected:
+                redundancy = (vectors[remaining] @ vectors[selected].T).max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            mmr = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+            selected.append(remaining.pop(int(np.argmax(mmr))))
+
+        return [self.documents[positions[i]] for i in selected]
+
+    def save(self, directory: str | Path):
+        """Write the index so that load() can memory-map it."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        self._vectors.tofile(directory / self.VECTORS_FILE)
+        if self._scales is not None:
+            self._scales.tofile(directory / self.SCALES_FILE)
+
+        meta = {
+            "dtype": self.dtype,
+            "shape": list(self._vectors.shape),
+            "pages": self._pages.tolist(),
+            "documents": [
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+                for doc in self.documents
+            ],
+        }
+        (directory / self.META_FILE).write_text(json.dumps(meta))
+
+    @classmethod
+    def load(
+        cls, directory: str | Path, embedding_function, mmap: bool = True
+    ) -> "FlatVectorIndex":
+        """Open a saved index, mapping the vectors read-only from disk."""
+        directory = Path(directory)
+        meta = json.loads((directory / cls.META_FILE).read_text())
+
+        index = cls(embedding_function, dtype=meta["dtype"])
+        shape = tuple(meta["shape"])
+        if mmap and shape[0] > 0:
+            index._vectors = np.memmap(
+                directory / cls.VECTORS_FILE, dtype=index.dtype, mode="r", shape=shape
+            )
+        else:
+            index._vectors = np.fromfile(
+                directory / cls.VECTORS_FILE, dtype=index.dtype
+            ).reshape(shape)
+        if index.dtype == "int8":
+            index._scales = np.fromfile(directory / cls.SCALES_FILE, dtype=np.float32)
+
+        index._pages = np.array(meta["pages"], dtype=np.int64)
+        index.documents = [Document(**doc) for doc in meta["documents"]]
+        index._index_book_ids()
+        return index
@@ -0,0 +1,91 @@
+import re
+
+import numpy as np
+
+from backend.config import FOLLOWUP_REFERRING_THRESHOLD, FOLLOWUP_THRESHOLD
+from backend.prefetch import extract_names
+
+# Messages that lean on the previous one: "and his wand?", "why did she leave?"
+_REFERS_BACK = re.compile(
+    r"^\s*(?:and|but|so|also|then|what\s+about|how\s+about)\b"
+    r"|\b(?:he|she|him|her|his|hers|they|them|their|it|its)\b",
+    re.IGNORECASE,
+)
+
+
+def refers_back(message: str) -> bool:
+    """Whether a message refers back to an earlier one without naming anyone new."""
+    return bool(_REFERS_BACK.search(message)) and not extract_names(message)
+
+
+def _normalise(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FollowUpDetector:
+    """
+    Tells a chat session's follow-up questions, which can reuse the last retrieval.
+
+    The last retrieval is already in the conversation sent to the model, so a
+    follow-up needs neither a new search nor another copy of the context. A message
+    is a follow-up if it is about the same book and page as the previous one, and
+    its embedding is close to the previous message's. A message that refers back to
+    the previous one only needs to be less close: a pronoun alone does not make
+    "what is he hiding in the forest?" a follow-up to "who is Snape?".
+    """
+
+    def __init__(
+        self,
+        threshold: float = FOLLOWUP_THRESHOLD,
+        referring_threshold: float = FOLLOWUP_REFERRING_THRESHOLD,
+    ):
+        self.threshold = threshold
+        self.referring_threshold = referring_threshold
+        self._last: dict | None = None
+
+        self.retrievals = 0
+        self.reused = 0
+        self.tokens_avoided = 0
+
+    def is_follow_up(
+        self, message: str, vector, book_id: str | None, current_page: int
+    ) -> bool:
+        last = self._last
+        if last is None or (last["book_id"], last["current_page"]) != (
+            book_id,
+            current_page,
+        ):
+            return False
+        similarity = float(_normalise(vector) @ last["vector"])
+        if refers_back(message):
+            return similarity >= self.referring_threshold
+        return similarity >= self.threshold
+
+    def retrieved(self, vector, book_id: str | None, current_page: int, tokens: int):
+        """Record a new retrieval of about tokens tokens sent to the model."""
+        self._last = {
+            "vector": _normalise(vector),
+            "book_id": book_id,
+            "current_page": current_page,
+            "tokens": tokens,
+        }
+        self.retrievals += 1
+
+    def reused_previous(self, vector):
+        """Record a follow-up; the next message is compared with this one."""
+        self._last["vector"] = _normalise(vector)
+        self.reused += 1
+        self.tokens_avoided += self._last["tokens"]
+
+    def forget(self):
+        """The last retrieval is no longer the latest context in the conversation."""
+        self._last = None
+
+    def stats(self) -> dict:
+        return {
+            "retrievals": self.retrievals,
+            "reused_retrievals": self.reused,
+            "prompt_tokens_avoided": self.tokens_avoided,
+        }
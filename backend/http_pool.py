@@ -0,0 +1,114 @@
+import threading
+
+import requests
+from huggingface_hub import configure_http_backend, constants
+
+from backend.config import HTTP_POOL_BLOCK, HTTP_POOL_HOSTS, HTTP_POOL_MAXSIZE
+
+try:
+    from huggingface_hub.utils._http import UniqueRequestIdAdapter as _BaseAdapter
+except ImportError:  # Private in huggingface_hub; only adds request IDs
+    from requests.adapters import HTTPAdapter as _BaseAdapter
+
+
+class PooledAdapter(_BaseAdapter):
+    """
+    One connection pool for every Hugging Face request in the process.
+
+    huggingface_hub keeps a requests.Session per thread. Each of them mounts this
+    adapter, so chat, analysis and embedding calls reuse the same keep-alive
+    connections, whichever thread or EmbeddedPDF makes them. Counts the requests
+    in flight for the pool metrics.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+        }
+
+    def send(self, request, *args, **kwargs):
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["in_flight"] += 1
+            self._counters["peak_in_flight"] = max(
+                self._counters["peak_in_flight"], self._counters["in_flight"]
+            )
+        try:
+            return super().send(request, *args, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._counters["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._counters["in_flight"] -= 1
+
+    def stats(self) -> dict:
+        hosts = {}
+        for key in self.poolmanager.pools.keys():
+            pool = self.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            opened = pool.num_connections
+            hosts[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+                "connections_opened": opened,
+                "requests": pool.num_requests,
+                "idle": sum(conn is not None for conn in list(pool.pool.queue)),
+                "reuse_rate": 1 - opened / pool.num_requests
+                if pool.num_requests
+                else None,
+            }
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "max_hosts": self._pool_connections,
+            "max_connections_per_host": self._pool_maxsize,
+            "block": self._pool_block,
+            **counters,
+            "hosts": hosts,
+        }
+
+
+_adapter: PooledAdapter | None = None
+_adapter_lock = threading.Lock()
+
+
+def configure_http_pool(
+    hosts: int = HTTP_POOL_HOSTS,
+    maxsize: int = HTTP_POOL_MAXSIZE,
+    block: bool = HTTP_POOL_BLOCK,
+) -> PooledAdapter | None:
+    """
+    Route every huggingface_hub request through one shared PooledAdapter.
+
+    Only the first call configures the pool. Offline mode keeps huggingface_hub's
+    own adapters.
+    """
+    global _adapter
+    if constants.HF_HUB_OFFLINE:
+        return None
+    with _adapter_lock:
+        if _adapter is None:
+            adapter = PooledAdapter(
+                pool_connections=hosts, pool_maxsize=maxsize, pool_block=block
+            )
+
+            def session_factory() -> requests.Session:
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                return session
+
+            configure_http_backend(backend_factory=session_factory)
+            _adapter = adapter
+        return _adapter
+
+
+def pool_stats() -> dict | None:
+    """Utilisation of the shared pool, or None if it has not been configured."""
+    return _adapter.stats() if _adapter is not None else None
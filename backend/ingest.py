@@ -0,0 +1,205 @@
+import argparse
+import multiprocessing
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from backend.config import (
+    INGEST_EMBED_BURST,
+    INGEST_EMBED_RATE,
+    INGEST_WORKERS,
+    LIBRARY_DIR,
+)
+from backend.library import BookLibrary, book_id_for
+from backend.RAG import pdf_bytes_to_langchain_doc, set_embedding_rate_limiter
+from backend.ratelimit import RateLimiter
+
+# The library of a worker process, opened by _init_worker
+_library: BookLibrary | None = None
+
+
+def find_pdfs(directory: str | Path) -> list[Path]:
+    """Every PDF below a directory, in a stable order."""
+    return sorted(
+        path for path in Path(directory).rglob("*") if path.suffix.lower() == ".pdf"
+    )
+
+
+def _init_worker(library_dir: str, limiter: RateLimiter):
+    global _library
+    set_embedding_rate_limiter(limiter)
+    _library = BookLibrary(library_dir)
+
+
+def ingest_file(path: Path) -> dict:
+    """
+    Add one PDF to the worker's library, unless it is already there.
+
+    Returns:
+        dict: The file, book ID, status ("ingested", "skipped" or "failed"),
+            pages, chunks, seconds taken and what cleaning saved (see
+            EmbeddedPDF.embed_pdf), or the error of a failed book.
+    """
+    start = time.perf_counter()
+    row = {"file": str(path), "book_id": None, "status": "failed"}
+    try:
+        content = path.read_bytes()
+        book_id = row["book_id"] = book_id_for(content)
+        if _library.has_book(book_id):
+            result = {"success": True, "cached": True}
+        else:
+            pages = pdf_bytes_to_langchain_doc(content, path.name)
+            result = _library.add_book(book_id, path.name, pages, content)
+        if not result["success"]:
+            return {**row, "error": result["error"]}
+
+        return {
+            **row,
+            "status": "skipped" if result["cached"] else "ingested",
+            "pages": _library.info(book_id)["total_pages"],
+            "chunks": len(_library.get_book(book_id).db),
+            "seconds": time.perf_counter() - start,
+            "cleaning": result.get("cleaning"),
+        }
+    except Exception as e:
+        return {**row, "error": repr(e)}
+
+
+def ingest_directory(
+    directory: str | Path,
+    library_dir: str | Path = LIBRARY_DIR,
+    workers: int = INGEST_WORKERS,
+    rate: float = INGEST_EMBED_RATE,
+    burst: float = INGEST_EMBED_BURST,
+    on_result: Callable[[dict], None] | None = None,
+) -> tuple[list[dict], dict]:
+    """
+    Ingest every PDF below a directory into a library, several books at a time.
+
+    Each worker process ingests whole books, and all workers share one limit on
+    embedding requests. Books already in the library are skipped, so an
+    interrupted run is resumed by running it again: only books whose ingestion
+    completed are in the library.
+
+    Args:
+        directory (str | Path): Where to look for PDFs
+        library_dir (str | Path): The library to add them to
+        workers (int): Number of worker processes
+        rate (float): Embedding requests per second, over all workers
+        burst (float): Requests that may be sent at once after a quiet period
+        on_result (Callable | None): Called with each book's row as it finishes
+
+    Returns:
+        tuple[list[dict], dict]: One row per PDF (see ingest_file), in the order
+            they finished, and the rate limiter's stats.
+    """
+    paths = find_pdfs(directory)
+    # Forking a process that already runs threads (HTTP pools, executors) is unsafe
+    context = multiprocessing.get_context("spawn")
+    limiter = RateLimiter(rate, burst, context=context)
+    # Create the library once, so that workers do not race to set it up
+    BookLibrary(library_dir)
+
+    rows = []
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(workers, len(paths))),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(str(library_dir), limiter),
+    ) as executor:
+        futures = [executor.submit(ingest_file, path) for path in paths]
+        try:
+            for future in as_completed(futures):
+                rows.append(future.result())
+                if on_result is not None:
+                    on_result(rows[-1])
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return rows, limiter.stats()
+
+
+def throughput_summary(rows: list[dict], elapsed: float) -> str:
+    """A table of pages/s and chunks/s per book, with totals."""
+    lines = [
+        f"{'book':<40} {'status':<8} {'pages':>6} {'chunks':>7} {'seconds':>8} "
+        f"{'pages/s':>8} {'chunks/s':>9}"
+    ]
+    ingested = [row for row in rows if row["status"] == "ingested"]
+    for row in sorted(rows, key=lambda row: row["file"]):
+        name = Path(row["file"]).name[:40]
+        if row["status"] == "failed":
+            lines.append(f"{name:<40} failed   {row['error']}")
+        elif row["status"] == "skipped":
+            lines.append(f"{name:<40} skipped  {row['pages']:>6} {row['chunks']:>7}")
+        else:
+            seconds = row["seconds"]
+            lines.append(
+                f"{name:<40} {'ingested':<8} {row['pages']:>6} {row['chunks']:>7} "
+                f"{seconds:>8.1f} {row['pages'] / seconds:>8.1f} "
+                f"{row['chunks'] / seconds:>9.1f}"
+            )
+
+    pages = sum(row["pages"] for row in ingested)
+    chunks = sum(row["chunks"] for row in ingested)
+    lines.append(
+        f"{len(ingested)} ingested, {len(rows) - len(ingested)} skipped or failed, in "
+        f"{elapsed:.1f} s: {pages / elapsed:.1f} pages/s, "
+        f"{chunks / elapsed:.1f} chunks/s overall"
+    )
+    cleaning = [row["cleaning"] for row in ingested if row.get("cleaning")]
+    if cleaning:
+        lines.append(
+            "Cleaning saved "
+            f"{sum(report['chunks_saved'] for report in cleaning)} chunks "
+            f"({sum(report['duplicate_chunks'] for report in cleaning)} duplicates) "
+            f"and {sum(report['embedding_requests_saved'] for report in cleaning)} "
+            "embedding requests"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest a directory of PDFs into the library, in parallel."
+    )
+    parser.add_argument("directory", type=Path, help="Directory searched for PDFs")
+    parser.add_argument("--library", default=LIBRARY_DIR, help="Library directory")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=INGEST_EMBED_RATE,
+        help="Embedding requests per second, shared by all workers",
+    )
+    parser.add_argument("--burst", type=float, default=INGEST_EMBED_BURST)
+    args = parser.parse_args()
+
+    def report(row: dict):
+        print(f"{row['status']:<8} {row['file']}", flush=True)
+
+    start = time.perf_counter()
+    try:
+        rows, limiter = ingest_directory(
+            args.directory,
+            args.library,
+            args.workers,
+            args.rate,
+            args.burst,
+            on_result=report,
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted. Finished books are kept; run again to resume.")
+        raise SystemExit(130)
+
+    print()
+    print(throughput_summary(rows, time.perf_counter() - start))
+    print(
+        f"{limiter['calls']} embedding requests, "
+        f"{limiter['waited_s']:.1f} s spent waiting for the rate limit"
+    )
+
+
+if __name__ == "__main__":
+    main()
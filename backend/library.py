@@ -0,0 +1,504 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import pypdfium2 as pdfium
+from langchain_core.documents import Document
+
+from backend.bundle import (
+    BUNDLE_SUFFIX,
+    BundleError,
+    check_settings,
+    extract_bundle,
+    read_manifest,
+    write_bundle,
+)
+from backend.chapters import detect_chapters
+from backend.config import CHAPTER_SUMMARIES, LIBRARY_DIR
+from backend.memory import StageMemory
+from backend.RAG import EmbeddedPDF
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where only threads are serialised
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Book IDs become directory names
+_BOOK_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def book_id_for(content: bytes) -> str:
+    """Stable identifier for a book, derived from the PDF bytes."""
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+class BookLibrary:
+    """
+    Many books, each with its own persistent index.
+
+    Every book is ingested once into a FlatVectorIndex under books/{book_id}/index
+    and never written again. Book IDs are content hashes, so several worker
+    processes can memory-map the same indexes read-only. A JSON manifest records
+    which books have been ingested. Switching books only means handing out a
+    different EmbeddedPDF view.
+
+    Books are embedded into a staging directory first, and moved into place while
+    holding a lock file, so several workers can ingest different books at once. If
+    two ingest the same book, the second copy is dropped. A worker re-reads the
+    manifest whenever it changes on disk, so books uploaded through another worker
+    are visible too.
+
+    The extracted page texts and the PDF itself are kept next to the index, so that
+    the reader view can fetch single pages, and page images rendered on demand are
+    cached on disk. Since book IDs are content hashes, none of these ever change.
+
+    A book can be exported to a single bundle file and imported into another
+    library without re-embedding (see backend/bundle.py).
+    """
+
+    def __init__(self, directory: str | Path = LIBRARY_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._manifest_path = self.directory / "library.json"
+        self._lock_path = self.directory / "library.lock"
+        self._lock = threading.Lock()
+        self._views: dict[str, EmbeddedPDF] = {}
+        self._page_texts: dict[str, list[str]] = {}
+
+        self._manifest_mtime: int | None = None
+        self.books: dict[str, dict] = {}
+        self._refresh_manifest()
+        self._remove_stale_staging()
+
+    def _remove_stale_staging(self):
+        """Delete what ingestions interrupted by a crash or kill left behind."""
+        staging_root = self.directory / "staging"
+        if os.name != "posix" or not staging_root.exists():
+            return
+        for staging_dir in staging_root.iterdir():
+            pid = staging_dir.name.split("-")[0]
+            if not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            except PermissionError:  # Alive, but someone else's
+                pass
+
+    def _refresh_manifest(self):
+        """Re-read the manifest if another process has changed it."""
+        try:
+            mtime = self._manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._manifest_mtime:
+            self.books = json.loads(self._manifest_path.read_text())
+            self._manifest_mtime = mtime
+
+    def _write_manifest(self):
+        tmp_path = self._manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.books, indent=2))
+        os.replace(tmp_path, self._manifest_path)
+        self._manifest_mtime = self._manifest_path.stat().st_mtime_ns
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the library against other threads and processes."""
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._refresh_manifest()
+            yield
+
+    def has_book(self, book_id: str) -> bool:
+        return self.info(book_id) is not None
+
+    def info(self, book_id: str) -> dict | None:
+        """Manifest entry of a book, or None if it is not in the library."""
+        with self._lock:
+            self._refresh_manifest()
+            return self.books.get(book_id)
+
+    def list_books(self) -> list[dict]:
+        """Metadata for every book in the library, oldest first."""
+        with self._lock:
+            self._refresh_manifest()
+            books = dict(self.books)
+        return [
+            {"book_id": book_id, **info}
+            for book_id, info in sorted(
+                books.items(), key=lambda item: item[1]["added_at"]
+            )
+        ]
+
+    def add_book(
+        self,
+        book_id: str,
+        source: str,
+        pages: list[Document],
+        pdf_bytes: bytes | None = None,
+        memory: StageMemory | None = None,
+    ) -> dict:
+        """
+        Ingest a book into its own index, unless it is already in the library.
+
+        Args:
+            book_id (str): Content hash of the PDF (see book_id_for)
+            source (str): Original filename of the PDF
+            pages (list[Document]): The pages of the book
+            pdf_bytes (bytes | None): The PDF itself, kept for page rendering
+            memory (StageMemory | None): Records memory use after each stage
+
+        Returns:
+            dict: Result in the same shape as EmbeddedPDF.embed_pdf, with an extra
+                "cached" flag set when no ingestion was needed.
+        """
+        if self.has_book(book_id):
+            return self._already_added(book_id)
+
+        for page in pages:
+            page.metadata["source"] = source
+
+        # Embedding takes long, so it runs without the lock, in a directory of its
+        # own. Other processes can meanwhile ingest other books.
+        staging_root = self.directory / "staging"
+        staging_root.mkdir(exist_ok=True)
+        staging_dir = Path(
+            tempfile.mkdtemp(prefix=f"{os.getpid()}-{book_id}-", dir=staging_root)
+        )
+        try:
+            pdf_embedder = EmbeddedPDF(book_id=book_id, index_backend="flat")
+            result = pdf_embedder.embed_pdf(
+                pages, persist_directory=str(staging_dir / "index"), memory=memory
+            )
+            if not result["success"]:
+                return result
+            if CHAPTER_SUMMARIES:
+                try:
+                    pdf_embedder.summarize_chapters()
+                except Exception as e:
+                    # Summaries only refine chapter routing
+                    logger.warning(f"Chapter summaries for {book_id} failed: {e!r}")
+            self._write_pages(staging_dir, pages, pdf_bytes, pdf_embedder)
+            with self._exclusive():
+                # Someone else may have ingested the same book in the meantime
+                if book_id in self.books:
+                    return self._already_added(book_id)
+                return self._store_book(
+                    book_id, source, staging_dir, pdf_embedder, result, memory
+                )
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def _already_added(self, book_id: str) -> dict:
+        return {
+            "success": True,
+            "pages": self.books[book_id]["total_pages"],
+            "message": "PDF already in library",
+            "cached": True,
+        }
+
+    def _store_book(
+        self,
+        book_id: str,
+        source: str,
+        staging_dir: Path,
+        pdf_embedder: EmbeddedPDF,
+        result: dict,
+        memory: StageMemory | None,
+    ) -> dict:
+        """Move a staged book into the library; the caller holds the library."""
+        book_dir = self._book_dir(book_id)
+        # A crashed import may have left a partial directory behind
+        shutil.rmtree(book_dir, ignore_errors=True)
+        book_dir.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staging_dir, book_dir)
+        pdf_embedder.load_index(str(book_dir / "index"), result["pages"])
+        if memory is not None:
+            memory.mark("store")
+
+        self.books[book_id] = {
+            "source": source,
+            "total_pages": result["pages"],
+            "added_at": time.time(),
+            "index": "flat",
+            "embeddings": pdf_embedder.embedding_backend,
+        }
+        self._write_manifest()
+        self._views[book_id] = pdf_embedder
+        return {**result, "cached": False}
+
+    def get_book(self, book_id: str) -> EmbeddedPDF:
+        """
+        An EmbeddedPDF for one book of the library.
+
+        Raises:
+            KeyError: If the book is not in the library.
+        """
+        with self._lock:
+            if book_id not in self._views:
+                self._refresh_manifest()
+                if book_id not in self.books:
+                    raise KeyError(f"Book {book_id} is not in the library")
+                self._views[book_id] = self._open_book(book_id)
+            return self._views[book_id]
+
+    def _open_book(self, book_id: str) -> EmbeddedPDF:
+        """A view onto a book's index; the caller holds the lock."""
+        info = self.books[book_id]
+        pdf_embedder = EmbeddedPDF(
+            book_id=book_id,
+            index_backend="flat",
+            embedding_backend=info.get("embeddings", "remote"),
+        )
+        pdf_embedder.load_index(
+            str(self._book_dir(book_id) / "index"), info["total_pages"]
+        )
+        self._restore_annotations(book_id, pdf_embedder)
+        return pdf_embedder
+
+    def _restore_annotations(self, book_id: str, pdf_embedder: EmbeddedPDF):
+        """
+        Give a view the character names and chapters found at ingestion; books
+        ingested before these were kept get them from their page texts. The caller
+        holds the lock.
+        """
+        book_dir = self._book_dir(book_id)
+        names_path = book_dir / "names.json"
+        chapters_path = book_dir / "chapters.json"
+        if names_path.exists():
+            pdf_embedder.set_page_names(json.loads(names_path.read_text()))
+        else:
+            texts = self._load_page_texts(book_id)
+            if texts is not None:
+                pdf_embedder.set_page_texts(texts)
+        if chapters_path.exists():
+            pdf_embedder.set_chapters(json.loads(chapters_path.read_text()))
+        else:
+            texts = self._load_page_texts(book_id)
+            if texts is not None:
+                pdf_embedder.set_chapters(detect_chapters(texts))
+
+    def export_bundle(self, book_id: str, path: str | Path) -> Path:
+        """
+        Write a book to a bundle file that import_bundle loads without embedding.
+
+        Raises:
+            KeyError: If the book is not in the library.
+        """
+        pdf_embedder = self.get_book(book_id)
+        info = self.info(book_id)
+
+        book_dir = self._book_dir(book_id)
+        names_path = book_dir / "names.json"
+        if not names_path.exists():
+            names_path.write_text(json.dumps(pdf_embedder.page_names))
+        chapters_path = book_dir / "chapters.json"
+        if not chapters_path.exists():
+            chapters_path.write_text(json.dumps(pdf_embedder.chapters))
+        return write_bundle(
+            path,
+            book_dir,
+            {
+                "book_id": book_id,
+                "source": info["source"],
+                "total_pages": info["total_pages"],
+                "chunks": len(pdf_embedder.db),
+                "index_dtype": pdf_embedder.db.dtype,
+                "settings": pdf_embedder.index_settings(),
+            },
+        )
+
+    def import_bundle(self, path: str | Path) -> dict:
+        """
+        Add a book from a bundle written by export_bundle.
+
+        The index is unpacked and memory-mapped as it is; nothing is embedded.
+
+        Returns:
+            dict: The book ID and page count, with a "cached" flag set when the
+                book was already in the library.
+
+        Raises:
+            BundleError: If the bundle is malformed or unreadable, or its embedding
+                model or chunking parameters differ from those of this library.
+        """
+        manifest = read_manifest(path)
+        book_id = manifest.get("book_id")
+        if not isinstance(book_id, str) or not _BOOK_ID.fullmatch(book_id):
+            raise BundleError(f"Invalid book ID in bundle: {book_id!r}")
+
+        with self._exclusive():
+            if book_id in self.books:
+                return {
+                    "book_id": book_id,
+                    "pages": self.books[book_id]["total_pages"],
+                    "cached": True,
+                }
+
+            try:
+                pdf_embedder = EmbeddedPDF(
+                    book_id=book_id,
+                    index_backend="flat",
+                    embedding_backend=manifest["settings"]["embedding_backend"],
+                )
+            except (KeyError, ValueError) as e:
+                raise BundleError(f"Unusable bundle settings: {e}") from e
+            check_settings(manifest, pdf_embedder.index_settings())
+
+            book_dir = self._book_dir(book_id)
+            shutil.rmtree(book_dir, ignore_errors=True)
+            try:
+                extract_bundle(path, book_dir)
+                pdf_embedder.load_index(
+                    str(book_dir / "index"), manifest["total_pages"]
+                )
+                self.books[book_id] = {
+                    "source": manifest["source"],
+                    "total_pages": manifest["total_pages"],
+                    "added_at": time.time(),
+                    "index": "flat",
+                    "embeddings": pdf_embedder.embedding_backend,
+                }
+                self._restore_annotations(book_id, pdf_embedder)
+            except (OSError, zipfile.BadZipFile, KeyError, TypeError, ValueError) as e:
+                self.books.pop(book_id, None)
+                shutil.rmtree(book_dir, ignore_errors=True)
+                raise BundleError(f"Unreadable bundle {path}: {e!r}") from e
+            self._write_manifest()
+            self._views[book_id] = pdf_embedder
+
+        return {"book_id": book_id, "pages": manifest["total_pages"], "cached": False}
+
+    def import_bundles(self, directory: str | Path) -> list[dict]:
+        """
+        Import every bundle in a directory that is not in the library yet.
+
+        Bundles that cannot be imported are logged and skipped.
+        """
+        results = []
+        for path in sorted(Path(directory).glob(f"*{BUNDLE_SUFFIX}")):
+            try:
+                results.append(self.import_bundle(path))
+            except BundleError as e:
+                logger.warning(f"Skipping bundle {path}: {e}")
+        return results
+
+    def _book_dir(self, book_id: str) -> Path:
+        return self.directory / "books" / book_id
+
+    @staticmethod
+    def _write_pages(
+        book_dir: Path, pages: list[Document], pdf_bytes, pdf_embedder: EmbeddedPDF
+    ):
+        book_dir.mkdir(parents=True, exist_ok=True)
+        texts = [page.page_content for page in pages]
+        (book_dir / "pages.json").write_text(json.dumps(texts))
+        (book_dir / "names.json").write_text(json.dumps(pdf_embedder.page_names))
+        (book_dir / "chapters.json").write_text(json.dumps(pdf_embedder.chapters))
+        if pdf_bytes is not None:
+            (book_dir / "book.pdf").write_bytes(pdf_bytes)
+
+    def _load_page_texts(self, book_id: str) -> list[str] | None:
+        """Page texts of a book, read from disk once; the caller holds the lock."""
+        if book_id not in self._page_texts:
+            self._refresh_manifest()
+            path = self._book_dir(book_id) / "pages.json"
+            if book_id not in self.books or not path.exists():
+                return None
+            self._page_texts[book_id] = json.loads(path.read_text())
+        return self._page_texts[book_id]
+
+    def pdf_path(self, book_id: str) -> Path | None:
+        """The stored PDF of a book, or None if it was ingested without one."""
+        path = self._book_dir(book_id) / "book.pdf"
+        return path if self.has_book(book_id) and path.exists() else None
+
+    def page_text(self, book_id: str, page: int) -> str:
+        """
+        The extracted text of one page.
+
+        Args:
+            book_id (str): The book
+            page (int): 0-indexed page number
+
+        Raises:
+            KeyError: If the book or its page texts are not in the library.
+            IndexError: If the page does not exist.
+        """
+        with self._lock:
+            texts = self._load_page_texts(book_id)
+        if texts is None:
+            raise KeyError(f"No page texts for book {book_id}")
+
+        if not 0 <= page < len(texts):
+            raise IndexError(f"Page {page} out of range")
+        return texts[page]
+
+    def page_image(self, book_id: str, page: int, width: int) -> Path:
+        """
+        A PNG of one page at the given pixel width, rendered once and then cached.
+
+        Raises:
+            KeyError: If the book has no stored PDF.
+            IndexError: If the page does not exist.
+        """
+        pdf_path = self.pdf_path(book_id)
+        if pdf_path is None:
+            raise KeyError(f"No PDF stored for book {book_id}")
+
+        image_path = self._book_dir(book_id) / "images" / f"{page}-{width}.png"
+        if image_path.exists():
+            return image_path
+
+        document = pdfium.PdfDocument(str(pdf_path))
+        try:
+            if not 0 <= page < len(document):
+                raise IndexError(f"Page {page} out of range")
+            pdf_page = document[page]
+            scale = width / pdf_page.get_width()
+            image = pdf_page.render(scale=scale).to_pil()
+        finally:
+            document.close()
+
+        image_path.parent.mkdir(parents=True, exist_ok=True)
+        # A file of its own, so concurrent renders of the page never publish each
+        # other's half-written image
+        tmp_file = tempfile.NamedTemporaryFile(
+            dir=image_path.parent, suffix=".tmp", delete=False
+        )
+        try:
+            with tmp_file:
+                image.save(tmp_file, format="PNG")
+            os.replace(tmp_file.name, image_path)
+        except BaseException:
+            Path(tmp_file.name).unlink(missing_ok=True)
+            raise
+        return image_path
+
+    def index_bytes(self) -> int:
+        """Resident bytes of the indexes loaded in this process (estimated)."""
+        # Without the lock, which an ingestion holds throughout; copying the values
+        # of a dict is atomic
+        views = list(self._views.values())
+        return sum(
+            pdf_embedder.memory_estimate()["resident_bytes"] or 0
+            for pdf_embedder in views
+        )
+
+    def loaded_books(self) -> dict[str, EmbeddedPDF]:
+        """Books that currently have an EmbeddedPDF view in this process."""
+        with self._lock:
+            return dict(self._views)
@@ -0,0 +1,260 @@
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from collections.abc import Callable
+from contextlib import contextmanager
+
+from backend.config import (
+    INGEST_EMBED_BATCH_SIZE,
+    MEMORY_QUEUE_TIMEOUT_S,
+    MEMORY_SNAPSHOT_TOP,
+    PDF_TEXT_CHARS_PER_BYTE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rough per-object overheads, from sys.getsizeof on CPython 3.11
+_DOCUMENT_OVERHEAD_BYTES = 1024  # Document, its metadata dict and keys
+_PYTHON_FLOAT_BYTES = 32  # float object plus its list slot
+# Extra bytes per vector in Chroma's HNSW graph (M=16 links each way at layer 0)
+_HNSW_LINK_BYTES = 2 * 16 * 4 + 64
+
+_MB = 1024**2
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """Raised when an ingestion cannot get its memory within the queueing timeout."""
+
+
+def rss_bytes() -> int | None:
+    """Resident set size of this process, where the platform exposes it."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def start_tracing(frames: int = 1):
+    """Start tracemalloc, unless something else already has."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def traced_memory() -> dict | None:
+    """Python heap currently traced, and its peak, or None when not tracing."""
+    if not tracemalloc.is_tracing():
+        return None
+    current, peak = tracemalloc.get_traced_memory()
+    return {"current_bytes": current, "peak_bytes": peak}
+
+
+def text_bytes(text: str) -> int:
+    return sys.getsizeof(text)
+
+
+def estimate_ingestion_bytes(
+    pdf_bytes: int,
+    text_chars: int,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 500,
+    dim: int = 384,
+    batch_size: int = INGEST_EMBED_BATCH_SIZE,
+) -> int:
+    """
+    Rough peak memory of ingesting a book, beyond its parsed pages.
+
+    Overlapping chunks repeat the text chunk_size / (chunk_size - chunk_overlap)
+    times. The index holds a float32 vector and a Document per chunk. One embedding
+    batch is held as Python floats before it is converted. The PDF bytes are held
+    until they have been written to the library.
+    """
+    stride = max(chunk_size - chunk_overlap, 1)
+    chunks = text_chars // stride + 1
+    chunk_text = chunks * min(chunk_size, text_chars + 1)
+    index = chunks * (dim * 4 + _DOCUMENT_OVERHEAD_BYTES)
+    batch = min(chunks, batch_size) * dim * _PYTHON_FLOAT_BYTES
+    return pdf_bytes + chunk_text + index + batch
+
+
+def estimate_upload_bytes(
+    pdf_bytes: int, chars_per_byte: float = PDF_TEXT_CHARS_PER_BYTE
+) -> int:
+    """
+    Rough peak memory of parsing and ingesting a PDF, known only by its size.
+
+    The text is taken to be chars_per_byte times the size of the file. The parsed
+    pages hold it once, on top of what estimate_ingestion_bytes counts.
+    """
+    text_chars = int(pdf_bytes * chars_per_byte)
+    return text_chars + estimate_ingestion_bytes(pdf_bytes, text_chars)
+
+
+def index_memory(db, count: int | None = None, dim: int | None = None) -> dict:
+    """
+    Approximate bytes held by a vector index.
+
+    A FlatVectorIndex is measured directly; its vectors count as mapped rather than
+    resident when they are memory-mapped from disk, since the OS can drop those
+    pages at any time. For a Chroma collection, pass its chunk count and embedding
+    dimension; the estimate covers the HNSW graph it keeps in memory.
+    """
+    if db is None:
+        return {"chunks": 0, "resident_bytes": 0, "mapped_bytes": 0}
+
+    if hasattr(db, "mapped"):
+        texts = sum(
+            text_bytes(doc.page_content) + _DOCUMENT_OVERHEAD_BYTES
+            for doc in db.documents
+        )
+        vectors = db.nbytes
+        return {
+            "chunks": len(db),
+            "resident_bytes": texts + (0 if db.mapped else vectors),
+            "mapped_bytes": vectors if db.mapped else 0,
+        }
+
+    if count is None or dim is None:
+        return {"chunks": count, "resident_bytes": None, "mapped_bytes": 0}
+    return {
+        "chunks": count,
+        "resident_bytes": count * (dim * 4 + _HNSW_LINK_BYTES),
+        "mapped_bytes": 0,
+    }
+
+
+# The last few operations, for /metrics
+_recent_profiles: deque["StageMemory"] = deque(maxlen=10)
+
+
+class StageMemory:
+    """
+    Memory use at the stage boundaries of one operation, such as an ingestion.
+
+    Each mark records the resident set size of the process. While tracemalloc is
+    tracing, it also records the Python heap and its peak since the previous mark,
+    and logs the allocation sites that grew most since then. The peak is
+    process-wide, so concurrent operations inflate each other's peaks.
+    Finished operations are kept for /metrics.
+    """
+
+    def __init__(self, operation: str, top: int = MEMORY_SNAPSHOT_TOP):
+        self.operation = operation
+        self.top = top
+        self.stages: list[dict] = []
+        self._start = time.perf_counter()
+        self._snapshot = None
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            if self.top:
+                self._snapshot = tracemalloc.take_snapshot()
+        _recent_profiles.append(self)
+
+    def mark(self, stage: str):
+        """Record the end of a stage."""
+        record = {
+            "stage": stage,
+            "elapsed_s": round(time.perf_counter() - self._start, 3),
+            "rss_bytes": rss_bytes(),
+        }
+        message = f"{self.operation}: {stage}"
+        if record["rss_bytes"] is not None:
+            message += f", RSS {record['rss_bytes'] / _MB:.1f} MB"
+
+        traced = traced_memory()
+        if traced is not None:
+            record.update(
+                traced_bytes=traced["current_bytes"], peak_bytes=traced["peak_bytes"]
+            )
+            message += (
+                f", traced {traced['current_bytes'] / _MB:.1f} MB"
+                f" (peak {traced['peak_bytes'] / _MB:.1f} MB)"
+            )
+            tracemalloc.reset_peak()
+            if self._snapshot is not None:
+                snapshot = tracemalloc.take_snapshot()
+                growth = snapshot.compare_to(self._snapshot, "lineno")[: self.top]
+                record["top_growth"] = [str(stat) for stat in growth]
+                self._snapshot = snapshot
+
+        self.stages.append(record)
+        logger.info(message)
+        for line in record.get("top_growth", []):
+            logger.info(f"  {line}")
+
+    def as_dict(self) -> dict:
+        return {"operation": self.operation, "stages": list(self.stages)}
+
+
+def recent_profiles() -> list[dict]:
+    return [profile.as_dict() for profile in list(_recent_profiles)]
+
+
+class MemoryBudget:
+    """
+    Per-process memory budget for index memory and ingestions in progress.
+
+    An ingestion reserves its estimated peak (see estimate_upload_bytes) before
+    it starts. If the reservation does not fit next to the indexes already in
+    memory and the other reservations, it waits for memory to be released, and is
+    refused with MemoryBudgetExceeded after the timeout. A reservation larger than
+    the whole budget is refused at once.
+
+    Args:
+        limit_bytes (int | None): The budget; None only accounts, never refuses
+        resident (Callable[[], int]): Bytes currently held by loaded indexes
+    """
+
+    def __init__(self, limit_bytes: int | None, resident: Callable[[], int]):
+        self.limit_bytes = limit_bytes
+        self._resident = resident
+        self._condition = threading.Condition()
+        self._reserved = 0
+        self._counters = {"admitted": 0, "queued": 0, "refused": 0, "in_progress": 0}
+
+    def _fits(self, nbytes: int) -> bool:
+        if self.limit_bytes is None:
+            return True
+        return self._resident() + self._reserved + nbytes <= self.limit_bytes
+
+    @contextmanager
+    def reserve(self, nbytes: int, timeout: float = MEMORY_QUEUE_TIMEOUT_S):
+        """Hold nbytes of the budget for the duration of the block."""
+        with self._condition:
+            if self.limit_bytes is not None and nbytes > self.limit_bytes:
+                self._counters["refused"] += 1
+                raise MemoryBudgetExceeded(
+                    f"Needs about {nbytes / _MB:.0f} MB, more than the whole "
+                    f"{self.limit_bytes / _MB:.0f} MB budget"
+                )
+            if not self._fits(nbytes):
+                self._counters["queued"] += 1
+                if not self._condition.wait_for(lambda: self._fits(nbytes), timeout):
+                    self._counters["refused"] += 1
+                    raise MemoryBudgetExceeded(
+                        f"Not enough memory for about {nbytes / _MB:.0f} MB "
+                        f"within {timeout:.0f} s"
+                    )
+            self._reserved += nbytes
+            self._counters["admitted"] += 1
+            self._counters["in_progress"] += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._reserved -= nbytes
+                self._counters["in_progress"] -= 1
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "limit_bytes": self.limit_bytes,
+                "resident_bytes": self._resident(),
+                "reserved_bytes": self._reserved,
+                **self._counters,
+            }
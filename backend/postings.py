@@ -0,0 +1,88 @@
+import bisect
+import re
+
+from langchain_core.documents import Document
+
+from backend.prefetch import extract_names
+
+_WORD = re.compile(r"[^\W\d_]+")
+
+# Words that come before a name without identifying the character
+_TITLES = frozenset("mr mrs ms dr professor uncle aunt madam sir".split())
+
+
+def name_terms(name: str) -> list[str]:
+    """The lowercased words of a name, without titles ("Mr. Dursley" -> dursley)."""
+    return [
+        word
+        for word in (word.lower() for word in _WORD.findall(name))
+        if word not in _TITLES
+    ]
+
+
+class CharacterPostings:
+    """
+    For every word of a character name, the sorted positions of the chunks that
+    contain it.
+
+    Built from the chunks of an index in page order (see FlatVectorIndex), so that
+    the first and the most recent mentions below a page bound are found by bisecting
+    a list rather than by a similarity search.
+    """
+
+    def __init__(self, documents: list[Document]):
+        self._postings: dict[str, list[int]] = {}
+        # The words written before each family name ("dursley" -> dudley, vernon)
+        self._given: dict[str, set[str]] = {}
+        lowercase: set[str] = set()
+        for position, doc in enumerate(documents):
+            terms = set()
+            for name in extract_names(doc.page_content):
+                words = name_terms(name)
+                terms.update(words)
+                if len(words) == 2:
+                    self._given.setdefault(words[1], set()).add(words[0])
+            for term in terms:
+                self._postings.setdefault(term, []).append(position)
+            lowercase.update(w for w in _WORD.findall(doc.page_content) if w.islower())
+        # Capitalised ordinary words open sentences ("Even Dudley"), names never
+        # appear in lowercase
+        for given in self._given.values():
+            given -= lowercase
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def positions(self, name: str) -> list[int]:
+        """
+        Positions of the chunks mentioning a character.
+
+        Characters are mostly called by one of their names ("McGonagall", "Ron"),
+        so a chunk mentioning a single word of the name counts. A family name that
+        other characters share only counts next to the rest of the name: "Dudley
+        Dursley" matches "Dudley", and "Dursley" only together with "Dudley",
+        unless no chunk has them together.
+        """
+        terms = name_terms(name)
+        postings = [set(self._postings.get(term, [])) for term in terms]
+        if len(terms) > 1 and self._given.get(terms[-1], set()) - set(terms):
+            rows = set().union(*postings[:-1]) | set.intersection(*postings)
+            if rows:
+                return sorted(rows)
+        return sorted(set().union(*postings))
+
+    def mentions(
+        self, name: str, stop: int, first: int, recent: int
+    ) -> tuple[list[int], list[int]]:
+        """
+        The first and the most recent positions mentioning a character, below stop.
+
+        Returns:
+            tuple[list[int], list[int]]: Up to first earliest positions, and up to
+                recent latest positions not among them, both in order.
+        """
+        positions = self.positions(name)
+        end = bisect.bisect_left(positions, stop)
+        earliest = positions[: min(first, end)]
+        latest = positions[max(len(earliest), end - recent) : end]
+        return earliest, latest
@@ -0,0 +1,183 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from collections.abc import Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from backend.config import (
+    PREFETCH_BUDGET_S,
+    PREFETCH_LOOKBACK_PAGES,
+    PREFETCH_MAX_NAMES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Runs of capitalised words, optionally preceded by a title ("Mr. Dursley")
+_NAME_PATTERN = re.compile(
+    r"\b(?:(?:Mr|Mrs|Ms|Dr|Professor|Uncle|Aunt)\.?\s+)?"
+    r"[A-Z][a-z]+(?:[A-Z][a-z]+)*(?:\s+[A-Z][a-z]+(?:[A-Z][a-z]+)*)*"
+)
+
+# Capitalised words that are almost never names
+_NOT_NAMES = frozenset(
+    """
+    A An And As At But By Chapter For From He Her Here His How I If In It Its Just
+    My No Not Now Of Oh On Once One Or Our She So Some That The Their Then There
+    These They This Those To Two We Well What When Where Which While Who Why With
+    Yes Yet You Your
+    """.split()
+)
+
+# "Who is X?", "Tell me about X", ... - questions about a single character
+_CHARACTER_QUESTION = re.compile(
+    r"^(?:who(?:'s|\s+is|\s+was)|tell\s+me\s+(?:more\s+)?about|what\s+do\s+(?:we|i)"
+    r"\s+know\s+about|remind\s+me\s+(?:who|about))\s+(?:the\s+)?(.+?)[\s?.!]*$",
+    re.IGNORECASE,
+)
+
+
+def extract_names(text: str) -> list[str]:
+    """
+    Likely character names on a page, in order of first appearance.
+
+    A cheap capitalisation heuristic run at ingestion; it only has to be good enough
+    to guess what a reader may ask about next.
+    """
+    names = []
+    seen = set()
+    for match in _NAME_PATTERN.finditer(text):
+        name = match.group(0)
+        words = name.split()
+        while words and words[0] in _NOT_NAMES:
+            words = words[1:]
+        name = " ".join(words)
+        if len(name) > 2 and name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def character_query(message: str, known_names) -> str:
+    """
+    Reduce a question about a single known character to the character's name.
+
+    "Who is Hagrid?" then retrieves with the same query as the character analysis
+    and the prefetcher use, and hits their cached results. Other messages are
+    returned unchanged.
+    """
+    match = _CHARACTER_QUESTION.match(message.strip())
+    if match is None:
+        return message
+    subject = match.group(1).lower()
+    for name in known_names:
+        if name.lower() == subject:
+            return name
+    return message
+
+
+def rank_recent_names(page_names: list[list[str]], current_page: int, lookback: int):
+    """
+    Names from the lookback pages up to current_page (1-indexed), most frequent
+    first and, among equals, most recently seen first.
+    """
+    recent = page_names[max(0, current_page - lookback) : current_page]
+    counts = Counter(name for names in recent for name in names)
+    last_seen = {}
+    for index, names in enumerate(recent):
+        for name in names:
+            last_seen[name] = index
+    return sorted(counts, key=lambda name: (-counts[name], -last_seen[name]))
+
+
+class Prefetcher:
+    """
+    Warms retrieval caches for characters the reader has just met.
+
+    When a session's page advances, the names found on the last few pages are
+    searched in the background, so that a question about one of them is answered
+    from the retrieval and query-embedding caches. Prefetching runs on a single
+    thread, gives way while foreground searches are running, stops after a time
+    budget, and is abandoned as soon as the same session moves on again.
+    """
+
+    def __init__(
+        self,
+        lookback_pages: int = PREFETCH_LOOKBACK_PAGES,
+        max_names: int = PREFETCH_MAX_NAMES,
+        budget_s: float = PREFETCH_BUDGET_S,
+    ):
+        self.lookback_pages = lookback_pages
+        self.max_names = max_names
+        self.budget_s = budget_s
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="prefetch"
+        )
+        self._lock = threading.Lock()
+        # Latest request per session; older requests stop when they see a newer one
+        self._latest: dict[Hashable, int] = {}
+        self._counters = {
+            "scheduled": 0,
+            "searches": 0,
+            "already_cached": 0,
+            "superseded": 0,
+            "budget_exhausted": 0,
+            "errors": 0,
+        }
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def schedule(self, session: Hashable, pdf_embedder, current_page: int) -> Future:
+        """Prefetch for a session that has just reached current_page."""
+        with self._lock:
+            generation = self._latest.get(session, 0) + 1
+            self._latest[session] = generation
+            self._counters["scheduled"] += 1
+        return self._executor.submit(
+            self._run, session, generation, pdf_embedder, current_page
+        )
+
+    def forget(self, session: Hashable):
+        """Drop a finished session; its pending prefetches are abandoned."""
+        with self._lock:
+            self._latest.pop(session, None)
+
+    def _is_current(self, session: Hashable, generation: int) -> bool:
+        with self._lock:
+            return self._latest.get(session) == generation
+
+    def _run(self, session, generation: int, pdf_embedder, current_page: int):
+        deadline = time.monotonic() + self.budget_s
+        names = pdf_embedder.recent_names(current_page, self.lookback_pages)
+        k = pdf_embedder.num_return_chunks
+
+        for name in names[: self.max_names]:
+            if not self._is_current(session, generation):
+                self._count("superseded")
+                return
+            # Give way to searches that someone is waiting for
+            while (
+                pdf_embedder.search_flight.in_flight() and time.monotonic() < deadline
+            ):
+                time.sleep(0.05)
+            if time.monotonic() >= deadline:
+                self._count("budget_exhausted")
+                return
+
+            if pdf_embedder.is_search_cached(name, k, current_page=current_page):
+                self._count("already_cached")
+                continue
+            try:
+                pdf_embedder.semantic_search(name, k=k, current_page=current_page)
+                self._count("searches")
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"Prefetch for {name!r} failed: {e!r}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "sessions": len(self._latest)}
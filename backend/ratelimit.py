@@ -0,0 +1,53 @@
+import multiprocessing
+import time
+
+# Positions in the shared state array
+_TOKENS, _UPDATED, _CALLS, _WAITED = range(4)
+
+
+class RateLimiter:
+    """
+    Token bucket allowing rate calls per second, in bursts of up to burst calls.
+
+    The bucket lives in shared memory behind a process lock, so one limiter handed to
+    worker processes (for example through a ProcessPoolExecutor initializer) limits
+    all of them together, as well as their threads. time.monotonic is system-wide,
+    so the processes agree on the time.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0, context=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        context = context or multiprocessing.get_context()
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._lock = context.Lock()
+        self._state = context.RawArray("d", [self.burst, time.monotonic(), 0, 0])
+
+    def acquire(self) -> float:
+        """Wait for a call to be allowed; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._state[_UPDATED]
+                tokens = min(self.burst, self._state[_TOKENS] + elapsed * self.rate)
+                self._state[_UPDATED] = now
+                if tokens >= 1:
+                    self._state[_TOKENS] = tokens - 1
+                    self._state[_CALLS] += 1
+                    self._state[_WAITED] += waited
+                    return waited
+                self._state[_TOKENS] = tokens
+                delay = (1 - tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "calls": int(self._state[_CALLS]),
+                "waited_s": self._state[_WAITED],
+            }
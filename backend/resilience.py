@@ -0,0 +1,407 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any
+
+from backend.config import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT_S,
+    LLM_BACKOFF_BASE_S,
+    LLM_BACKOFF_MAX_S,
+    LLM_HEDGE_MIN_DELAY_S,
+    LLM_HEDGE_REQUESTS,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_TIMEOUT_S,
+)
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# How often a waiting call checks whether it has been cancelled
+CANCEL_POLL_INTERVAL_S = 0.05
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is rejected because the circuit breaker is open."""
+
+
+class CallCancelledError(RuntimeError):
+    """Raised when a call is abandoned because its caller no longer needs the result."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Decide whether a failed provider call is worth retrying.
+
+    HTTP errors are retried only for throttling and server-side status codes; other
+    HTTP errors (bad request, auth) will fail the same way again. Timeouts and
+    connection errors are always retried.
+    """
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+
+    return isinstance(error, (TimeoutError, ConnectionError, OSError))
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the provider is unhealthy.
+
+    After failure_threshold consecutive failures the breaker opens and rejects calls
+    for reset_timeout seconds. It then lets a single trial call through (half-open);
+    success closes the breaker again and failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT_S,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and self._clock() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Raise CircuitOpenError if a call should not be attempted right now.
+
+        Returns:
+            bool: Whether the call is the half-open trial, whose outcome must be
+                recorded, or handed back with release_trial.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return False
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+
+            self.rejected += 1
+            raise CircuitOpenError("Inference provider is unavailable (circuit open)")
+
+    def release_trial(self):
+        """Let another call be the trial, after the trial was abandoned unfinished."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            state = self._current_state()
+            if (
+                state == self.HALF_OPEN
+                or self._consecutive_failures >= self.failure_threshold
+            ):
+                if state != self.OPEN:
+                    self.times_opened += 1
+                    logger.warning("Circuit breaker opened")
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._consecutive_failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+class LatencyTracker:
+    """Keeps a window of recent successful call latencies."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        """Return the q-th percentile (0-100) or None if there are no samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class ResilientCaller:
+    """
+    Wraps blocking provider calls with deadlines, retries, hedging and a circuit breaker.
+
+    Each attempt runs on a worker thread and is abandoned once its deadline passes, so
+    a stuck request never holds the caller. Retryable failures are retried with
+    exponential backoff and full jitter. With hedging enabled, a second identical
+    request is fired if the first has not answered within the recent p95 latency and
+    whichever finishes first wins. A bounded semaphore caps the number of requests in
+    flight to the provider: each attempt takes a slot, shared with its hedge, and an
+    abandoned request keeps running on its thread, and holds the slot, until it
+    finishes.
+
+    Callers can pass a threading.Event as cancel. Once it is set the call stops
+    waiting for a concurrency slot, a backoff or an in-flight request and raises
+    CallCancelledError. Cancellation is not counted as a failure.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = LLM_TIMEOUT_S,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE_S,
+        backoff_max: float = LLM_BACKOFF_MAX_S,
+        hedge: bool = LLM_HEDGE_REQUESTS,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY_S,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Room for one request and its hedge per slot
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency * 2, thread_name_prefix=f"{name}-call"
+        )
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "cancelled": 0,
+        }
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def hedge_delay(self) -> float:
+        """Delay after which a hedged request is sent: the recent p95, floored."""
+        p95 = self.latency.percentile(95) if len(self.latency) >= 20 else None
+        return max(self.hedge_min_delay, p95 or 0.0)
+
+    def call(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        cancel: threading.Event | None = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Call fn(*args, **kwargs) under the resilience policy.
+
+        Args:
+            fn (Callable): The blocking provider call.
+            cancel (threading.Event | None): Abandons the call once set.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            TimeoutError: If the final attempt exceeded its deadline.
+            CallCancelledError: If cancel was set before the call finished.
+        """
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            trial = self.breaker.allow()
+            try:
+                self._acquire_slot(cancel)
+                result = self._attempt(fn, args, kwargs, cancel)
+            except CallCancelledError:
+                # The trial's outcome is unknown, so the next call has to find out
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # The provider answered, so it is healthy; the request itself
+                    # was at fault
+                    self.breaker.record_success()
+                    self._count("failures")
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                delay = random.uniform(
+                    0, min(self.backoff_max, self.backoff_base * 2**attempt)
+                )
+                logger.warning(
+                    f"{self.name} call failed ({e!r}), retrying in {delay:.2f}s"
+                )
+                # record_failure has ended any trial, so nothing is left to release
+                if cancel is None:
+                    time.sleep(delay)
+                elif cancel.wait(delay):
+                    raise self._cancelled()
+            else:
+                self.breaker.record_success()
+                self._count("successes")
+                return result
+
+    def _cancelled(self) -> CallCancelledError:
+        self._count("cancelled")
+        return CallCancelledError(f"{self.name} call cancelled")
+
+    def _acquire_slot(self, cancel: threading.Event | None):
+        if cancel is None:
+            self._slots.acquire()
+            return
+        while not self._slots.acquire(timeout=CANCEL_POLL_INTERVAL_S):
+            if cancel.is_set():
+                raise self._cancelled()
+
+    def _release_slot_after(self, futures: set[Future]):
+        """
+        Release a concurrency slot once none of futures is running any more.
+
+        Futures that have not started are cancelled. Python threads cannot be
+        stopped, so the slot of a running request is released by a done-callback.
+        """
+        running = [future for future in futures if not future.cancel()]
+        if not running:
+            self._slots.release()
+            return
+        remaining = len(running)
+        lock = threading.Lock()
+
+        def finished(_future: Future):
+            nonlocal remaining
+            with lock:
+                remaining -= 1
+                last = remaining == 0
+            if last:
+                self._slots.release()
+
+        for future in running:
+            future.add_done_callback(finished)
+
+    def _attempt(
+        self,
+        fn: Callable[..., Any],
+        args: tuple,
+        kwargs: dict,
+        cancel: threading.Event | None = None,
+    ) -> Any:
+        """One request, and maybe its hedge, under a slot the caller has acquired."""
+        pending: set[Future] = set()
+        try:
+            start = time.monotonic()
+            deadline = start + self.timeout
+            hedge_at = start + self.hedge_delay() if self.hedge else None
+            primary = self._executor.submit(fn, *args, **kwargs)
+            pending.add(primary)
+
+            error: BaseException | None = None
+            while pending:
+                if cancel is not None and cancel.is_set():
+                    # The requests finish in the background; nobody waits for them
+                    raise self._cancelled()
+
+                now = time.monotonic()
+                if now >= deadline:
+                    # Abandon the stuck requests; they finish in the background
+                    self._count("timeouts")
+                    raise TimeoutError(
+                        f"{self.name} call exceeded {self.timeout:.1f}s deadline"
+                    )
+
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    self._count("hedges")
+                    pending.add(self._executor.submit(fn, *args, **kwargs))
+
+                wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+                timeout = wake_at - now
+                if cancel is not None:
+                    timeout = min(timeout, CANCEL_POLL_INTERVAL_S)
+                done, pending = wait(
+                    pending, timeout=timeout, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            self._count("hedge_wins")
+                        self.latency.record(time.monotonic() - start)
+                        return future.result()
+                    error = future.exception()
+
+            raise error
+        finally:
+            # Abandoned requests, and a losing hedge, keep the slot until they end
+            self._release_slot_after(pending)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "p95_latency_s": self.latency.percentile(95),
+            "circuit": self.breaker.stats(),
+        }
+
+
+# Shared by every caller of the inference provider so that they trip one breaker
+inference_caller = ResilientCaller("inference")
@@ -0,0 +1,174 @@
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from backend.config import SESSION_DB_PATH, SESSION_MAX_AGE_S
+
+_SESSION_ID = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    book_id TEXT,
+    current_page INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, id);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def session_id_or_new(candidate: str | None) -> str:
+    """The client's session ID if it is well-formed, otherwise a fresh one."""
+    if candidate and _SESSION_ID.fullmatch(candidate):
+        return candidate
+    return uuid.uuid4().hex
+
+
+class SessionStore:
+    """
+    Sessions and their conversations, in SQLite so that all workers share them.
+
+    The database runs in WAL mode, so readers in any process never block the one
+    writer, and every thread keeps its own connection. A chat turn is written in a
+    single transaction, so a worker that dies mid-reply leaves no half turn behind.
+    Sessions idle for longer than SESSION_MAX_AGE_S are pruned when the store opens.
+    """
+
+    def __init__(
+        self, path: str | Path = SESSION_DB_PATH, max_age_s: float = SESSION_MAX_AGE_S
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+        self.prune(max_age_s)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def history(self, session_id: str) -> list[dict]:
+        """The session's conversation, oldest message first."""
+        rows = self._connection().execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,),
+        )
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, session_id: str, messages: list[dict]):
+        """Add a finished turn to the session's conversation."""
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                [(session_id, m["role"], m["content"]) for m in messages],
+            )
+            self._touch(conn, session_id)
+
+    def clear(self, session_id: str):
+        """Forget a session's conversation."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+    def position(self, session_id: str) -> tuple[str | None, int] | None:
+        """The book and page a session was last seen on, or None."""
+        return (
+            self._connection()
+            .execute(
+                "SELECT book_id, current_page FROM sessions WHERE session_id = ?",
+                (session_id,),
+            )
+            .fetchone()
+        )
+
+    def set_position(self, session_id: str, book_id: str | None, current_page: int):
+        """Record a session's page; without a book_id its book is kept."""
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id, book_id, current_page, updated_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (session_id) DO UPDATE SET "
+                "book_id = COALESCE(excluded.book_id, book_id), "
+                "current_page = excluded.current_page, "
+                "updated_at = excluded.updated_at",
+                (session_id, book_id, current_page, time.time()),
+            )
+
+    @staticmethod
+    def _touch(conn: sqlite3.Connection, session_id: str):
+        conn.execute(
+            "INSERT INTO sessions (session_id, updated_at) VALUES (?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (session_id, time.time()),
+        )
+
+    def active_book(self, session_id: str | None = None) -> str | None:
+        """
+        The book a session last selected or read, or else the default book: the
+        one most recently uploaded or selected without a session, by any worker.
+        """
+        conn = self._connection()
+        if session_id is not None:
+            row = conn.execute(
+                "SELECT book_id FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row and row[0] is not None:
+                return row[0]
+        row = conn.execute(
+            "SELECT value FROM settings WHERE key = 'active_book_id'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_active_book(self, book_id: str, session_id: str | None = None):
+        """
+        Select a book for one session, starting it on page 0 if it is another
+        book. Without a session, or while there is none, the book becomes the
+        default of every session that has not chosen one.
+        """
+        with self._connection() as conn:
+            if session_id is not None:
+                conn.execute(
+                    "INSERT INTO sessions (session_id, book_id, updated_at) "
+                    "VALUES (?, ?, ?) ON CONFLICT (session_id) DO UPDATE SET "
+                    "current_page = CASE WHEN book_id IS excluded.book_id "
+                    "THEN current_page ELSE 0 END, "
+                    "book_id = excluded.book_id, updated_at = excluded.updated_at",
+                    (session_id, book_id, time.time()),
+                )
+            default = (
+                "INSERT OR IGNORE" if session_id is not None else "INSERT OR REPLACE"
+            )
+            conn.execute(
+                f"{default} INTO settings (key, value) VALUES ('active_book_id', ?)",
+                (book_id,),
+            )
+
+    def prune(self, max_age_s: float) -> int:
+        """Delete sessions idle for longer than max_age_s; returns how many."""
+        cutoff = time.time() - max_age_s
+        with self._connection() as conn:
+            stale = "SELECT session_id FROM sessions WHERE updated_at < ?"
+            conn.execute(
+                f"DELETE FROM messages WHERE session_id IN ({stale})", (cutoff,)
+            )
+            return conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (cutoff,)
+            ).rowcount
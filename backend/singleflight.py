@@ -0,0 +1,100 @@
+import threading
+from collections.abc import Callable, Hashable
+from typing import Any
+
+
+def normalize_query(query: str) -> str:
+    """Normalise a free-text query so that trivially different phrasings share a key."""
+    return " ".join(query.lower().split())
+
+
+class _InFlightCall:
+    """A call that is currently running on behalf of one or more callers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls so that only one of them runs.
+
+    The first caller for a key executes the function; callers that arrive with the
+    same key while it is still running wait for it and receive the same result (or
+    the same exception). Nothing is kept once the call finishes, so there is no
+    staleness - a later call with the same key runs again.
+
+    Exceptions listed in private_errors belong to the leader alone (for example its
+    caller cancelled the call); waiters then run the call again instead of sharing
+    them.
+    """
+
+    def __init__(
+        self, name: str = "", private_errors: tuple[type[BaseException], ...] = ()
+    ):
+        self.name = name
+        self.private_errors = private_errors
+        self._lock = threading.Lock()
+        self._in_flight: dict[Hashable, _InFlightCall] = {}
+
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) unless an identical call is already in flight.
+
+        Args:
+            key (Hashable): Identity of the call. Calls with equal keys are coalesced.
+            fn (Callable): The function to run.
+
+        Returns:
+            Any: The result of the (possibly shared) call.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._in_flight[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            call.done.wait()
+            if isinstance(call.error, self.private_errors):
+                return self.do(key, fn, *args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running."""
+        with self._lock:
+            return len(self._in_flight)
+
+    def stats(self) -> dict:
+        """Counters describing how much work has been coalesced."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+            }
@@ -1,4 +1,5 @@
 import json
+from email.utils import formatdate, parsedate_to_datetime
 
 
 def parse_websocket_message(data: str):
@@ -8,10 +9,41 @@ def parse_websocket_message(data: str):
     user_message = message_data.get("content", "").strip()
     current_page = message_data.get("current_page", 1)
     total_pages = message_data.get("total_pages", 1)
+    book_id = message_data.get("book_id")
+    use_cache = message_data.get("use_cache", True) is not False
 
     return {
         "type": message_type,
         "content": user_message,
         "current_page": current_page,
         "total_pages": total_pages,
+        "book_id": book_id,
+        "use_cache": use_cache,
     }
+
+
+def http_date(timestamp: float) -> str:
+    """Format a Unix timestamp for Last-Modified and similar headers."""
+    return formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(headers, etag: str, last_modified: float) -> bool:
+    """
+    Whether a conditional GET can be answered with 304 Not Modified.
+
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 9110.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+
+    return False
@@ -1,9 +1,34 @@
 # %%
+"""
+First-mention evaluation harness for the RAG pipeline.
+
+For every configuration (chunk size, k, retrieval mode) this script:
+  * reuses a cached Chroma index for the book, building it only on the first run,
+  * asks get_character_first_mention for every character concurrently,
+  * records or replays LLM responses and query embeddings through a cassette file,
+    so that replayed runs are deterministic and need no network access,
+  * reports accuracy alongside per-stage latency.
+
+Usage:
+    python experiments/RAG_evaluation.py --chunk-sizes 500 1000 --ks 20 50 \\
+        --modes similarity mmr --cassette experiments/cassettes/first_mention.json
+    python experiments/RAG_evaluation.py --cassette ... --replay   # offline
+"""
+
+import argparse
+import hashlib
+import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from langchain.document_loaders import PyPDFLoader
+from types import SimpleNamespace
+
+import numpy as np
 import pandas as pd
+from langchain.document_loaders import PyPDFLoader
 from tqdm import tqdm
 
 # Change to project root directory
@@ -11,54 +36,316 @@ project_root = Path(__file__).parent.parent
 os.chdir(project_root)
 sys.path.insert(0, str(project_root))
 
+from backend.config import (  # noqa: E402
+    DEDUPLICATE_CHUNKS,
+    EMBEDDING_MODEL_ID,
+    STRIP_BOILERPLATE,
+)
 from backend.RAG import EmbeddedPDF  # noqa: E402
 
-# %%
-# Embed the book
-
 DATA_PATH = "backend/data/books"
-book = "Harry-Potter-and-the-Philosophers-Stone"
-loader = PyPDFLoader(DATA_PATH + "/" + book + ".pdf")
-pages = loader.load()
-
-pdf_embedder = EmbeddedPDF()
-pdf_embedder.embed_pdf(pages)
-# %%
-# Load the character data
-df = pd.read_csv(
+BOOK = "Harry-Potter-and-the-Philosophers-Stone"
+CHARACTERS_CSV = (
     "experiments/first_meet_evaluation_data/HP_character_analysis_manual.csv"
 )
-data = df[["Character", "First_Appearance"]]
+INDEX_CACHE_DIR = Path("experiments/.cache/indexes")
 
-# %% [markdown]
-### Evaluate the RAG first meet analysis
-# %%
 
-results = []
-for character in tqdm(data["Character"]):
-    # LLM page number
-    llm_page = pdf_embedder.get_character_first_mention(character)
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+class Cassette:
+    """
+    Records LLM responses and query embeddings to a JSON file and replays them.
+
+    In record mode, requests that are already on the cassette are replayed and new
+    ones are forwarded and stored. In replay mode, unknown requests raise CassetteMiss.
+    """
+
+    def __init__(self, path: str | Path, replay: bool = False):
+        self.path = Path(path)
+        self.replay = replay
+        self._lock = threading.Lock()
+        self._entries = {"chat": {}, "embeddings": {}}
+        if self.path.exists():
+            self._entries.update(json.loads(self.path.read_text()))
+
+    @staticmethod
+    def key(payload) -> str:
+        return hashlib.sha256(
+            json.dumps(payload, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def lookup(self, kind: str, payload, fetch):
+        key = self.key(payload)
+        with self._lock:
+            if key in self._entries[kind]:
+                return self._entries[kind][key]
+        if self.replay:
+            raise CassetteMiss(f"No recorded {kind} response for request {key[:12]}")
+
+        value = fetch()
+        with self._lock:
+            self._entries[kind][key] = value
+        return value
+
+    def save(self):
+        if self.replay:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self._entries))
+
+
+class CassetteChatClient:
+    """Drop-in for InferenceClient exposing chat.completions.create via a cassette."""
+
+    def __init__(self, client, cassette: Cassette):
+        self._client = client
+        self._cassette = cassette
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        def fetch():
+            response = self._client.chat.completions.create(**kwargs)
+            return response.choices[0].message.content or ""
+
+        content = self._cassette.lookup("chat", kwargs, fetch)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class CassetteEmbeddings:
+    """Wraps an embedding function so that query embeddings go through a cassette."""
+
+    def __init__(self, embeddings, cassette: Cassette):
+        self._embeddings = embeddings
+        self._cassette = cassette
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._cassette.lookup(
+            "embeddings",
+            {"model": EMBEDDING_MODEL_ID, "text": text},
+            lambda: list(self._embeddings.embed_query(text)),
+        )
+
+
+class StageTimer:
+    """Accumulates wall-clock time per stage for the calling thread."""
+
+    def __init__(self):
+        self._local = threading.local()
 
-    # Get actual page number
-    actual_page = data[data["Character"] == character]["First_Appearance"].iloc[0]
+    def reset(self):
+        self._local.stages = {}
 
-    # Store results
-    results.append(
-        {
+    def stages(self) -> dict:
+        return dict(getattr(self._local, "stages", {}))
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stages = self._local.__dict__.setdefault("stages", {})
+                stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - start
+
+        return timed
+
+
+def index_cache_dir(
+    pdf_path: str, chunk_size: int, chunk_overlap: int, strategy: str = "recursive"
+) -> Path:
+    """Cache location for a book indexed with the given chunking parameters."""
+    with open(pdf_path, "rb") as f:
+        book_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+    key = (
+        f"{EMBEDDING_MODEL_ID}|{strategy}|{chunk_size}|{chunk_overlap}"
+        f"|{STRIP_BOILERPLATE}|{DEDUPLICATE_CHUNKS}"
+    )
+    params_hash = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+    return INDEX_CACHE_DIR / (
+        f"{book_hash}-{strategy}-{chunk_size}-{chunk_overlap}-{params_hash}"
+    )
+
+
+def build_embedder(
+    pdf_path: str,
+    chunk_size: int,
+    k: int,
+    retrieval_mode: str,
+    cassette: Cassette,
+    replay: bool,
+    chunk_overlap: int | None = None,
+    strategy: str = "recursive",
+) -> tuple[EmbeddedPDF, dict]:
+    """
+    Create an EmbeddedPDF for one configuration, reusing a cached index if present.
+
+    Returns the embedder and the index metadata: total_pages, chunk count, the time
+    the index originally took to build (ingest_s) and how long this call took to
+    make it available (load_s).
+    """
+    if chunk_overlap is None:
+        chunk_overlap = chunk_size // 2
+    pdf_embedder = EmbeddedPDF(
+        num_return_chunks=k,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        chunking_strategy=strategy,
+        retrieval_mode=retrieval_mode,
+    )
+    pdf_embedder.embedding_function = CassetteEmbeddings(
+        pdf_embedder.embedding_function, cassette
+    )
+    pdf_embedder.client = CassetteChatClient(pdf_embedder.client, cassette)
+
+    cache_dir = index_cache_dir(pdf_path, chunk_size, chunk_overlap, strategy)
+    meta_path = cache_dir / "meta.json"
+
+    start = time.perf_counter()
+    if meta_path.exists():
+        meta = json.loads(meta_path.read_text())
+        pdf_embedder.load_index(str(cache_dir), meta["total_pages"])
+    elif replay:
+        raise FileNotFoundError(
+            f"No cached index at {cache_dir}; run once without --replay to build it"
+        )
+    else:
+        pages = PyPDFLoader(pdf_path).load()
+        result = pdf_embedder.embed_pdf(pages, persist_directory=str(cache_dir))
+        if not result["success"]:
+            raise RuntimeError(f"Embedding failed: {result['error']}")
+        meta = {
+            "total_pages": len(pages),
+            "chunks": index_chunk_count(pdf_embedder),
+            "ingest_s": time.perf_counter() - start,
+        }
+        meta_path.write_text(json.dumps(meta))
+
+    return pdf_embedder, {**meta, "load_s": time.perf_counter() - start}
+
+
+def index_chunk_count(pdf_embedder: EmbeddedPDF) -> int:
+    """Number of chunks in the embedder's index."""
+    if hasattr(pdf_embedder.db, "_collection"):
+        return pdf_embedder.db._collection.count()
+    return len(pdf_embedder.db)
+
+
+def evaluate_configuration(
+    pdf_embedder: EmbeddedPDF, data: pd.DataFrame, concurrency: int
+) -> pd.DataFrame:
+    """Run the first-mention task for every character, concurrently."""
+    timer = StageTimer()
+    pdf_embedder.semantic_search = timer.wrap("retrieval", pdf_embedder.semantic_search)
+    pdf_embedder._complete = timer.wrap("generation", pdf_embedder._complete)
+
+    def run(character: str, actual_page: int) -> dict:
+        timer.reset()
+        start = time.perf_counter()
+        llm_page = pdf_embedder.get_character_first_mention(character)
+        total = time.perf_counter() - start
+        stages = timer.stages()
+
+        return {
             "Character": character,
             "Actual_Page": actual_page,
             "LLM_Page": llm_page,
             "Correct": llm_page == actual_page if llm_page else False,
+            "retrieval_s": stages.get("retrieval", 0.0),
+            "generation_s": stages.get("generation", 0.0),
+            "total_s": total,
         }
-    )
 
-    print(
-        f"{character}: Actual={actual_page}, LLM={llm_page}, Correct={llm_page == actual_page if llm_page else False}"
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run, row.Character, row.First_Appearance)
+            for row in data.itertuples()
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            results.append(future.result())
+
+    return pd.DataFrame(results).sort_values("Character").reset_index(drop=True)
+
+
+def summarise(
+    results: pd.DataFrame, config: dict, ingest_s: float, load_s: float
+) -> dict:
+    """
+    Accuracy and latency percentiles for one configuration, with the time its index
+    took to build (ingest_s) and to load in this run (load_s).
+    """
+    summary = {
+        **config,
+        "accuracy": float(results["Correct"].mean()),
+        "ingest_s": ingest_s,
+        "load_s": load_s,
+    }
+    for stage in ("retrieval_s", "generation_s", "total_s"):
+        values = results[stage].to_numpy()
+        summary[f"{stage[:-2]}_p50_s"] = float(np.percentile(values, 50))
+        summary[f"{stage[:-2]}_p95_s"] = float(np.percentile(values, 95))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1000])
+    parser.add_argument("--ks", type=int, nargs="+", default=[50])
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=["similarity"],
+        choices=EmbeddedPDF.RETRIEVAL_MODES,
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--cassette", default="experiments/cassettes/first_mention.json"
+    )
+    parser.add_argument(
+        "--replay", action="store_true", help="Replay the cassette without network"
     )
+    parser.add_argument("--output", default="experiments/results/rag_evaluation.csv")
+    args = parser.parse_args()
+
+    pdf_path = f"{DATA_PATH}/{BOOK}.pdf"
+    data = pd.read_csv(CHARACTERS_CSV)[["Character", "First_Appearance"]]
+    cassette = Cassette(args.cassette, replay=args.replay)
+
+    summaries = []
+    try:
+        for chunk_size in args.chunk_sizes:
+            for k in args.ks:
+                for mode in args.modes:
+                    config = {"chunk_size": chunk_size, "k": k, "retrieval_mode": mode}
+                    print(f"\nEvaluating {config}")
+                    pdf_embedder, meta = build_embedder(
+                        pdf_path, chunk_size, k, mode, cassette, args.replay
+                    )
+                    results = evaluate_configuration(
+                        pdf_embedder, data, args.concurrency
+                    )
+                    print(results.to_string(index=False))
+                    summaries.append(
+                        summarise(results, config, meta["ingest_s"], meta["load_s"])
+                    )
+    finally:
+        cassette.save()
+
+    summary_df = pd.DataFrame(summaries)
+    print("\nSummary:")
+    print(summary_df.to_string(index=False))
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    summary_df.to_csv(args.output, index=False)
 
-# Convert to DataFrame for easy analysis
-results_df = pd.DataFrame(results)
-print("\nSummary:")
-print(results_df)
 
 # %%
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# %%
+"""
+Compare the retrieval for character analyses: multi-probe against one large search.
+
+For every character of HP_character_analysis_manual.csv, at the end of the book
+and at random page bounds after its first appearance, it builds the analysis
+context both ways and reports:
+  * whether the context holds the character's first-appearance page,
+  * whether it holds the last page before the bound that names the character
+    (a plain word match on the page text),
+  * context tokens and p50/p95 retrieval latency.
+
+No LLM calls are made. The hashing embedding backend runs offline; use
+--embeddings remote or local for meaningful similarity hits.
+
+Usage:
+    python experiments/analysis_probes_benchmark.py
+    python experiments/analysis_probes_benchmark.py --embeddings remote --k 50
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Change to project root directory
+project_root = Path(__file__).parent.parent
+os.chdir(project_root)
+sys.path.insert(0, str(project_root))
+
+from backend.RAG import EmbeddedPDF, estimate_tokens, pdf_bytes_to_langchain_doc  # noqa: E402
+from backend.embeddings import EMBEDDING_BACKENDS  # noqa: E402
+from backend.postings import name_terms  # noqa: E402
+
+BOOK = "backend/data/books/Harry-Potter-and-the-Philosophers-Stone.pdf"
+CHARACTERS_CSV = (
+    "experiments/first_meet_evaluation_data/HP_character_analysis_manual.csv"
+)
+
+
+def cited_pages(context: str) -> set[int]:
+    return {int(page) for page in re.findall(r"\[Page (\d+)\]", context)}
+
+
+def last_mention(texts: list[str], name: str, page_limit: int) -> int | None:
+    """The last page (1-indexed) below page_limit whose text names the character."""
+    words = [
+        re.compile(rf"\b{re.escape(term)}\b", re.IGNORECASE)
+        for term in name_terms(name)
+    ]
+    for page in range(page_limit - 1, -1, -1):
+        if any(word.search(texts[page]) for word in words):
+            return page + 1
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--embeddings", default="hashing", choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--k", type=int, default=50, help="k of the single search")
+    parser.add_argument(
+        "--bounds", type=int, default=5, help="Random page bounds per character"
+    )
+    parser.add_argument(
+        "--output", default="experiments/results/analysis_probes_benchmark.csv"
+    )
+    args = parser.parse_args()
+
+    pages = pdf_bytes_to_langchain_doc(Path(BOOK).read_bytes(), Path(BOOK).name)
+    texts = [page.page_content for page in pages]
+    pdf_embedder = EmbeddedPDF(
+        index_backend="flat",
+        embedding_backend=args.embeddings,
+        num_return_chunks=args.k,
+    )
+    pdf_embedder.embed_pdf(pages)
+
+    rng = np.random.default_rng(0)
+    data = pd.read_csv(CHARACTERS_CSV)
+    searches = []
+    for row in data.itertuples():
+        bounds = rng.integers(
+            row.First_Appearance, len(pages), size=args.bounds
+        ).tolist()
+        searches += [
+            (row.Character, row.First_Appearance, b) for b in bounds + [len(pages)]
+        ]
+
+    retrievals = {
+        "single search": lambda name, page: pdf_embedder.semantic_search(
+            name, k=args.k, current_page=page
+        ),
+        "probes": lambda name, page: pdf_embedder.character_context(
+            name, current_page=page
+        ),
+    }
+    rows = []
+    for method, retrieve in retrievals.items():
+        pdf_embedder.retrieval_cache.clear()
+        results = []
+        for name, first_page, page_limit in searches:
+            start = time.perf_counter()
+            context = retrieve(name, page_limit)
+            seconds = time.perf_counter() - start
+            pages_in_context = cited_pages(context)
+            results.append(
+                {
+                    "first": first_page in pages_in_context,
+                    "recent": last_mention(texts, name, page_limit) in pages_in_context,
+                    "tokens": estimate_tokens(context),
+                    "seconds": seconds,
+                }
+            )
+        results = pd.DataFrame(results)
+        rows.append(
+            {
+                "retrieval": method,
+                "first_appearance_found": results["first"].mean(),
+                "last_mention_found": results["recent"].mean(),
+                "context_tokens": results["tokens"].mean(),
+                "p50_ms": 1000 * results["seconds"].quantile(0.5),
+                "p95_ms": 1000 * results["seconds"].quantile(0.95),
+            }
+        )
+
+    summary_df = pd.DataFrame(rows)
+    print(f"\n{len(searches)} analyses:")
+    print(summary_df.to_string(index=False, float_format="%.3f"))
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    summary_df.to_csv(args.output, index=False)
+
+
+# %%
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# %%
+"""
+Sweep chunking strategies, chunk sizes and overlaps on the bundled book.
+
+For every (strategy, chunk_size, chunk_overlap) combination it builds, or reuses,
+a cached index and reports:
+  * chunk count, ingestion time and on-disk index bytes,
+  * p50/p95 retrieval latency of semantic_search over the evaluation characters,
+  * first-mention accuracy against HP_character_analysis_manual.csv (unless
+    --retrieval-only is given, in which case no LLM calls are made).
+
+LLM responses and query embeddings go through the same cassette as RAG_evaluation.py.
+The "page" strategy ignores chunk size and overlap, so it is evaluated only once.
+
+Usage:
+    python experiments/chunking_sweep.py --strategies recursive sentence page \\
+        --chunk-sizes 500 1000 2000 --overlaps 0 100 500
+    python experiments/chunking_sweep.py --retrieval-only   # no generation
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Change to project root directory
+project_root = Path(__file__).parent.parent
+os.chdir(project_root)
+sys.path.insert(0, str(project_root))
+
+from backend.RAG import CHUNKING_STRATEGIES  # noqa: E402
+from experiments.RAG_evaluation import (  # noqa: E402
+    BOOK,
+    CHARACTERS_CSV,
+    DATA_PATH,
+    Cassette,
+    build_embedder,
+    evaluate_configuration,
+    index_cache_dir,
+)
+
+
+def directory_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def configurations(
+    strategies: list[str], chunk_sizes: list[int], overlaps: list[int]
+) -> list[tuple[str, int, int]]:
+    """All valid (strategy, chunk_size, chunk_overlap) combinations."""
+    configs = []
+    for strategy in strategies:
+        if strategy == "page":
+            configs.append(("page", 0, 0))
+            continue
+        for chunk_size, chunk_overlap in itertools.product(chunk_sizes, overlaps):
+            if chunk_overlap < chunk_size:
+                configs.append((strategy, chunk_size, chunk_overlap))
+    return configs
+
+
+def retrieval_latencies(pdf_embedder, characters: list[str], k: int) -> np.ndarray:
+    """Wall-clock time of one full-book semantic search per character."""
+    latencies = []
+    for character in characters:
+        start = time.perf_counter()
+        pdf_embedder.semantic_search(character, k=k, full_book=True)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--strategies",
+        nargs="+",
+        default=list(CHUNKING_STRATEGIES),
+        choices=CHUNKING_STRATEGIES,
+    )
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[500, 1000])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[0, 100, 500])
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--retrieval-only",
+        action="store_true",
+        help="Skip the first-mention task and only measure retrieval",
+    )
+    parser.add_argument(
+        "--cassette", default="experiments/cassettes/first_mention.json"
+    )
+    parser.add_argument(
+        "--replay", action="store_true", help="Replay the cassette without network"
+    )
+    parser.add_argument("--output", default="experiments/results/chunking_sweep.csv")
+    args = parser.parse_args()
+
+    pdf_path = f"{DATA_PATH}/{BOOK}.pdf"
+    data = pd.read_csv(CHARACTERS_CSV)[["Character", "First_Appearance"]]
+    cassette = Cassette(args.cassette, replay=args.replay)
+
+    rows = []
+    try:
+        for strategy, chunk_size, chunk_overlap in configurations(
+            args.strategies, args.chunk_sizes, args.overlaps
+        ):
+            config = {
+                "strategy": strategy,
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+            }
+            print(f"\nEvaluating {config}")
+            pdf_embedder, meta = build_embedder(
+                pdf_path,
+                chunk_size,
+                args.k,
+                "similarity",
+                cassette,
+                args.replay,
+                chunk_overlap=chunk_overlap,
+                strategy=strategy,
+            )
+            cache_dir = index_cache_dir(pdf_path, chunk_size, chunk_overlap, strategy)
+            latencies = retrieval_latencies(
+                pdf_embedder, data["Character"].tolist(), args.k
+            )
+
+            row = {
+                **config,
+                "chunks": meta.get("chunks"),
+                "ingest_s": meta.get("ingest_s"),
+                "index_bytes": directory_bytes(cache_dir),
+                "retrieval_p50_ms": 1000 * float(np.percentile(latencies, 50)),
+                "retrieval_p95_ms": 1000 * float(np.percentile(latencies, 95)),
+            }
+            if not args.retrieval_only:
+                results = evaluate_configuration(pdf_embedder, data, args.concurrency)
+                row["accuracy"] = float(results["Correct"].mean())
+            rows.append(row)
+    finally:
+        cassette.save()
+
+    summary_df = pd.DataFrame(rows)
+    print("\nSummary:")
+    print(summary_df.to_string(index=False, float_format="%.3f"))
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    summary_df.to_csv(args.output, index=False)
+
+
+# %%
+if __name__ == "__main__":
+    main()
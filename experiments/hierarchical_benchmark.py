@@ -0,0 +1,198 @@
+# %%
+"""
+Benchmark hierarchical (chapter-routed) retrieval against flat search on the bundled book.
+
+The book is ingested once into a flat index. For every query and page bound it
+compares the k chunks of flat search with those of a two-stage search visiting
+--top-chapters chapters, and reports:
+  * recall@k and recall@10 of hierarchical search against flat search,
+  * chunks scored per search and p50/p95 search latency,
+  * prompt tokens after context selection.
+
+Queries are the characters of HP_character_analysis_manual.csv plus a few broad
+questions, at random page bounds and at the end of the book. --repeat concatenates
+the book with itself to stand in for a longer one. The hashing embedding backend
+runs offline; use --embeddings remote or local for meaningful semantics.
+
+Usage:
+    python experiments/hierarchical_benchmark.py --top-chapters 1 2 3 5
+    python experiments/hierarchical_benchmark.py --embeddings remote --repeat 4
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from langchain_core.documents import Document
+
+# Change to project root directory
+project_root = Path(__file__).parent.parent
+os.chdir(project_root)
+sys.path.insert(0, str(project_root))
+
+from backend.RAG import (  # noqa: E402
+    EmbeddedPDF,
+    pdf_bytes_to_langchain_doc,
+    select_context,
+)
+from backend.embeddings import EMBEDDING_BACKENDS  # noqa: E402
+
+BOOK = "backend/data/books/Harry-Potter-and-the-Philosophers-Stone.pdf"
+CHARACTERS_CSV = (
+    "experiments/first_meet_evaluation_data/HP_character_analysis_manual.csv"
+)
+BROAD_QUESTIONS = [
+    "What has happened with the Philosopher's Stone so far?",
+    "How does Harry get along with the Dursleys?",
+    "What do we know about Hogwarts and its teachers?",
+    "Who are Harry's friends and how did they meet?",
+    "What is Quidditch and how does Harry play it?",
+]
+
+
+def load_pages(repeat: int) -> list[Document]:
+    """The bundled book's pages, concatenated repeat times."""
+    pages = pdf_bytes_to_langchain_doc(Path(BOOK).read_bytes(), Path(BOOK).name)
+    book = []
+    for copy in range(repeat):
+        for page in pages:
+            metadata = {
+                **page.metadata,
+                "page": copy * len(pages) + page.metadata["page"],
+            }
+            book.append(Document(page_content=page.page_content, metadata=metadata))
+    return book
+
+
+def chunk_key(doc: Document) -> tuple:
+    return (doc.metadata["page"], doc.metadata.get("start_index"), doc.page_content)
+
+
+def overlap(results: list, reference: list) -> float:
+    if not reference:
+        return 1.0
+    return len(
+        {chunk_key(d) for d, _ in results} & {chunk_key(d) for d, _ in reference}
+    ) / len(reference)
+
+
+def run(pdf_embedder: EmbeddedPDF, queries, page_limits, k: int, top_chapters):
+    vectors = pdf_embedder.embedding_function.embed_queries(queries)
+    db = pdf_embedder.db
+    rows = []
+
+    flat, flat_latencies = [], []
+    for vector, page_limit in zip(vectors, page_limits):
+        start = time.perf_counter()
+        hits = db.search_by_vector(db.normalise(vector), k, page_limit)
+        flat_latencies.append(time.perf_counter() - start)
+        flat.append([(db.documents[i], score) for i, score in hits])
+    rows.append(
+        summarise(
+            "flat",
+            flat,
+            flat,
+            flat_latencies,
+            [db.row_range(0, p)[1] for p in page_limits],
+            pdf_embedder,
+        )
+    )
+
+    for top in top_chapters:
+        pdf_embedder.top_chapters = top
+        results, latencies, scored = [], [], []
+        for query, vector, page_limit in zip(queries, vectors, page_limits):
+            before = pdf_embedder._selection["scored"]
+            start = time.perf_counter()
+            results.append(
+                pdf_embedder._hierarchical_search(query, k, page_limit, vector)
+            )
+            latencies.append(time.perf_counter() - start)
+            scored.append(pdf_embedder._selection["scored"] - before)
+        rows.append(
+            summarise(
+                f"hierarchical-{top}", results, flat, latencies, scored, pdf_embedder
+            )
+        )
+    return rows
+
+
+def summarise(name, results, reference, latencies, scored, pdf_embedder) -> dict:
+    tokens = [
+        select_context(
+            result,
+            min_relevance=pdf_embedder.min_relevance,
+            token_budget=pdf_embedder.context_token_budget,
+            adaptive_k=pdf_embedder.adaptive_k,
+        )[1]
+        for result in results
+    ]
+    latencies = np.array(latencies)
+    return {
+        "search": name,
+        "recall@k": float(np.mean([overlap(r, f) for r, f in zip(results, reference)])),
+        "recall@10": float(
+            np.mean([overlap(r, f[:10]) for r, f in zip(results, reference)])
+        ),
+        "scored_chunks": float(np.mean(scored)),
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+        "prompt_tokens": float(np.mean(tokens)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--embeddings", default="hashing", choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--top-chapters", type=int, nargs="+", default=[1, 2, 3, 5])
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--bounds", type=int, default=5, help="Random page bounds per query"
+    )
+    parser.add_argument(
+        "--output", default="experiments/results/hierarchical_benchmark.csv"
+    )
+    args = parser.parse_args()
+
+    pages = load_pages(args.repeat)
+    pdf_embedder = EmbeddedPDF(
+        index_backend="flat",
+        embedding_backend=args.embeddings,
+        retrieval_mode="hierarchical",
+        # Repeated copies would otherwise be dropped as duplicate chunks
+        deduplicate_chunks=args.repeat == 1,
+    )
+    start = time.perf_counter()
+    pdf_embedder.embed_pdf(pages)
+    print(
+        f"Ingested {len(pages)} pages, {len(pdf_embedder.db)} chunks, "
+        f"{len(pdf_embedder.chapters)} chapters in {time.perf_counter() - start:.1f} s"
+    )
+
+    characters = pd.read_csv(CHARACTERS_CSV)["Character"].tolist()
+    rng = np.random.default_rng(0)
+    queries, page_limits = [], []
+    for query in characters + BROAD_QUESTIONS:
+        bounds = rng.integers(len(pages) // 10, len(pages), size=args.bounds).tolist()
+        for page_limit in bounds + [len(pages)]:
+            queries.append(query)
+            page_limits.append(page_limit)
+
+    summary_df = pd.DataFrame(
+        run(pdf_embedder, queries, page_limits, args.k, args.top_chapters)
+    )
+    print(f"\n{len(queries)} searches, k={args.k}:")
+    print(summary_df.to_string(index=False, float_format="%.3f"))
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    summary_df.to_csv(args.output, index=False)
+
+
+# %%
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# %%
+"""
+Benchmark the flat NumPy index against Chroma for page-bounded retrieval.
+
+Uses synthetic MiniLM-sized (384-d) embeddings so that no embedding calls are made.
+For each corpus size it reports build time, p50/p95 query latency over random page
+bounds, resident index bytes and recall@k against exact float32 search.
+
+Usage:
+    python experiments/index_benchmark.py --sizes 2000 5000 --queries 200
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+# Change to project root directory
+project_root = Path(__file__).parent.parent
+os.chdir(project_root)
+sys.path.insert(0, str(project_root))
+
+from backend.flat_index import FlatVectorIndex  # noqa: E402
+
+DIM = 384
+
+
+class LookupEmbeddings:
+    """Returns precomputed vectors for known texts, so no model is involved."""
+
+    def __init__(self, vectors: dict[str, np.ndarray]):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[text].tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text].tolist()
+
+
+def make_corpus(size: int, pages: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(size, DIM)).astype(np.float32)
+    # Unit vectors, like MiniLM's, so L2 and cosine rankings agree
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    documents = [
+        Document(page_content=f"chunk-{i}", metadata={"page": int(i * pages / size)})
+        for i in range(size)
+    ]
+    return documents, vectors
+
+
+def directory_bytes(path: str) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def time_queries(search, queries, page_limits) -> tuple[np.ndarray, list]:
+    latencies, results = [], []
+    for query, page_limit in zip(queries, page_limits):
+        start = time.perf_counter()
+        results.append(search(query, page_limit))
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies), results
+
+
+def recall(results, reference) -> float:
+    hits = [
+        len(set(result) & set(expected)) / max(len(expected), 1)
+        for result, expected in zip(results, reference)
+    ]
+    return float(np.mean(hits))
+
+
+def benchmark(size: int, n_queries: int, k: int, pages: int) -> list[dict]:
+    documents, vectors = make_corpus(size, pages)
+    rng = np.random.default_rng(1)
+    query_vectors = rng.normal(size=(n_queries, DIM)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    queries = [f"query-{i}" for i in range(n_queries)]
+    page_limits = rng.integers(1, pages + 1, size=n_queries).tolist()
+
+    lookup = {doc.page_content: vec for doc, vec in zip(documents, vectors)}
+    lookup.update(dict(zip(queries, query_vectors)))
+    embeddings = LookupEmbeddings(lookup)
+
+    def page_filter(page_limit):
+        return {"page": {"$lt": page_limit}}
+
+    rows = []
+    reference = None
+
+    for dtype in FlatVectorIndex.DTYPES:
+        start = time.perf_counter()
+        index = FlatVectorIndex.from_documents(documents, embeddings, dtype=dtype)
+        build_s = time.perf_counter() - start
+
+        def search(query, page_limit, index=index):
+            hits = index.similarity_search_with_relevance_scores(
+                query, k=k, filter=page_filter(page_limit)
+            )
+            return [doc.page_content for doc, _ in hits]
+
+        latencies, results = time_queries(search, queries, page_limits)
+        if reference is None:
+            reference = results
+        rows.append(
+            {
+                "backend": f"flat-{dtype}",
+                "chunks": size,
+                "build_s": build_s,
+                "query_p50_ms": 1000 * np.percentile(latencies, 50),
+                "query_p95_ms": 1000 * np.percentile(latencies, 95),
+                "index_bytes": index.nbytes,
+                f"recall@{k}": recall(results, reference),
+            }
+        )
+
+    persist_directory = tempfile.mkdtemp(prefix="chroma-benchmark-")
+    try:
+        start = time.perf_counter()
+        db = Chroma.from_documents(
+            documents, embeddings, persist_directory=persist_directory
+        )
+        build_s = time.perf_counter() - start
+
+        def chroma_search(query, page_limit):
+            hits = db.similarity_search_with_relevance_scores(
+                query, k=k, filter=page_filter(page_limit)
+            )
+            return [doc.page_content for doc, _ in hits]
+
+        latencies, results = time_queries(chroma_search, queries, page_limits)
+        rows.append(
+            {
+                "backend": "chroma",
+                "chunks": size,
+                "build_s": build_s,
+                "query_p50_ms": 1000 * np.percentile(latencies, 50),
+                "query_p95_ms": 1000 * np.percentile(latencies, 95),
+                "index_bytes": directory_bytes(persist_directory),
+                f"recall@{k}": recall(results, reference),
+            }
+        )
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 5000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=300)
+    args = parser.parse_args()
+
+    # Chroma warns about relevance scores of synthetic vectors
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    rows = []
+    for size in args.sizes:
+        rows.extend(benchmark(size, args.queries, args.k, args.pages))
+
+    print(pd.DataFrame(rows).to_string(index=False, float_format="%.3f"))
+
+
+# %%
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+# %%
+"""
+Load-test the chat websocket against a local stand-in for the inference API.
+
+Starts FakeInferenceServer (chat completions and embeddings with configurable latency
+distributions and token rates), runs the app under uvicorn pointed at it through
+HF_INFERENCE_BASE_URL, uploads a book and then opens N concurrent /ws sessions. Each
+session reads forward through the book, sending page_change messages like the viewer
+does, and asks a weighted mix of questions about characters it has already met.
+
+Reports throughput and p50/p95/p99 latency per stage:
+  * upload: POST /upload-pdf, including ingestion (once),
+  * retrieval: message sent until "Bot is thinking..." (retrieval and prompt),
+  * generation: "Bot is thinking..." until the reply,
+  * total: message sent until the reply.
+
+The app runs in a temporary directory, so its library and sessions are thrown away
+afterwards. Nothing is sent to Hugging Face.
+
+Usage:
+    python experiments/load_generator.py --sessions 50 --questions 5 --workers 4
+    python experiments/load_generator.py --latency-distribution lognormal --latency 1.5 \\
+        --tokens-per-s 40
+    python experiments/load_generator.py --app-url http://localhost:8000  # running app
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+import pandas as pd
+import websockets
+from PyPDF2 import PdfReader
+
+# Change to project root directory
+project_root = Path(__file__).parent.parent
+os.chdir(project_root)
+sys.path.insert(0, str(project_root))
+
+from backend.prefetch import extract_names  # noqa: E402
+from experiments.RAG_evaluation import BOOK, DATA_PATH  # noqa: E402
+from tests.fake_inference_server import (  # noqa: E402
+    LATENCY_DISTRIBUTIONS,
+    FakeInferenceServer,
+)
+
+THINKING = "Bot is thinking..."
+
+# (template, weight); {name} and {other} are characters met before the current page
+QUESTION_MIX = [
+    ("Who is {name}?", 0.35),
+    ("Tell me about {name}", 0.2),
+    ("What do we know about {name} so far?", 0.15),
+    ("What is the relationship between {name} and {other}?", 0.1),
+    ("What just happened?", 0.1),
+    ("Summarise the story so far", 0.1),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def page_names(pdf_path: str) -> list[list[str]]:
+    """Likely character names per page, as the app finds them at ingestion."""
+    return [
+        extract_names(page.extract_text() or "") for page in PdfReader(pdf_path).pages
+    ]
+
+
+def question(rng: random.Random, met: list[str]) -> str:
+    templates, weights = zip(*QUESTION_MIX)
+    template = rng.choices(templates, weights)[0]
+    if "{name}" in template and not met:
+        return "What just happened?"
+    name = rng.choice(met) if met else ""
+    others = [other for other in met if other != name]
+    if "{other}" in template and not others:
+        template = "Who is {name}?"
+    return template.format(name=name, other=rng.choice(others) if others else "")
+
+
+class Recorder:
+    """Latency samples per stage, and counts of replies and errors."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.replies = 0
+        self.errors = 0
+
+    def add(self, stage: str, seconds: float):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def summary(self, elapsed_s: float) -> pd.DataFrame:
+        rows = []
+        for stage, samples in self.samples.items():
+            values = 1000 * np.array(samples)
+            rows.append(
+                {
+                    "stage": stage,
+                    "count": len(values),
+                    "p50_ms": np.percentile(values, 50),
+                    "p95_ms": np.percentile(values, 95),
+                    "p99_ms": np.percentile(values, 99),
+                    "max_ms": values.max(),
+                }
+            )
+        print(
+            f"{self.replies} replies ({self.errors} errors) in {elapsed_s:.1f} s: "
+            f"{self.replies / elapsed_s:.2f} replies/s"
+        )
+        return pd.DataFrame(rows)
+
+
+async def reader_session(
+    index: int,
+    ws_url: str,
+    book: dict,
+    names: list[list[str]],
+    args,
+    recorder: Recorder,
+):
+    """One reader: pages forward, asks questions, waits for every reply."""
+    rng = random.Random(args.seed + index)
+    total_pages = book["pages"]
+    page = rng.randint(1, max(1, total_pages // 2))
+    await asyncio.sleep(rng.uniform(0, args.ramp_up_s))
+
+    url = f"{ws_url}/ws?session_id=load-test-{args.seed}-{index:05d}"
+    async with websockets.connect(url, max_size=None) as ws:
+        for _ in range(args.questions):
+            for _ in range(rng.randint(1, args.page_step)):
+                page = min(page + 1, total_pages)
+                await ws.send(
+                    json.dumps(
+                        {
+                            "type": "page_change",
+                            "current_page": page,
+                            "total_pages": total_pages,
+                            "book_id": book["book_id"],
+                        }
+                    )
+                )
+
+            met = sorted({name for page_names in names[:page] for name in page_names})
+            start = time.perf_counter()
+            await ws.send(
+                json.dumps(
+                    {
+                        "type": "chat_message",
+                        "content": question(rng, met),
+                        "current_page": page,
+                        "total_pages": total_pages,
+                        "book_id": book["book_id"],
+                    }
+                )
+            )
+
+            thinking_at = None
+            while True:
+                reply = await asyncio.wait_for(ws.recv(), timeout=args.timeout_s)
+                if reply == THINKING:
+                    thinking_at = time.perf_counter()
+                    recorder.add("retrieval", thinking_at - start)
+                    continue
+                break
+            done_at = time.perf_counter()
+            if thinking_at is not None:
+                recorder.add("generation", done_at - thinking_at)
+            recorder.add("total", done_at - start)
+            recorder.replies += 1
+            if reply.startswith("Error"):
+                recorder.errors += 1
+
+            await asyncio.sleep(rng.expovariate(1 / args.think_time_s))
+
+
+async def run_sessions(app_url: str, book: dict, names, args, recorder) -> float:
+    ws_url = app_url.replace("http", "ws", 1)
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            reader_session(i, ws_url, book, names, args, recorder)
+            for i in range(args.sessions)
+        ),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        print(f"{len(failures)} sessions failed, e.g. {failures[0]!r}")
+    return elapsed
+
+
+def upload_book(app_url: str, pdf_path: str, recorder: Recorder) -> dict:
+    start = time.perf_counter()
+    with open(pdf_path, "rb") as pdf:
+        response = httpx.post(
+            f"{app_url}/upload-pdf",
+            files={"pdf": (Path(pdf_path).name, pdf, "application/pdf")},
+            timeout=None,
+        )
+    response.raise_for_status()
+    recorder.add("upload", time.perf_counter() - start)
+    return response.json()
+
+
+def start_app(port: int, workers: int, base_url: str, directory: Path):
+    """Run the app under uvicorn in a scratch directory, and wait until it is up."""
+    shutil.copytree(project_root / "app", directory / "app")
+    env = {
+        **os.environ,
+        "HF_INFERENCE_BASE_URL": base_url,
+        "HUGGINGFACE_API_TOKEN": "load-test",
+        "PYTHONPATH": str(project_root),
+    }
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=directory,
+        env=env,
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The app exited during startup")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/books", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("The app did not start within 120 s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=5, help="Per session")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--pdf", default=f"{DATA_PATH}/{BOOK}.pdf")
+    parser.add_argument(
+        "--page-step", type=int, default=3, help="Most pages read between questions"
+    )
+    parser.add_argument(
+        "--think-time-s", type=float, default=2.0, help="Mean pause between questions"
+    )
+    parser.add_argument("--ramp-up-s", type=float, default=5.0)
+    parser.add_argument("--timeout-s", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app-url", help="Test an already running app instead")
+
+    fake = parser.add_argument_group("fake inference server")
+    fake.add_argument("--latency", type=float, default=1.0, help="Chat latency (s)")
+    fake.add_argument(
+        "--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal"
+    )
+    fake.add_argument("--latency-sigma", type=float, default=0.5)
+    fake.add_argument("--prefill-tokens-per-s", type=float, default=2000.0)
+    fake.add_argument("--tokens-per-s", type=float, default=50.0)
+    fake.add_argument("--reply-tokens", type=int, default=150)
+    fake.add_argument("--embedding-latency", type=float, default=0.05)
+    fake.add_argument("--error-rate", type=float, default=0.0)
+
+    parser.add_argument("--output", help="Write the per-stage summary to this CSV")
+    args = parser.parse_args()
+
+    names = page_names(args.pdf)
+    recorder = Recorder()
+
+    server = FakeInferenceServer(
+        latency=args.latency,
+        latency_distribution=args.latency_distribution,
+        latency_sigma=args.latency_sigma,
+        prefill_tokens_per_s=args.prefill_tokens_per_s,
+        tokens_per_s=args.tokens_per_s,
+        reply="tok " * args.reply_tokens,  # four characters per token
+        embedding_latency=args.embedding_latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    with server, tempfile.TemporaryDirectory(prefix="load-test-") as directory:
+        process = None
+        app_url = args.app_url
+        if app_url is None:
+            port = free_port()
+            process = start_app(port, args.workers, server.url, Path(directory))
+            app_url = f"http://127.0.0.1:{port}"
+        try:
+            book = upload_book(app_url, args.pdf, recorder)
+            print(f"Uploaded {book['filename']} ({book['pages']} pages)")
+            elapsed = asyncio.run(run_sessions(app_url, book, names, args, recorder))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    summary_df = recorder.summary(elapsed)
+    print(
+        f"Fake server: {server.chat_requests} chat and "
+        f"{server.embedding_requests} embedding requests"
+    )
+    print(summary_df.to_string(index=False, float_format="%.1f"))
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        summary_df.to_csv(args.output, index=False)
+
+
+# %%
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
+import asyncio
+import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import (
     FastAPI,
     Request,
@@ -10,14 +14,55 @@ from fastapi import (
 )
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    Response,
+    StreamingResponse,
+)
 from dotenv import load_dotenv
 import logging
 from pathlib import Path
 from huggingface_hub import InferenceClient
-from backend.RAG import EmbeddedPDF, file_to_langchain_doc
-from backend.config import MODEL_ID
-from backend.utils import parse_websocket_message
+from pydantic import BaseModel
+from backend.http_pool import pool_stats
+from backend.library import BookLibrary, book_id_for
+from backend.memory import (
+    MemoryBudget,
+    MemoryBudgetExceeded,
+    StageMemory,
+    estimate_upload_bytes,
+    recent_profiles,
+    rss_bytes,
+    start_tracing,
+    traced_memory,
+)
+from backend.followup import FollowUpDetector
+from backend.prefetch import Prefetcher, character_query
+from backend.RAG import (
+    EmbeddedPDF,
+    estimate_tokens,
+    pdf_bytes_to_langchain_doc,
+    task_options,
+)
+from backend.config import (
+    BATCH_MAX_CHARACTERS,
+    BOOK_CACHE_MAX_AGE_S,
+    CHAT_HISTORY_TOKEN_BUDGET,
+    LLM_MAX_CONCURRENCY,
+    LLM_TIMEOUT_S,
+    MEMORY_BUDGET_BYTES,
+    MEMORY_TRACING,
+    PAGE_IMAGE_MAX_WIDTH,
+    PREBUILT_BUNDLE_DIR,
+    TASK_PROFILES,
+    WS_SEND_QUEUE_SIZE,
+)
+from backend.resilience import CallCancelledError, inference_caller
+from backend.session_store import SessionStore, session_id_or_new
+from backend.singleflight import SingleFlight
+from backend.utils import http_date, is_not_modified, parse_websocket_message
 
 # Configure logging
 logging.basicConfig(
@@ -27,19 +72,33 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 HF_API_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
+# Sends chat requests elsewhere instead, such as to the local fake server used by
+# experiments/load_generator.py
+HF_INFERENCE_BASE_URL = os.getenv("HF_INFERENCE_BASE_URL")
 
 # Initialize the InferenceClient for the new Inference Providers system
-client = InferenceClient(api_key=HF_API_TOKEN) if HF_API_TOKEN else None
+client = (
+    InferenceClient(
+        base_url=HF_INFERENCE_BASE_URL, api_key=HF_API_TOKEN, timeout=LLM_TIMEOUT_S
+    )
+    if HF_API_TOKEN
+    else None
+)
 
 if not HF_API_TOKEN:
     logger.error("HUGGINGFACE_API_TOKEN not found in environment variables!")
 else:
-    logger.info(f"Initialized InferenceClient with model: {MODEL_ID}")
+    logger.info(
+        f"Initialized InferenceClient with model: {TASK_PROFILES['chat']['model']}"
+    )
 
 
 app = FastAPI(title="ChatBot App with Hugging Face LLM")
 
-app.state.pdf_embedder = None
+# The library holds every ingested book, and the session store the conversations and
+# each session's active book. Both live on disk, so that every worker process sees the same state.
+app.state.library = None
+app.state.sessions = None
 
 # Mount static files
 app.mount("/static", StaticFiles(directory=Path("app/static")), name="static")
@@ -51,6 +110,22 @@ templates = Jinja2Templates(directory=Path("app/templates"))
 class ConnectionManager:
     def __init__(self):
         self.active_connections = []
+        # Work abandoned because a newer message superseded it or the client left
+        self.counters = {
+            "messages": 0,
+            "superseded": 0,
+            "abandoned_on_disconnect": 0,
+            "cancelled_retrievals": 0,
+            "cancelled_generations": 0,
+            # Answered from a book's answer cache, without retrieval or generation
+            "cached_answers": 0,
+            # Follow-up questions answered with the previous retrieval, and the
+            # context tokens not sent again for them, over finished sessions
+            "reused_retrievals": 0,
+            "prompt_tokens_avoided": 0,
+        }
+        # Follow-up statistics of the sessions connected to this worker
+        self.followups: dict[str, FollowUpDetector] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
@@ -62,10 +137,118 @@ class ConnectionManager:
     async def send_message(self, message: str, websocket: WebSocket):
         await websocket.send_text(message)
 
+    def count(self, counter: str):
+        self.counters[counter] += 1
+
+    def end_session(self, session: str, followups: FollowUpDetector):
+        stats = followups.stats()
+        logger.info(f"Session {session} follow-ups: {stats}")
+        self.counters["reused_retrievals"] += stats["reused_retrievals"]
+        self.counters["prompt_tokens_avoided"] += stats["prompt_tokens_avoided"]
+        if self.followups.get(session) is followups:
+            del self.followups[session]
+
+    def stats(self) -> dict:
+        return {
+            "active_connections": len(self.active_connections),
+            **self.counters,
+            "sessions": {
+                session: followups.stats()
+                for session, followups in self.followups.items()
+            },
+        }
+
 
 manager = ConnectionManager()
 
 
+def get_library() -> BookLibrary:
+    """The persistent book library, opened on first use."""
+    if app.state.library is None:
+        library = BookLibrary()
+        # Books shipped as bundles are available without any embedding
+        library.import_bundles(PREBUILT_BUNDLE_DIR)
+        app.state.library = library
+    return app.state.library
+
+
+def get_sessions() -> SessionStore:
+    """The shared session store, opened on first use."""
+    if app.state.sessions is None:
+        app.state.sessions = SessionStore()
+    return app.state.sessions
+
+
+def get_embedder(
+    book_id: str | None = None, session_id: str | None = None
+) -> EmbeddedPDF | None:
+    """
+    The requested book from the library, or if none is given the session's
+    active book (see SessionStore.active_book).
+    """
+    if book_id is None:
+        book_id = get_sessions().active_book(session_id)
+        if book_id is None or not get_library().has_book(book_id):
+            return None
+
+    try:
+        return get_library().get_book(book_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Book not found in library")
+
+
+# Warms retrieval caches for the names on the pages a reader has just reached
+prefetcher = Prefetcher()
+
+if MEMORY_TRACING:
+    start_tracing()
+
+
+def resident_index_bytes() -> int:
+    library = app.state.library
+    return library.index_bytes() if library is not None else 0
+
+
+# Uploads wait, or are refused, while the indexes in memory and the ingestions in
+# progress would exceed the per-process budget
+memory_budget = MemoryBudget(MEMORY_BUDGET_BYTES, resident_index_bytes)
+
+# Threads for blocking inference calls. Calls beyond the provider concurrency limit
+# queue here, where a cancelled call is dropped before it ever starts.
+inference_executor = ThreadPoolExecutor(
+    max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="inference"
+)
+
+
+async def run_cancellable(fn, *args, **kwargs):
+    """
+    Run a blocking inference call that accepts cancel= on the inference threads.
+
+    If the awaiting coroutine is cancelled, the call is told to stop waiting for a
+    reply nobody will read, or is dropped if it has not started.
+    """
+    cancel = threading.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            inference_executor, lambda: fn(*args, cancel=cancel, **kwargs)
+        )
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+
+
+# Identical in-flight chat completions (same model and messages) share one call.
+# A cancelled caller's cancellation is not passed on to the others.
+chat_flight = SingleFlight("chat", private_errors=(CallCancelledError,))
+# Model and generation settings of chat answers (see TASK_PROFILES)
+CHAT_OPTIONS = task_options("chat")
+
+
+def _chat_completion(conversation_history):
+    return client.chat.completions.create(messages=conversation_history, **CHAT_OPTIONS)
+
+
 async def query_huggingface(conversation_history):
     """
     Query the Hugging Face Inference Providers API with the given message
@@ -78,15 +261,19 @@ async def query_huggingface(conversation_history):
             }
 
         logger.info("Sending request to Hugging Face Inference Providers")
-        logger.info(f"Model: {MODEL_ID}")
+        logger.info(f"Model: {CHAT_OPTIONS['model']}")
         logger.info(f"Conversation length: {len(conversation_history)}")
 
-        # Use the new chat completion format
-        completion = client.chat.completions.create(
-            model=MODEL_ID,
-            messages=conversation_history,
-            max_tokens=1000,
-            temperature=0.7,
+        # Use the new chat completion format. The blocking call runs in a worker
+        # thread so that identical concurrent requests can be coalesced, and goes
+        # through the shared resilience policy (deadline, retries, circuit breaker).
+        key = (CHAT_OPTIONS["model"], json.dumps(conversation_history, sort_keys=True))
+        completion = await run_cancellable(
+            chat_flight.do,
+            key,
+            inference_caller.call,
+            _chat_completion,
+            conversation_history,
         )
         # Extract the response
         bot_response = completion.choices[0].message.content
@@ -109,91 +296,395 @@ async def query_huggingface(conversation_history):
 async def get_root(request: Request):
     return templates.TemplateResponse(
         "index.html",
-        {"request": request, "app_name": "CharMem AI", "model_name": MODEL_ID},
+        {
+            "request": request,
+            "app_name": "CharMem AI",
+            "model_name": CHAT_OPTIONS["model"],
+        },
     )
 
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
-
+async def send_loop(websocket: WebSocket, outbox: asyncio.Queue):
+    """Drain a connection's bounded send queue into the socket."""
     try:
-        app.state.conversation_history = []
-
         while True:
-            data = await websocket.receive_text()
+            message = await outbox.get()
+            await manager.send_message(message, websocket)
+    except (WebSocketDisconnect, ConnectionResetError, RuntimeError):
+        # The client is gone; the reader notices and cleans up
+        pass
 
-            # Try to parse as structured JSON message
-            message = parse_websocket_message(data)
 
-            # If available use the uploaded PDF as context for the user message
-            # A semantic search through the PDF will return relevant excerpts
-            if app.state.pdf_embedder is not None:
-                # Note what page the user is currently on
-                app.state.pdf_embedder.set_current_page(message.get("current_page", 0))
+def recent_history(history: list[dict], max_tokens: int) -> list[dict]:
+    """
+    The most recent messages of a conversation that fit in about max_tokens tokens,
+    starting with a system or user message.
+    """
+    start = len(history)
+    tokens = 0
+    while start > 0:
+        tokens += estimate_tokens(history[start - 1]["content"])
+        if tokens > max_tokens:
+            break
+        start -= 1
+    while start < len(history) and history[start]["role"] == "assistant":
+        start += 1
+    return history[start:]
+
+
+async def answer_message(
+    message: dict, session_id: str, outbox, followups: FollowUpDetector
+):
+    """
+    Retrieve context for one chat message, query the model and queue the reply.
+
+    The session's conversation is read from the session store, and only extended
+    once the reply is ready, so a message that is cancelled half-way leaves no trace
+    in it. Only its most recent messages are sent to the model (see
+    CHAT_HISTORY_TOKEN_BUDGET).
+
+    A question that stands on its own (the first of a conversation, or one about a
+    single known character) is answered from the book's answer cache if a similar
+    one was answered before without going past the reader's page, unless the
+    message sets "use_cache" to false. Only answers generated without any of the
+    conversation are stored: the page bound of a cached answer comes from its
+    own retrieval, and earlier messages may hold later pages the reader has
+    since gone back from.
+
+    A follow-up to the previous question (see FollowUpDetector) is not searched
+    for: the previous retrieval is still in the conversation sent to the model.
+    """
+    stage = "retrievals"
+    try:
+        # If available use the uploaded PDF as context for the user message
+        # A semantic search through the PDF will return relevant excerpts
+        try:
+            pdf_embedder = get_embedder(message.get("book_id"), session_id)
+        except HTTPException as e:
+            await outbox.put(f"Error: {e.detail}")
+            return
+
+        stored_history = await asyncio.to_thread(get_sessions().history, session_id)
+        conversation_history = recent_history(stored_history, CHAT_HISTORY_TOKEN_BUDGET)
+        if not any(m["role"] == "system" for m in conversation_history):
+            # The previous retrieval is no longer sent, so it cannot be reused
+            followups.forget()
+        turn = []
+        follow_up = False
+        if pdf_embedder is not None:
+            # Perform semantic search to get relevant context based on the page
+            # the user is currently on
+            # Questions like "Who is Hagrid?" are searched by name alone, so they
+            # can be answered from the prefetched retrievals
+            current_page = message.get("current_page", 0)
+            query = character_query(
+                message["content"], pdf_embedder.names_before(current_page)
+            )
+            question_vector = await asyncio.to_thread(
+                pdf_embedder.embedding_function.embed_query, message["content"]
+            )
 
-                # Perform semantic search to get relevant context based on page number
-                retrieval = app.state.pdf_embedder.semantic_search(
-                    message["content"], full_book=False
+            standalone = not stored_history or query != message["content"]
+            cacheable = message.get("use_cache", True) and standalone
+            if cacheable:
+                cached = pdf_embedder.answer_cache.get(question_vector, current_page)
+                if cached is not None:
+                    manager.count("cached_answers")
+                    turn = [
+                        {"role": "user", "content": message["content"]},
+                        {"role": "assistant", "content": cached},
+                    ]
+                    await asyncio.to_thread(get_sessions().append, session_id, turn)
+                    # The last retrieval is no longer the latest context
+                    followups.forget()
+                    await outbox.put(cached)
+                    return
+
+            follow_up = followups.is_follow_up(
+                message["content"], question_vector, pdf_embedder.book_id, current_page
+            )
+            if not follow_up:
+                retrieval = await asyncio.to_thread(
+                    pdf_embedder.semantic_search,
+                    query,
+                    full_book=False,
+                    current_page=current_page,
                 )
 
-                app.state.conversation_history.append(
+                turn.append(
                     {
                         "role": "system",
                         "content": f"You are a helpful book assistant and the user is currently on page {message['current_page']} of the book. Given the following excerpts from a novel, provide the user information about a specified character or plot point as clearly and concisely as possible, using only the provided text. The following information may or may not be relevant to the following user query. If you think that this information is relevant, reference it and give page numbers. Never provide information outside of the provided context. If there is not enough evidence that we have met this character, you must say that we have not met the character. Context: {retrieval}",
                     }
                 )
 
-            # Add user message to conversation history (using ChatML formatting)
-            app.state.conversation_history.append(
-                {"role": "user", "content": message["content"]}
+        # Add user message to conversation history (using ChatML formatting)
+        turn.append({"role": "user", "content": message["content"]})
+
+        stage = "generations"
+        await outbox.put("Bot is thinking...")
+        response = await query_huggingface(conversation_history + turn)
+
+        if "error" in response:
+            bot_reply = f"Error: {response['error']}"
+            logger.error(f"Error from Hugging Face: {response['error']}")
+        elif "response" in response and response["response"]:
+            bot_reply = response["response"].strip()
+            if pdf_embedder is not None and cacheable and not conversation_history:
+                pdf_embedder.answer_cache.put(
+                    question_vector, bot_reply, retrieval, current_page
+                )
+        else:
+            bot_reply = "Sorry, I couldn't understand the model's response."
+
+        # Add bot reply to conversation history (using ChatML formatting)
+        turn.append({"role": "assistant", "content": bot_reply})
+        await asyncio.to_thread(get_sessions().append, session_id, turn)
+        if follow_up:
+            followups.reused_previous(question_vector)
+        elif pdf_embedder is not None:
+            followups.retrieved(
+                question_vector,
+                pdf_embedder.book_id,
+                current_page,
+                estimate_tokens(retrieval),
             )
 
-            await manager.send_message("Bot is thinking...", websocket)
-            response = await query_huggingface(app.state.conversation_history)
+        # Send bot's reply to the client
+        await outbox.put(bot_reply)
 
-            if "error" in response:
-                bot_reply = f"Error: {response['error']}"
-                logger.error(f"Error from Hugging Face: {response['error']}")
-            elif "response" in response and response["response"]:
-                bot_reply = response["response"].strip()
-            else:
-                bot_reply = "Sorry, I couldn't understand the model's response."
+    except asyncio.CancelledError:
+        manager.count(f"cancelled_{stage}")
+        raise
+    except Exception as e:
+        logger.error(f"Error answering message: {str(e)}", exc_info=True)
+        await outbox.put(f"Error: {str(e)}")
 
-            # Add bot reply to conversation history (using ChatML formatting)
-            app.state.conversation_history.append(
-                {"role": "assistant", "content": bot_reply}
-            )
 
-            # Send bot's reply to the client
-            await manager.send_message(bot_reply, websocket)
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """
+    Chat over a websocket.
+
+    This coroutine only reads messages. Each message is answered by a worker task,
+    and a new message cancels the worker that is still answering the previous one.
+    Replies go through a bounded queue drained by a sender task, and everything
+    still running is cancelled when the client disconnects.
+
+    Every message, including the "page_change" messages the viewer sends while the
+    user reads, reports the current page. When it advances, retrievals for the
+    names on the last few pages are prefetched.
+
+    The client names its session in the session_id query parameter. The
+    conversation and the last position are kept in the session store, so a client
+    that reconnects, possibly to another worker, carries on where it left off.
+    Follow-up detection only spans one connection.
+    """
+    await manager.connect(websocket)
+
+    session = session_id_or_new(websocket.query_params.get("session_id"))
+    followups = FollowUpDetector()
+    manager.followups[session] = followups
+    outbox: asyncio.Queue[str] = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+    sender = asyncio.create_task(send_loop(websocket, outbox))
+    worker: asyncio.Task | None = None
+    last_page = await asyncio.to_thread(get_sessions().position, session)
+    last_page = tuple(last_page) if last_page else (None, 0)
+
+    try:
+        while True:
+            data = await websocket.receive_text()
+
+            # Try to parse as structured JSON message
+            message = parse_websocket_message(data)
+
+            book_id, current_page = message.get("book_id"), message["current_page"]
+            if book_id != last_page[0] or current_page > last_page[1]:
+                last_page = (book_id, current_page)
+                schedule_prefetch(session, message)
+                await asyncio.to_thread(
+                    get_sessions().set_position, session, book_id, current_page
+                )
+            if message["type"] == "page_change":
+                continue
+
+            manager.count("messages")
+            if worker is not None and not worker.done():
+                worker.cancel()
+                manager.count("superseded")
+            worker = asyncio.create_task(
+                answer_message(message, session, outbox, followups)
+            )
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}", exc_info=True)
         try:
             await manager.send_message(f"Connection error: {str(e)}", websocket)
         except (WebSocketDisconnect, ConnectionResetError, RuntimeError):
             pass
+    finally:
+        if worker is not None and not worker.done():
+            worker.cancel()
+            manager.count("abandoned_on_disconnect")
+        sender.cancel()
+        prefetcher.forget(session)
+        manager.end_session(session, followups)
         manager.disconnect(websocket)
 
 
+def schedule_prefetch(session: str, message: dict):
+    """Start prefetching for the book and page a message refers to, if any."""
+    try:
+        pdf_embedder = get_embedder(message.get("book_id"), session)
+    except HTTPException:
+        return
+    if pdf_embedder is not None and pdf_embedder.page_names:
+        prefetcher.schedule(session, pdf_embedder, message["current_page"])
+
+
+# Library books are addressed by content hash, so their pages never change
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={BOOK_CACHE_MAX_AGE_S}, immutable"
+
+
+def conditional_file_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    cache_control: str,
+    filename: str | None = None,
+) -> Response:
+    """
+    Serve a file with ETag/Last-Modified validators, answering 304 when possible.
+
+    Byte-range requests are handled by FileResponse.
+    """
+    stat_result = os.stat(path)
+    response = FileResponse(
+        path,
+        media_type=media_type,
+        filename=filename,
+        stat_result=stat_result,
+        headers={"Cache-Control": cache_control},
+    )
+    if is_not_modified(request.headers, response.headers["etag"], stat_result.st_mtime):
+        return Response(
+            status_code=304,
+            headers={
+                name: response.headers[name]
+                for name in ("etag", "last-modified", "cache-control")
+            },
+        )
+    return response
+
+
 @app.get("/pdf/{filename}")
-async def serve_pdf(filename: str):
-    """Serve the uploaded PDF file."""
+async def serve_pdf(filename: str, request: Request):
+    """
+    Serve the uploaded PDF file.
+
+    Supports byte-range requests, so the viewer can load pages lazily. An upload can
+    replace a file of the same name, so clients must revalidate before reusing it.
+    """
     upload_dir = Path("uploads")
     pdf_path = upload_dir / filename
-    app.state.current_pdf_path = pdf_path
 
     if not pdf_path.exists():
         raise HTTPException(status_code=404, detail="PDF file not found")
 
-    return FileResponse(pdf_path, media_type="application/pdf", filename=filename)
+    return conditional_file_response(
+        request, pdf_path, "application/pdf", "no-cache", filename=filename
+    )
+
+
+def book_info(book_id: str) -> dict:
+    """Manifest entry of a library book, or 404."""
+    book = get_library().info(book_id)
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book not found in library")
+    return book
+
+
+@app.get("/books/{book_id}/pages/{page}/text")
+async def page_text(book_id: str, page: int, request: Request):
+    """Text of one page (1-indexed) of a library book."""
+    book = book_info(book_id)
+    etag = f'"{book_id}-{page}-text"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(book["added_at"]),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+    }
+    if is_not_modified(request.headers, etag, book["added_at"]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        text = get_library().page_text(book_id, page - 1)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Page text not available")
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Page not found")
+
+    return JSONResponse(
+        {
+            "book_id": book_id,
+            "page": page,
+            "total_pages": book["total_pages"],
+            "text": text,
+        },
+        headers=headers,
+    )
+
+
+@app.get("/books/{book_id}/pages/{page}/image")
+async def page_image(book_id: str, page: int, request: Request, width: int = 600):
+    """
+    PNG rendering of one page (1-indexed) of a library book.
+
+    The width in pixels is rounded to a multiple of 50 to keep the image cache small.
+    """
+    book_info(book_id)
+    width = max(50, min(round(width / 50) * 50, PAGE_IMAGE_MAX_WIDTH))
+
+    try:
+        image_path = await asyncio.to_thread(
+            get_library().page_image, book_id, page - 1, width
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="PDF not available for this book")
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Page not found")
+
+    return conditional_file_response(
+        request, image_path, "image/png", IMMUTABLE_CACHE_CONTROL
+    )
+
+
+@app.get("/books/{book_id}/pdf")
+async def book_pdf(book_id: str, request: Request):
+    """The PDF of a library book, cacheable forever and with byte-range support."""
+    book = book_info(book_id)
+    pdf_path = get_library().pdf_path(book_id)
+    if pdf_path is None:
+        raise HTTPException(status_code=404, detail="PDF not available for this book")
+
+    return conditional_file_response(
+        request,
+        pdf_path,
+        "application/pdf",
+        IMMUTABLE_CACHE_CONTROL,
+        filename=book["source"],
+    )
+
+
+def request_session(session_id: str | None) -> str | None:
+    """The session an HTTP request names in its session_id parameter, if any."""
+    return session_id_or_new(session_id) if session_id else None
 
 
 @app.post("/upload-pdf")
-async def upload_pdf(pdf: UploadFile = File(...)):
+async def upload_pdf(pdf: UploadFile = File(...), session_id: str | None = None):
     # Validate file type
     if not pdf.filename or not pdf.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
@@ -207,20 +698,37 @@ async def upload_pdf(pdf: UploadFile = File(...)):
         content = await pdf.read()
         buffer.write(content)
 
-    # Reset file pointer for processing
-    await pdf.seek(0)
+    # Books already in the library are not ingested again
+    library = get_library()
+    book_id = book_id_for(content)
 
-    pages = await file_to_langchain_doc(pdf)
-
-    app.state.pdf_embedder = EmbeddedPDF()
-    result = app.state.pdf_embedder.embed_pdf(pages)
+    if library.has_book(book_id):
+        result = {
+            "success": True,
+            "pages": library.info(book_id)["total_pages"],
+            "message": "PDF already in library",
+        }
+    else:
+        memory = StageMemory(f"Ingesting {pdf.filename}")
+        try:
+            result = await asyncio.to_thread(
+                ingest_within_budget, book_id, pdf.filename, content, memory
+            )
+        except MemoryBudgetExceeded as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server is short of memory, try again later: {e}",
+                headers={"Retry-After": "30"},
+            )
 
     if result["success"]:
+        select_book(book_id, request_session(session_id))
         return {
             "message": result["message"],
             "pages": result["pages"],
-            "pdf_url": f"/pdf/{pdf.filename}",  # Add PDF URL
+            "pdf_url": pdf_url_for(book_id),  # Add PDF URL
             "filename": pdf.filename,
+            "book_id": book_id,
         }
     else:
         raise HTTPException(
@@ -228,22 +736,196 @@ async def upload_pdf(pdf: UploadFile = File(...)):
         )
 
 
+def ingest_within_budget(
+    book_id: str, filename: str, content: bytes, memory: StageMemory
+) -> dict:
+    """
+    Parse a PDF and add it to the library once its estimated memory fits in the
+    budget. The estimate comes from the size of the file, so nothing is parsed
+    before the upload is admitted.
+    """
+    with memory_budget.reserve(estimate_upload_bytes(len(content))):
+        memory.mark("admitted")
+        # The bytes already read are parsed, rather than reading the upload again
+        pages = pdf_bytes_to_langchain_doc(content, filename)
+        memory.mark("parse")
+        return get_library().add_book(book_id, filename, pages, content, memory)
+
+
+def pdf_url_for(book_id: str) -> str:
+    """The library's cacheable copy of a book's PDF, or the uploaded file."""
+    if get_library().pdf_path(book_id) is not None:
+        return f"/books/{book_id}/pdf"
+    return f"/pdf/{get_library().info(book_id)['source']}"
+
+
+def select_book(book_id: str, session_id: str | None = None) -> EmbeddedPDF:
+    """
+    Make a library book the session's active book, for every worker. Without a
+    session it becomes the default book.
+    """
+    pdf_embedder = get_embedder(book_id)
+    get_sessions().set_active_book(book_id, session_id)
+    return pdf_embedder
+
+
+@app.get("/books")
+async def list_books(session_id: str | None = None):
+    """List the books in the library, and the session's active book."""
+    return {
+        "active_book_id": get_sessions().active_book(request_session(session_id)),
+        "books": [
+            {**book, "pdf_url": pdf_url_for(book["book_id"])}
+            for book in get_library().list_books()
+        ],
+    }
+
+
+@app.post("/books/{book_id}/select")
+async def select_active_book(book_id: str, session_id: str | None = None):
+    """Switch the session's active book. No re-ingestion is needed."""
+    select_book(book_id, request_session(session_id))
+    book = get_library().info(book_id)
+    return {
+        "book_id": book_id,
+        "pages": book["total_pages"],
+        "pdf_url": pdf_url_for(book_id),
+        "filename": book["source"],
+    }
+
+
 @app.post("/query-character")
-async def query_character(character_name: str):
+async def query_character(
+    character_name: str,
+    current_page: int | None = None,
+    book_id: str | None = None,
+    session_id: str | None = None,
+):
     """Query character information from uploaded PDFs."""
     try:
-        if app.state.pdf_embedder is None:
+        pdf_embedder = get_embedder(book_id, request_session(session_id))
+        if pdf_embedder is None:
             raise HTTPException(
                 status_code=400,
                 detail="No PDF has been uploaded yet. Please upload a PDF first.",
             )
 
-        analysis = app.state.pdf_embedder.generate_character_analysis(character_name)
+        analysis = await asyncio.to_thread(
+            pdf_embedder.generate_character_analysis,
+            character_name,
+            current_page=current_page,
+        )
         return {"character": character_name, "analysis": analysis}
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class CharacterBatchRequest(BaseModel):
+    character_names: list[str]
+    current_page: int | None = None
+    book_id: str | None = None
+    session_id: str | None = None
+
+
+@app.post("/query-characters")
+async def query_characters(request: CharacterBatchRequest):
+    """
+    Analyse several characters up to one page bound.
+
+    Retrieval for all names shares one batched embedding request, and the
+    generations run concurrently within the provider concurrency limit. The response
+    is NDJSON with one {"character", "analysis" | "error"} line per character,
+    written as soon as that character's analysis is ready.
+    """
+    pdf_embedder = get_embedder(request.book_id, request_session(request.session_id))
+    if pdf_embedder is None:
+        raise HTTPException(
+            status_code=400,
+            detail="No PDF has been uploaded yet. Please upload a PDF first.",
+        )
+
+    names = list(dict.fromkeys(name.strip() for name in request.character_names))
+    names = [name for name in names if name]
+    if not names:
+        raise HTTPException(status_code=400, detail="No character names given")
+    if len(names) > BATCH_MAX_CHARACTERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_MAX_CHARACTERS} characters per request",
+        )
+
+    try:
+        contexts = await asyncio.to_thread(
+            pdf_embedder.character_contexts,
+            names,
+            current_page=request.current_page,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    async def analyse(name: str) -> dict:
+        try:
+            analysis = await run_cancellable(
+                pdf_embedder.character_analysis_from_context, name, contexts[name]
+            )
+            return {"character": name, "analysis": analysis}
+        except Exception as e:
+            logger.error(f"Analysis of {name!r} failed: {e!r}")
+            return {"character": name, "error": str(e)}
+
+    async def stream():
+        tasks = [asyncio.create_task(analyse(name)) for name in names]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # The client may have gone away; drop whatever is still running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics")
+async def metrics():
+    """Expose runtime counters."""
+    coalescing = {"chat": chat_flight.stats()}
+    caches = {}
+    retrieval = {}
+    if app.state.library is not None:
+        for book_id, pdf_embedder in app.state.library.loaded_books().items():
+            coalescing[book_id] = pdf_embedder.coalescing_stats()
+            caches[book_id] = pdf_embedder.cache_stats()
+            retrieval[book_id] = pdf_embedder.selection_stats()
+
+    return {
+        "coalescing": coalescing,
+        "caches": caches,
+        "retrieval": retrieval,
+        "prefetch": prefetcher.stats(),
+        "inference": inference_caller.stats(),
+        "websocket": manager.stats(),
+        "memory": memory_metrics(),
+        "http": pool_stats(),
+    }
+
+
+def memory_metrics() -> dict:
+    indexes = {}
+    if app.state.library is not None:
+        for book_id, pdf_embedder in app.state.library.loaded_books().items():
+            indexes[book_id] = pdf_embedder.memory_estimate()
+    return {
+        "rss_bytes": rss_bytes(),
+        "traced": traced_memory(),
+        "budget": memory_budget.stats(),
+        "indexes": indexes,
+        "ingestions": recent_profiles(),
+    }
+
 
 if __name__ == "__main__":
     import uvicorn
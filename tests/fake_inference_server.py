@@ -0,0 +1,205 @@
+"""
+A local stand-in for the Hugging Face inference API that injects latency and errors.
+"""
+
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend.embeddings import HashingEmbeddings
+
+LATENCY_DISTRIBUTIONS = ("fixed", "exponential", "lognormal")
+
+
+class FakeInferenceServer:
+    """
+    Serves OpenAI-style chat completions and feature extraction on a local port.
+
+    Chat completions are POSTed to .../chat/completions. Every other POST is
+    treated as a feature-extraction request and answered with deterministic hashing
+    embeddings of its "inputs", so the app can run with HF_INFERENCE_BASE_URL
+    pointing here.
+
+    Args:
+        latency (float): Seconds to wait before answering each chat request (the
+            mean or, for "lognormal", the median of latency_distribution)
+        error_rate (float): Probability of answering with error_status
+        error_status (int): HTTP status used for injected errors
+        fail_first (int): Number of initial requests that always fail
+        reply (str): Content returned by successful completions
+        latency_distribution (str): "fixed", "exponential" or "lognormal"
+        latency_sigma (float): Shape of the lognormal distribution
+        prefill_tokens_per_s (float | None): Prompt processing rate; adds about
+            len(prompt) / 4 / rate seconds to each chat request
+        tokens_per_s (float | None): Generation rate; adds the reply's token count
+            divided by the rate to each chat request
+        embedding_latency (float): Seconds to wait before answering each
+            feature-extraction request, drawn from the same distribution
+        embedding_dim (int): Size of the returned embeddings
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        fail_first: int = 0,
+        reply: str = "PAGE: 1",
+        seed: int = 0,
+        latency_distribution: str = "fixed",
+        latency_sigma: float = 0.5,
+        prefill_tokens_per_s: float | None = None,
+        tokens_per_s: float | None = None,
+        embedding_latency: float = 0.0,
+        embedding_dim: int = 384,
+    ):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fail_first = fail_first
+        self.reply = reply
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.prefill_tokens_per_s = prefill_tokens_per_s
+        self.tokens_per_s = tokens_per_s
+        self.embedding_latency = embedding_latency
+        self.embeddings = HashingEmbeddings(embedding_dim)
+        self.requests = 0
+        self.chat_requests = 0
+        self.embedding_requests = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _sample_latency(self, mean: float) -> float:
+        if mean <= 0 or self.latency_distribution == "fixed":
+            return max(mean, 0.0)
+        with self._lock:
+            if self.latency_distribution == "exponential":
+                return self._random.expovariate(1 / mean)
+            return self._random.lognormvariate(math.log(mean), self.latency_sigma)
+
+    def _chat_delay(self, body: dict) -> tuple[float, int, int]:
+        """Seconds to answer a chat request, and its prompt and reply token counts."""
+        prompt_tokens = (
+            sum(
+                len(str(message.get("content", "")))
+                for message in body.get("messages", [])
+            )
+            // 4
+        )
+        completion_tokens = max(1, len(self.reply) // 4)
+        delay = self._sample_latency(self.latency)
+        if self.prefill_tokens_per_s:
+            delay += prompt_tokens / self.prefill_tokens_per_s
+        if self.tokens_per_s:
+            delay += completion_tokens / self.tokens_per_s
+        return delay, prompt_tokens, completion_tokens
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            if self.requests <= self.fail_first:
+                return True
+            return self._random.random() < self.error_rate
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive, as the real API does
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._feature_extraction(body)
+                    return
+
+                with fake._lock:
+                    fake.chat_requests += 1
+                delay, prompt_tokens, completion_tokens = fake._chat_delay(body)
+                time.sleep(delay)
+
+                if fake._should_fail():
+                    self._send(fake.error_status, {"error": "injected failure"})
+                    return
+
+                self._send(
+                    200,
+                    {
+                        "id": "fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "finish_reason": "stop",
+                                "message": {
+                                    "role": "assistant",
+                                    "content": fake.reply,
+                                },
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        },
+                    },
+                )
+
+            def _feature_extraction(self, body: dict):
+                with fake._lock:
+                    fake.embedding_requests += 1
+                time.sleep(fake._sample_latency(fake.embedding_latency))
+
+                if fake._should_fail():
+                    self._send(fake.error_status, {"error": "injected failure"})
+                    return
+
+                inputs = body.get("inputs", [])
+                if isinstance(inputs, str):
+                    inputs = [inputs]
+                self._send(200, fake.embeddings.embed_documents(inputs))
+
+            def _send(self, status: int, payload):
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on this request (deadline or hedge)
+                    pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
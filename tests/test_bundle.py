@@ -0,0 +1,153 @@
+"""
+Tests for the bundle.py module and the bundle methods of BookLibrary.
+"""
+
+import json
+import zipfile
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+
+from backend.bundle import BUNDLE_VERSION, BundleError, read_manifest
+from backend.library import BookLibrary
+from tests.testing_setup import MockHuggingFaceEmbeddings
+
+
+def make_pages(text: str, count: int) -> list[Document]:
+    return [
+        Document(
+            page_content=f"{text} met Hagrid on page {i + 1}.", metadata={"page": i}
+        )
+        for i in range(count)
+    ]
+
+
+def rewrite_bundle(path, **files):
+    """Copy a bundle with some of its files replaced."""
+    with zipfile.ZipFile(path) as bundle:
+        files = {name: bundle.read(name) for name in bundle.namelist()} | files
+    with zipfile.ZipFile(path, "w") as bundle:
+        for name, data in files.items():
+            bundle.writestr(name, data)
+
+
+def rewrite_manifest(path, **changes):
+    """Copy a bundle with some manifest entries changed."""
+    with zipfile.ZipFile(path) as bundle:
+        files = {name: bundle.read(name) for name in bundle.namelist()}
+    manifest = json.loads(files["bundle.json"])
+    for key, value in changes.items():
+        if key in manifest["settings"]:
+            manifest["settings"][key] = value
+        else:
+            manifest[key] = value
+    files["bundle.json"] = json.dumps(manifest)
+    with zipfile.ZipFile(path, "w") as bundle:
+        for name, data in files.items():
+            bundle.writestr(name, data)
+
+
+class NoEmbeddings(MockHuggingFaceEmbeddings):
+    """Query embeddings only; embedding documents fails the test."""
+
+    def embed_documents(self, texts):
+        raise AssertionError("Imported books must not be embedded again")
+
+
+@pytest.fixture
+def exported(tmp_path):
+    """A bundle of a three-page book, exported from a library."""
+    with patch("backend.RAG.HuggingFaceEndpointEmbeddings", MockHuggingFaceEmbeddings):
+        library = BookLibrary(tmp_path / "source")
+        library.add_book("book-a", "a.pdf", make_pages("Harry", 3), b"%PDF-1.4")
+        return library.export_bundle("book-a", tmp_path / "book-a.charmem")
+
+
+@pytest.fixture
+def target(tmp_path):
+    """An empty library in which no document can be embedded."""
+    with patch("backend.RAG.HuggingFaceEndpointEmbeddings", NoEmbeddings):
+        yield BookLibrary(tmp_path / "target")
+
+
+class TestBundles:
+    """Test exporting books to bundles and importing them."""
+
+    def test_manifest(self, exported):
+        manifest = read_manifest(exported)
+
+        assert manifest["version"] == BUNDLE_VERSION
+        assert manifest["book_id"] == "book-a"
+        assert manifest["total_pages"] == 3
+        assert manifest["settings"]["embedding_backend"] == "remote"
+        assert manifest["settings"]["chunk_size"] == 1000
+
+    def test_import_without_embedding(self, exported, target, tmp_path):
+        result = target.import_bundle(exported)
+
+        assert result == {"book_id": "book-a", "pages": 3, "cached": False}
+        book = target.get_book("book-a")
+        assert "Harry met Hagrid on page 1" in book.semantic_search(
+            "who", current_page=1
+        )
+        assert book.db.mapped
+        assert "Hagrid" in book.names_before(1)
+        assert target.page_text("book-a", 2) == "Harry met Hagrid on page 3."
+        assert target.pdf_path("book-a").read_bytes() == b"%PDF-1.4"
+        assert target.info("book-a")["source"] == "a.pdf"
+
+        # Visible to other workers, and not imported twice
+        other_worker = BookLibrary(tmp_path / "target")
+        assert other_worker.import_bundle(exported)["cached"] is True
+        assert other_worker.get_book("book-a")._total_pages == 3
+
+    def test_import_directory(self, exported, target, tmp_path):
+        (tmp_path / "broken.charmem").write_bytes(b"not a zip")
+
+        results = target.import_bundles(tmp_path)
+
+        assert [result["book_id"] for result in results] == ["book-a"]
+
+    @pytest.mark.parametrize(
+        "changes, message",
+        [
+            ({"chunk_size": 500}, "chunk_size is 500, expected 1000"),
+            ({"embedding_model": "other/model"}, "embedding_model"),
+            ({"embedding_backend": "unknown"}, "Unknown embedding backend"),
+            ({"version": BUNDLE_VERSION + 1}, "not supported"),
+            ({"book_id": "../escape"}, "Invalid book ID"),
+        ],
+    )
+    def test_incompatible_bundles_are_refused(self, exported, target, changes, message):
+        rewrite_manifest(exported, **changes)
+
+        with pytest.raises(BundleError, match=message):
+            target.import_bundle(exported)
+        assert not target.has_book("book-a")
+
+    def test_not_a_bundle(self, tmp_path):
+        (tmp_path / "book.charmem").write_bytes(b"not a zip")
+
+        with pytest.raises(BundleError, match="Not a book bundle"):
+            read_manifest(tmp_path / "book.charmem")
+
+    def test_truncated_manifest(self, exported, target, tmp_path):
+        with zipfile.ZipFile(exported) as bundle:
+            manifest = json.loads(bundle.read("bundle.json"))
+        del manifest["total_pages"], manifest["source"]
+        rewrite_bundle(exported, **{"bundle.json": json.dumps(manifest)})
+
+        with pytest.raises(BundleError, match="no valid source"):
+            target.import_bundle(exported)
+        # A prebuilt directory holding it still opens
+        assert target.import_bundles(tmp_path) == []
+        assert not target.has_book("book-a")
+
+    def test_unreadable_index_is_not_half_imported(self, exported, target):
+        rewrite_bundle(exported, **{"index/index.json": "{"})
+
+        with pytest.raises(BundleError, match="Unreadable bundle"):
+            target.import_bundle(exported)
+        assert not target.has_book("book-a")
+        assert not (target.directory / "books" / "book-a").exists()
@@ -0,0 +1,126 @@
+"""
+Tests for the cache.py module.
+"""
+
+import pytest
+
+from backend.cache import CachedQueryEmbeddings, LRUCache, SemanticAnswerCache
+from tests.testing_setup import MockHuggingFaceEmbeddings
+
+
+class TestLRUCache:
+    """Test the LRUCache class."""
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1  # "b" is now the least recently used
+
+        cache.put("c", 3)
+
+        assert "b" not in cache
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+    def test_hit_and_miss_counters(self):
+        cache = LRUCache(4)
+        cache.put("a", 1)
+
+        cache.get("a")
+        cache.get("missing")
+        assert "a" in cache  # Membership tests are not counted
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+        assert stats["hit_rate"] == 0.5
+
+    def test_invalid_size(self):
+        with pytest.raises(ValueError):
+            LRUCache(0)
+
+
+class TestCachedQueryEmbeddings:
+    """Test the CachedQueryEmbeddings class."""
+
+    def test_query_embeddings_are_cached(self):
+        calls = []
+
+        class CountingEmbeddings(MockHuggingFaceEmbeddings):
+            def embed_query(self, text):
+                calls.append(text)
+                return super().embed_query(text)
+
+        embeddings = CachedQueryEmbeddings(CountingEmbeddings(), LRUCache(8))
+
+        first = embeddings.embed_query("Hagrid")
+        second = embeddings.embed_query("Hagrid")
+
+        assert first == second
+        assert calls == ["Hagrid"]
+        assert len(embeddings.embed_documents(["a", "b"])) == 2
+
+    def test_embed_queries_batches_misses(self):
+        """Test that uncached queries are embedded in one request."""
+        batches = []
+
+        class CountingEmbeddings(MockHuggingFaceEmbeddings):
+            def embed_documents(self, texts):
+                batches.append(list(texts))
+                return super().embed_documents(texts)
+
+        cache = LRUCache(8)
+        embeddings = CachedQueryEmbeddings(CountingEmbeddings(), cache)
+        embeddings.embed_query("Hagrid")
+
+        vectors = embeddings.embed_queries(["Hagrid", "Ron", "Hermione", "Ron"])
+
+        assert len(vectors) == 4
+        assert batches == [["Ron", "Hermione"]]
+        assert "Hermione" in cache
+
+
+class TestSemanticAnswerCache:
+    """Test the SemanticAnswerCache class."""
+
+    SNAPE = [1.0, 0.0, 0.0]
+    SNAPE_AGAIN = [0.95, 0.2, 0.0]
+    HAGRID = [0.0, 1.0, 0.0]
+    CONTEXT = "[Page 30]\nSnape sneered.\n\n---\n\n[Page 12]\nSnape looked up."
+
+    def test_similar_question_hits(self):
+        cache = SemanticAnswerCache(4, threshold=0.9, max_page_gap=10)
+        cache.put(self.SNAPE, "The potions master.", self.CONTEXT, 35)
+
+        assert cache.get(self.SNAPE_AGAIN, 35) == "The potions master."
+        assert cache.get(self.HAGRID, 35) is None
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_never_serves_pages_not_read(self):
+        """Test that an answer is only served to readers past its context."""
+        cache = SemanticAnswerCache(4, threshold=0.9, max_page_gap=10)
+        cache.put(self.SNAPE, "The potions master.", self.CONTEXT, 35)
+
+        assert cache.get(self.SNAPE, 29) is None
+        assert cache.get(self.SNAPE, 30) == "The potions master."
+        assert cache.stats()["spoiler_blocked"] == 1
+
+    def test_stale_answers_not_served(self):
+        cache = SemanticAnswerCache(4, threshold=0.9, max_page_gap=10)
+        cache.put(self.SNAPE, "The potions master.", self.CONTEXT, 35)
+
+        assert cache.get(self.SNAPE, 46) is None
+        assert cache.stats()["stale"] == 1
+
+    def test_evicts_least_recently_used(self):
+        cache = SemanticAnswerCache(2, threshold=0.9, max_page_gap=10)
+        cache.put(self.SNAPE, "Snape", self.CONTEXT, 35)
+        cache.put(self.HAGRID, "Hagrid", self.CONTEXT, 35)
+        assert cache.get(self.SNAPE, 35) == "Snape"
+
+        cache.put([0.0, 0.0, 1.0], "Dumbledore", self.CONTEXT, 35)
+
+        assert cache.get(self.HAGRID, 35) is None
+        assert cache.get(self.SNAPE, 35) == "Snape"
+        assert cache.stats()["evictions"] == 1
@@ -0,0 +1,185 @@
+"""
+Tests for the chapters.py module and hierarchical retrieval.
+"""
+
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from backend.chapters import detect_chapters, route_chapters
+from backend.flat_index import FlatVectorIndex
+from backend.RAG import EmbeddedPDF
+from tests.test_flat_index import RandomEmbeddings
+
+TOPICS = ["dragons", "potions", "quidditch", "owls"]
+
+
+def book_pages():
+    """Twelve pages: a title page, then four chapters of a single topic each."""
+    pages = ["HARRY POTTER\nand the Test Suite"]
+    for chapter, topic in enumerate(TOPICS):
+        pages.append(f"— CHAPTER {chapter + 1} —\nAll About {topic.title()}\n{topic}")
+        pages.extend([f"More {topic} and {topic} again."] * 2)
+    pages.append("The end.")
+    return pages
+
+
+class TestDetectChapters:
+    """Test the detect_chapters function."""
+
+    def test_headings_and_titles(self):
+        chapters = detect_chapters(book_pages())
+
+        assert [chapter["title"] for chapter in chapters] == [
+            "Front matter",
+            "CHAPTER 1: All About Dragons",
+            "CHAPTER 2: All About Potions",
+            "CHAPTER 3: All About Quidditch",
+            "CHAPTER 4: All About Owls",
+        ]
+        assert [(c["first_page"], c["end_page"]) for c in chapters] == [
+            (0, 1),
+            (1, 4),
+            (4, 7),
+            (7, 10),
+            (10, 14),
+        ]
+
+    def test_heading_below_scan_lines_is_ignored(self):
+        texts = ["a\nb\nc\nChapter One", "Chapter Two\nTitle"]
+
+        chapters = detect_chapters(texts, scan_lines=3)
+
+        assert [c["first_page"] for c in chapters] == [0, 1]
+        assert chapters[0]["title"] == "Front matter"
+
+    def test_fallback_sections(self):
+        chapters = detect_chapters(["plain text"] * 25, fallback_pages=10)
+
+        assert [(c["first_page"], c["end_page"]) for c in chapters] == [
+            (0, 10),
+            (10, 20),
+            (20, 25),
+        ]
+        assert chapters[-1]["title"] == "Pages 21-25"
+
+
+class TestRouteChapters:
+    """Test the route_chapters function."""
+
+    @pytest.fixture
+    def chapters(self):
+        return [
+            {"title": str(i), "first_page": 10 * i, "end_page": 10 * (i + 1)}
+            for i in range(5)
+        ]
+
+    def test_best_chapters_in_page_order(self, chapters):
+        vectors = np.eye(5, dtype=np.float32)
+        query = np.array([0.1, 0.0, 0.9, 0.0, 0.5], dtype=np.float32)
+
+        assert route_chapters(chapters, vectors, query, 50, 2) == [2, 4]
+
+    def test_current_chapter_always_included(self, chapters):
+        """The partly read chapter is searched even if it looks unrelated."""
+        vectors = np.eye(5, dtype=np.float32)
+        query = np.array([0.0, 1.0, 0.5, 0.0, 0.0], dtype=np.float32)
+
+        assert route_chapters(chapters, vectors, query, 35, 2) == [1, 3]
+
+    def test_unread_chapters_never_chosen(self, chapters):
+        vectors = np.eye(5, dtype=np.float32)
+        query = np.array([0.0, 0.0, 0.0, 0.0, 1.0], dtype=np.float32)
+
+        assert route_chapters(chapters, vectors, query, 20, 3) == [0, 1]
+
+
+class TestRowRanges:
+    """Test the row-range methods of FlatVectorIndex."""
+
+    @pytest.fixture
+    def index(self):
+        documents = [
+            Document(page_content=f"chunk {i}", metadata={"page": i % 6})
+            for i in range(30)
+        ]
+        return FlatVectorIndex.from_documents(documents, RandomEmbeddings())
+
+    def test_row_range(self, index):
+        start, stop = index.row_range(2, 4)
+
+        pages = [doc.metadata["page"] for doc in index.documents[start:stop]]
+        assert pages == [2] * 5 + [3] * 5
+
+    def test_search_in_rows_matches_full_scores(self, index):
+        ranges = [index.row_range(0, 1), index.row_range(4, 6)]
+        query = index.normalise(RandomEmbeddings().embed_query("query"))
+
+        hits = index.search_by_vector_in_rows(query, 4, ranges)
+
+        rows = [i for start, stop in ranges for i in range(start, stop)]
+        scores = index._scores(query, len(index.documents))
+        expected = sorted(rows, key=lambda i: -scores[i])[:4]
+        assert [i for i, _ in hits] == expected
+        assert index.search_by_vector_in_rows(query, 4, [(3, 3)]) == []
+
+    def test_centroids(self, index):
+        centroids = index.centroids([index.row_range(0, 3), (0, 0)])
+
+        assert np.linalg.norm(centroids[0]) == pytest.approx(1.0, abs=1e-5)
+        assert not centroids[1].any()
+
+
+class TestHierarchicalSearch:
+    """Test two-stage retrieval in EmbeddedPDF."""
+
+    @pytest.fixture
+    def pdf_embedder(self):
+        pdf_embedder = EmbeddedPDF(
+            index_backend="flat",
+            embedding_backend="hashing",
+            chunking_strategy="page",
+            retrieval_mode="hierarchical",
+            top_chapters=2,
+        )
+        pdf_embedder.embed_pdf(
+            [
+                Document(page_content=text, metadata={"page": page})
+                for page, text in enumerate(book_pages())
+            ]
+        )
+        return pdf_embedder
+
+    def test_chapters_detected_at_ingestion(self, pdf_embedder):
+        assert len(pdf_embedder.chapters) == 5
+
+    def test_routes_to_matching_chapter(self, pdf_embedder):
+        context = pdf_embedder.semantic_search("quidditch", k=3, current_page=14)
+
+        assert "More quidditch" in context
+        assert "dragons" not in context
+        stats = pdf_embedder.selection_stats()
+        assert stats["routed_searches"] == 1
+        assert stats["mean_chapters"] == 2
+        assert stats["mean_skipped_chunks"] > 0
+
+    def test_matches_flat_search_when_visiting_every_chapter(self, pdf_embedder):
+        pdf_embedder.top_chapters = len(pdf_embedder.chapters)
+        vector = pdf_embedder.embedding_function.embed_query("potions")
+
+        routed = pdf_embedder._hierarchical_search("potions", 4, 8, vector)
+        flat = pdf_embedder.db.search_by_vector(pdf_embedder.db.normalise(vector), 4, 8)
+
+        assert [doc for doc, _ in routed] == [
+            pdf_embedder.db.documents[i] for i, _ in flat
+        ]
+
+    def test_summaries_used_for_routing(self, pdf_embedder):
+        summary = "Owls deliver mail."
+        with patch.object(pdf_embedder, "_complete", return_value=summary):
+            pdf_embedder.summarize_chapters()
+
+        assert all(c["summary"] == summary for c in pdf_embedder.chapters)
+        assert pdf_embedder._routing().shape == (5, len(pdf_embedder.db._vectors[0]))
@@ -0,0 +1,128 @@
+"""
+Tests for the cleaning.py module.
+"""
+
+from langchain_core.documents import Document
+
+from backend.cleaning import (
+    drop_duplicate_chunks,
+    find_boilerplate,
+    strip_page_boilerplate,
+)
+from backend.RAG import EmbeddedPDF
+
+STORY = [
+    "Mr and Mrs Dursley were proud to say that they were perfectly normal.",
+    "They were the last people to be involved in anything strange.",
+    "Mr Dursley was the director of a firm called Grunnings.",
+    "Mrs Dursley was thin and blonde and had nearly twice the usual neck.",
+    "The Dursleys had a small son called Dudley.",
+    "They didn't think there was a finer boy anywhere.",
+    "The Dursleys had everything they wanted.",
+    "They also had a secret, and their greatest fear was discovery.",
+]
+
+
+def book_pages(count: int) -> list[Document]:
+    """Pages with running titles and page numbers, as extracted from a PDF."""
+    pages = []
+    for i in range(count):
+        header = (
+            f"{i + 1} H ARRY  POTTER " if i % 2 else f" T HE  BOY  WHO  LIVED {i + 1}"
+        )
+        text = f"{header}\n \n{STORY[i]}\n{STORY[-i - 1]}\n{i + 1}\n"
+        pages.append(Document(page_content=text, metadata={"page": i}))
+    return pages
+
+
+class TestBoilerplate:
+    """Test the detection and stripping of running headers and footers."""
+
+    def test_running_titles_and_page_numbers(self):
+        boilerplate = find_boilerplate([page.page_content for page in book_pages(8)])
+
+        assert boilerplate == {"#harrypotter", "theboywholived#", "#"}
+
+    def test_strip(self):
+        pages = book_pages(8)
+
+        cleaned, report = strip_page_boilerplate(pages)
+
+        assert cleaned[3].page_content == f" \n{STORY[3]}\n{STORY[4]}\n"
+        assert cleaned[3].metadata == {"page": 3}
+        assert pages[3].page_content.startswith("4 H ARRY")
+        assert report["boilerplate_lines"] == 16
+
+    def test_rare_lines_are_kept(self):
+        pages = book_pages(3)
+
+        cleaned, report = strip_page_boilerplate(pages)
+
+        assert [page.page_content for page in cleaned] == [
+            page.page_content for page in pages
+        ]
+        assert report["boilerplate_lines"] == 0
+
+    def test_lines_scattered_through_a_long_book_are_kept(self):
+        """Test a line opening a few far apart pages, next to chapter titles."""
+        texts = []
+        for i in range(200):
+            if i % 40 == 0:
+                header = "Yes, Professor."
+            elif 20 <= i < 36 and i % 2:
+                header = f"{i + 1} THE SORTING HAT"
+            else:
+                header = ""
+            texts.append(f"{header}\n{STORY[i % 8]}\n{STORY[(i + 3) % 8]}\n")
+
+        boilerplate = find_boilerplate(texts)
+
+        assert "#thesortinghat" in boilerplate
+        assert "yes,professor." not in boilerplate
+        # A fixed count of pages alone would strip it
+        assert "yes,professor." in find_boilerplate(
+            texts, min_fraction=0, min_density=0
+        )
+
+    def test_single_line_pages_are_kept(self):
+        pages = [Document(page_content=f"Page {i}", metadata={}) for i in range(5)]
+
+        cleaned, _ = strip_page_boilerplate(pages)
+
+        assert [page.page_content for page in cleaned] == [
+            f"Page {i}" for i in range(5)
+        ]
+
+
+class TestDuplicateChunks:
+    """Test the removal of chunks with identical text."""
+
+    def test_first_copy_is_kept(self):
+        chunks = [
+            Document(page_content="* * *", metadata={"page": 1}),
+            Document(page_content="Harry", metadata={"page": 1}),
+            Document(page_content=" *  * *\n", metadata={"page": 4}),
+        ]
+
+        unique, dropped = drop_duplicate_chunks(chunks)
+
+        assert [chunk.metadata["page"] for chunk in unique] == [1, 1]
+        assert dropped == 1
+
+    def test_embed_pdf_reports_savings(self):
+        pages = book_pages(8) + [
+            Document(page_content="The end.", metadata={"page": 8}),
+            Document(page_content="The end.", metadata={"page": 9}),
+        ]
+        pdf_embedder = EmbeddedPDF(
+            index_backend="flat", embedding_backend="hashing", chunking_strategy="page"
+        )
+
+        result = pdf_embedder.embed_pdf(pages)
+
+        assert result["cleaning"]["boilerplate_lines"] == 16
+        assert result["cleaning"]["duplicate_chunks"] == 1
+        assert result["cleaning"]["chunks_saved"] == 1
+        assert result["cleaning"]["embedded_chars_saved"] > 0
+        assert len(pdf_embedder.db) == 9
+        assert "H ARRY" not in pdf_embedder.semantic_search("Harry", full_book=True)
@@ -0,0 +1,111 @@
+"""
+Tests for the embeddings.py module.
+"""
+
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from backend import embeddings as embeddings_module
+from backend.embeddings import HashingEmbeddings, shared_local_embeddings
+from backend.RAG import EmbeddedPDF, create_embeddings
+from tests.fake_inference_server import FakeInferenceServer
+
+
+class FakeSentenceTransformer:
+    """Records encode calls instead of running a model."""
+
+    loads = 0
+
+    def __init__(self, model_id, device):
+        FakeSentenceTransformer.loads += 1
+        self.batches = []
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=False, **kwargs):
+        self.batches.append(list(texts))
+        return np.array([[float(len(text)), 1.0] for text in texts])
+
+
+class TestHashingEmbeddings:
+    """Test the HashingEmbeddings class."""
+
+    def test_deterministic_and_normalised(self):
+        embeddings = HashingEmbeddings(dim=64)
+
+        vector = embeddings.embed_query("Harry met Hagrid")
+
+        assert len(vector) == 64
+        assert (
+            vector == HashingEmbeddings(dim=64).embed_documents(["Harry met Hagrid"])[0]
+        )
+        assert np.linalg.norm(vector) == pytest.approx(1.0)
+
+    def test_shared_words_are_similar(self):
+        embeddings = HashingEmbeddings()
+        query, related, unrelated = np.array(
+            embeddings.embed_documents(
+                ["Hagrid the giant", "the giant Hagrid knocked", "Frodo left the Shire"]
+            )
+        )
+
+        assert query @ related > query @ unrelated
+
+    def test_backend_for_embedded_pdf(self):
+        """Test that a book can be indexed and searched without any model."""
+        pages = [
+            Document(page_content="Hagrid is a giant.", metadata={"page": 0}),
+            Document(page_content="Frodo lives in the Shire.", metadata={"page": 1}),
+        ]
+        pdf_embedder = EmbeddedPDF(embedding_backend="hashing", index_backend="flat")
+        pdf_embedder.embed_pdf(pages)
+
+        result = pdf_embedder.semantic_search("giant Hagrid", full_book=True)
+
+        assert result.startswith("[Page 1]\nHagrid")
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError, match="Unknown embedding backend"):
+            EmbeddedPDF(embedding_backend="openai")
+
+
+class TestLocalEmbeddings:
+    """Test the in-process SentenceTransformer backend."""
+
+    @patch.object(
+        embeddings_module, "_load_sentence_transformer", FakeSentenceTransformer
+    )
+    @patch.dict(embeddings_module._local_models, clear=True)
+    def test_model_is_shared_and_batched(self):
+        FakeSentenceTransformer.loads = 0
+        embeddings = shared_local_embeddings("some/model")
+        assert shared_local_embeddings("some/model") is embeddings
+        assert FakeSentenceTransformer.loads == 1
+
+        embeddings.batch_size = 2
+        vectors = embeddings.embed_documents(["a", "bb", "ccc", "dddd", "eeeee"])
+
+        assert [vector[0] for vector in vectors] == [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert sorted(map(len, embeddings.model.batches)) == [1, 2, 2]
+        assert embeddings.embed_query("abc") == [3.0, 1.0]
+
+    @patch.dict("sys.modules", {"sentence_transformers": None})
+    def test_requires_sentence_transformers(self):
+        with pytest.raises(RuntimeError, match="sentence-transformers"):
+            embeddings_module.LocalEmbeddings("some/model")
+
+
+class TestRemoteEmbeddings:
+    """Test the remote backend against the local fake inference server."""
+
+    def test_fake_server_feature_extraction(self):
+        with FakeInferenceServer() as server:
+            with patch("backend.RAG.HF_INFERENCE_BASE_URL", server.url):
+                embeddings = create_embeddings("remote")
+                vectors = embeddings.embed_documents(["Hagrid", "Frodo"])
+
+        assert np.allclose(
+            vectors, HashingEmbeddings().embed_documents(["Hagrid", "Frodo"])
+        )
+        assert server.embedding_requests == 1
@@ -0,0 +1,229 @@
+"""
+Tests for the flat_index.py module.
+"""
+
+import os
+import zlib
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from backend.flat_index import FlatVectorIndex
+from backend.RAG import EmbeddedPDF
+from tests.testing_setup import MockHuggingFaceEmbeddings
+
+
+class RandomEmbeddings:
+    """Deterministic random embeddings keyed by text."""
+
+    def __init__(self, dim=32, seed=0):
+        self.dim = dim
+        self.seed = seed
+
+    def _vector(self, text):
+        seed = zlib.crc32(text.encode()) + self.seed
+        return np.random.default_rng(seed).normal(size=self.dim).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def documents():
+    """Chunks spread over ten pages, deliberately not in page order."""
+    return [
+        Document(page_content=f"chunk {i}", metadata={"page": (i * 7) % 10})
+        for i in range(60)
+    ]
+
+
+def brute_force(documents, embeddings, query, k, page_limit):
+    """Reference top-k by cosine similarity over chunks below the page bound."""
+    q = np.asarray(embeddings.embed_query(query))
+    q = q / np.linalg.norm(q)
+    scored = []
+    for doc in documents:
+        if doc.metadata["page"] < page_limit:
+            v = np.asarray(embeddings.embed_query(doc.page_content))
+            scored.append((float(v @ q / np.linalg.norm(v)), doc.page_content))
+    return [text for _, text in sorted(scored, reverse=True)[:k]]
+
+
+class TestFlatVectorIndex:
+    """Test the FlatVectorIndex class."""
+
+    def test_matrix_is_sorted_by_page(self, documents):
+        index = FlatVectorIndex.from_documents(documents, RandomEmbeddings())
+
+        pages = [doc.metadata["page"] for doc in index.documents]
+        assert pages == sorted(pages)
+        assert index.nbytes > 0
+
+    @pytest.mark.parametrize("page_limit", [1, 4, 10])
+    def test_page_bounded_search_matches_brute_force(self, documents, page_limit):
+        embeddings = RandomEmbeddings()
+        index = FlatVectorIndex.from_documents(documents, embeddings)
+
+        results = index.similarity_search_with_relevance_scores(
+            "query", k=5, filter={"page": {"$lt": page_limit}}
+        )
+
+        assert all(doc.metadata["page"] < page_limit for doc, _ in results)
+        assert [doc.page_content for doc, _ in results] == brute_force(
+            documents, embeddings, "query", 5, page_limit
+        )
+        scores = [score for _, score in results]
+        assert scores == sorted(scores, reverse=True)
+
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_quantised_storage_keeps_ranking(self, documents, dtype):
+        """Test that reduced-precision storage returns (nearly) the same top-k."""
+        embeddings = RandomEmbeddings()
+        exact = FlatVectorIndex.from_documents(documents, embeddings)
+        compact = FlatVectorIndex.from_documents(documents, embeddings, dtype=dtype)
+
+        expected = {
+            d.page_content
+            for d, _ in exact.similarity_search_with_relevance_scores("q", k=10)
+        }
+        actual = {
+            d.page_content
+            for d, _ in compact.similarity_search_with_relevance_scores("q", k=10)
+        }
+
+        assert len(expected & actual) >= 9
+        assert compact.nbytes < exact.nbytes
+
+    def test_book_filter(self):
+        documents = [
+            Document(page_content=f"{book} {i}", metadata={"page": i, "book_id": book})
+            for book in ("a", "b")
+            for i in range(5)
+        ]
+        index = FlatVectorIndex.from_documents(documents, RandomEmbeddings())
+
+        results = index.similarity_search_with_relevance_scores(
+            "q",
+            k=10,
+            filter={"$and": [{"book_id": {"$eq": "b"}}, {"page": {"$lt": 3}}]},
+        )
+
+        assert len(results) == 3
+        assert all(doc.metadata["book_id"] == "b" for doc, _ in results)
+
+    def test_single_book_index_needs_no_mask(self):
+        """Test that filtering a one-book index by its book scores it unmasked."""
+        documents = [
+            Document(page_content=f"a {i}", metadata={"page": i, "book_id": "a"})
+            for i in range(5)
+        ]
+        index = FlatVectorIndex.from_documents(documents, RandomEmbeddings())
+        query = index.normalise(RandomEmbeddings().embed_query("q"))
+
+        # Masking would fail without the book IDs
+        with patch.object(index, "_book_ids", None):
+            hits = index.search_by_vector(query, 3, page_limit=4, book_id="a")
+
+        assert hits == index.search_by_vector(query, 3, page_limit=4)
+        assert index.search_by_vector(query, 3, book_id="b") == []
+
+    def test_mmr_returns_distinct_results(self, documents):
+        index = FlatVectorIndex.from_documents(documents, RandomEmbeddings())
+
+        results = index.max_marginal_relevance_search(
+            "q", k=5, fetch_k=20, filter={"page": {"$lt": 10}}
+        )
+
+        assert len({doc.page_content for doc in results}) == 5
+
+    @pytest.mark.parametrize("dtype", ["float32", "int8"])
+    def test_save_and_memmap_load(self, documents, tmp_path, dtype):
+        """Test that a saved index is memory-mapped and answers identically."""
+        embeddings = RandomEmbeddings()
+        index = FlatVectorIndex.from_documents(documents, embeddings, dtype=dtype)
+        index.save(tmp_path)
+
+        loaded = FlatVectorIndex.load(tmp_path, embeddings)
+
+        assert isinstance(loaded._vectors, np.memmap)
+        original = index.similarity_search_with_relevance_scores("q", k=5)
+        reloaded = loaded.similarity_search_with_relevance_scores("q", k=5)
+        assert [d.page_content for d, _ in original] == [
+            d.page_content for d, _ in reloaded
+        ]
+
+    def test_unsupported_filter(self, documents):
+        index = FlatVectorIndex.from_documents(documents, RandomEmbeddings())
+
+        with pytest.raises(ValueError, match="Unsupported filter"):
+            index.similarity_search_with_relevance_scores(
+                "q", filter={"source": "a.pdf"}
+            )
+
+
+class TestEmbeddedPDFFlatBackend:
+    """Test EmbeddedPDF with the flat index backend."""
+
+    @patch.dict(os.environ, {"HUGGINGFACE_API_TOKEN": "test_token"})
+    @patch("backend.RAG.HuggingFaceEndpointEmbeddings")
+    def test_embed_and_search(self, mock_embeddings, tmp_path):
+        mock_embeddings.return_value = MockHuggingFaceEmbeddings()
+        pages = [
+            Document(page_content=f"Page {i} text", metadata={"page": i})
+            for i in range(4)
+        ]
+
+        pdf_embedder = EmbeddedPDF(index_backend="flat")
+        result = pdf_embedder.embed_pdf(pages, persist_directory=str(tmp_path))
+
+        assert result["success"] is True
+        assert isinstance(pdf_embedder.db, FlatVectorIndex)
+        search = pdf_embedder.semantic_search("text", current_page=2)
+        assert "[Page 1]" in search and "[Page 2]" in search
+        assert "[Page 3]" not in search
+
+        reopened = EmbeddedPDF(index_backend="flat")
+        reopened.load_index(str(tmp_path), total_pages=4)
+        assert "[Page 4]" in reopened.semantic_search("text", full_book=True)
+
+    @pytest.fixture
+    def pdf_embedder(self, documents):
+        pdf_embedder = EmbeddedPDF(index_backend="flat", embedding_backend="hashing")
+        pdf_embedder.embedding_function = RandomEmbeddings()
+        pdf_embedder.attach(
+            FlatVectorIndex.from_documents(documents, RandomEmbeddings()), 10
+        )
+        return pdf_embedder
+
+    def test_ranking_serves_every_page_bound(self, pdf_embedder):
+        """Test that one full-book ranking gives each page bound its own top-k."""
+        db = pdf_embedder.db
+        vector = db.normalise(pdf_embedder.embedding_function.embed_query("chunk 7"))
+
+        for page_limit in (2, 5, 10):
+            hits = pdf_embedder._ranked_hits("chunk 7", 4, page_limit)
+            assert hits == db.search_by_vector(vector, 4, page_limit)
+
+        stats = pdf_embedder.cache_stats()["ranked"]
+        assert (stats["misses"], stats["hits"], stats["fallbacks"]) == (1, 2, 0)
+
+    def test_ranking_falls_back_below_depth(self, pdf_embedder):
+        """Test that a bounded search runs when the ranking is too short."""
+        pdf_embedder.ranked_depth = 10
+        db = pdf_embedder.db
+        vector = db.normalise(pdf_embedder.embedding_function.embed_query("chunk 7"))
+
+        hits = pdf_embedder._ranked_hits("chunk 7", 5, 1)
+
+        assert hits == db.search_by_vector(vector, 5, 1)
+        assert pdf_embedder.cache_stats()["ranked"]["fallbacks"] == 1
+
+    @patch("backend.RAG.HuggingFaceEndpointEmbeddings")
+    def test_unknown_backend(self, mock_embeddings):
+        with pytest.raises(ValueError, match="Unknown index backend"):
+            EmbeddedPDF(index_backend="faiss")
@@ -0,0 +1,73 @@
+"""
+Tests for the followup.py module.
+"""
+
+from backend.followup import FollowUpDetector, refers_back
+
+SNAPE = [1.0, 0.0, 0.0]
+SNAPE_AGAIN = [0.9, 0.3, 0.0]
+# Cosine similarity 0.6 with SNAPE
+HIS_WAND = [0.6, 0.0, 0.8]
+WAND = [0.0, 0.0, 1.0]
+
+
+class TestRefersBack:
+    """Test the refers_back function."""
+
+    def test_pronouns_and_connectives(self):
+        assert refers_back("and what about his wand?")
+        assert refers_back("Why did she leave?")
+        assert refers_back("What about the cloak")
+
+    def test_new_names_or_standalone_questions(self):
+        assert not refers_back("What did Hagrid give him?")
+        assert not refers_back("Who is the headmaster?")
+
+
+class TestFollowUpDetector:
+    """Test the FollowUpDetector class."""
+
+    def test_first_message_is_not_a_follow_up(self):
+        assert not FollowUpDetector(0.8).is_follow_up("and his wand?", WAND, "b", 40)
+
+    def test_similar_or_referring_message_on_same_page(self):
+        followups = FollowUpDetector(0.8)
+        followups.retrieved(SNAPE, "b", 40, tokens=1200)
+
+        assert followups.is_follow_up("Tell me about Snape", SNAPE_AGAIN, "b", 40)
+        assert followups.is_follow_up("and his wand?", HIS_WAND, "b", 40)
+        assert not followups.is_follow_up("Where is the wand?", HIS_WAND, "b", 40)
+
+    def test_pronoun_alone_is_not_a_follow_up(self):
+        followups = FollowUpDetector(0.8, referring_threshold=0.5)
+        followups.retrieved(SNAPE, "b", 40, tokens=1200)
+
+        assert not followups.is_follow_up(
+            "what is he hiding in the forest?", WAND, "b", 40
+        )
+
+    def test_page_or_book_change_needs_a_new_retrieval(self):
+        followups = FollowUpDetector(0.8)
+        followups.retrieved(SNAPE, "b", 40, tokens=1200)
+
+        assert not followups.is_follow_up("and his wand?", SNAPE, "b", 41)
+        assert not followups.is_follow_up("and his wand?", SNAPE, "other", 40)
+
+    def test_counts_avoided_retrievals_and_tokens(self):
+        followups = FollowUpDetector(0.8)
+        followups.retrieved(SNAPE, "b", 40, tokens=1200)
+        followups.reused_previous(WAND)
+        followups.reused_previous(WAND)
+
+        assert followups.stats() == {
+            "retrievals": 1,
+            "reused_retrievals": 2,
+            "prompt_tokens_avoided": 2400,
+        }
+
+    def test_forget(self):
+        followups = FollowUpDetector(0.8)
+        followups.retrieved(SNAPE, "b", 40, tokens=1200)
+        followups.forget()
+
+        assert not followups.is_follow_up("and his wand?", SNAPE, "b", 40)
@@ -0,0 +1,64 @@
+"""
+Tests for the http_pool.py module, run against a local fake inference server.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from huggingface_hub import InferenceClient
+
+from backend.http_pool import configure_http_pool, pool_stats
+from backend.RAG import create_embeddings
+from tests.fake_inference_server import FakeInferenceServer
+
+
+def host_stats(server: FakeInferenceServer) -> dict:
+    host = server.url.split("//")[1].split("/")[0]
+    return pool_stats()["hosts"][f"http://{host}"]
+
+
+def chat(client: InferenceClient) -> str:
+    response = client.chat_completion(
+        [{"role": "user", "content": "On which page?"}], model="fake"
+    )
+    return response.choices[0].message.content
+
+
+class TestPooledAdapter:
+    """Test that all inference traffic shares one keep-alive pool."""
+
+    def test_configured_once(self):
+        assert configure_http_pool() is configure_http_pool()
+
+    def test_clients_reuse_connections(self):
+        configure_http_pool()
+        with FakeInferenceServer() as server:
+            for _ in range(5):
+                # A new client per call, as each EmbeddedPDF has its own
+                client = InferenceClient(base_url=server.url, api_key="test")
+                assert chat(client) == "PAGE: 1"
+            with patch("backend.RAG.HF_INFERENCE_BASE_URL", server.url):
+                create_embeddings("remote").embed_documents(["Hagrid"])
+
+            stats = host_stats(server)
+
+        assert stats["requests"] == 6
+        assert stats["connections_opened"] == 1
+        assert stats["idle"] == 1
+
+    def test_threads_share_the_pool(self):
+        adapter = configure_http_pool()
+        with FakeInferenceServer(latency=0.05) as server:
+            client = InferenceClient(base_url=server.url, api_key="test")
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                for _ in range(3):
+                    list(executor.map(lambda _: chat(client), range(4)))
+
+            stats = host_stats(server)
+
+        assert stats["requests"] == 12
+        # Each thread has its own Session, but connections outlive the threads' turns
+        assert stats["connections_opened"] <= 4
+        assert stats["idle"] == stats["connections_opened"]
+        assert pool_stats()["in_flight"] == 0
+        assert adapter.stats()["peak_in_flight"] >= 2
@@ -0,0 +1,111 @@
+"""
+Tests for the ingest.py and ratelimit.py modules.
+"""
+
+import threading
+import time
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+from backend.ingest import find_pdfs, ingest_directory, throughput_summary
+from backend.library import BookLibrary
+from backend.ratelimit import RateLimiter
+from tests.fake_inference_server import FakeInferenceServer
+
+BOOK = "backend/data/books/Harry-Potter-and-the-Philosophers-Stone.pdf"
+
+
+def write_excerpt(path, first_page: int, count: int):
+    """A small PDF made of a few pages of the bundled book."""
+    reader = PdfReader(BOOK)
+    writer = PdfWriter()
+    for page in reader.pages[first_page : first_page + count]:
+        writer.add_page(page)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as file:
+        writer.write(file)
+
+
+class TestRateLimiter:
+    """Test the RateLimiter class."""
+
+    def test_burst_then_rate(self):
+        limiter = RateLimiter(rate=20, burst=2)
+
+        start = time.monotonic()
+        waits = [limiter.acquire() for _ in range(6)]
+        elapsed = time.monotonic() - start
+
+        assert waits[:2] == [0.0, 0.0]
+        # The four calls after the burst are spaced 1/20 s apart
+        assert 0.18 <= elapsed < 0.5
+        assert limiter.stats()["calls"] == 6
+
+    def test_shared_by_threads(self):
+        limiter = RateLimiter(rate=50, burst=1)
+        threads = [
+            threading.Thread(target=lambda: [limiter.acquire() for _ in range(5)])
+            for _ in range(4)
+        ]
+
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert time.monotonic() - start >= 19 / 50
+        assert limiter.stats()["calls"] == 20
+
+    def test_rate_must_be_positive(self):
+        with pytest.raises(ValueError):
+            RateLimiter(rate=0)
+
+
+class TestIngestDirectory:
+    """Test batch ingestion in worker processes against the fake server."""
+
+    def test_ingest_and_resume(self, tmp_path, monkeypatch):
+        books = tmp_path / "books"
+        write_excerpt(books / "a.pdf", 20, 3)
+        write_excerpt(books / "nested" / "b.pdf", 40, 2)
+        write_excerpt(books / "copy of a.pdf", 20, 3)
+        (books / "notes.txt").write_text("not a book")
+        (books / "broken.pdf").write_bytes(b"not a pdf")
+        library_dir = tmp_path / "library"
+
+        with FakeInferenceServer() as server:
+            # Worker processes are spawned and read the endpoint at import
+            monkeypatch.setenv("HF_INFERENCE_BASE_URL", server.url)
+            rows, limiter = ingest_directory(books, library_dir, workers=2, rate=100)
+            embedding_requests = server.embedding_requests
+            again, _ = ingest_directory(books, library_dir, workers=1, rate=100)
+
+        statuses = sorted(row["status"] for row in rows)
+        assert statuses == ["failed", "ingested", "ingested", "skipped"]
+        assert limiter["calls"] == embedding_requests > 0
+        library = BookLibrary(library_dir)
+        assert [book["total_pages"] for book in library.list_books()] in (
+            [3, 2],
+            [2, 3],
+        )
+        assert not any((library_dir / "staging").iterdir())
+
+        # Resumed: finished books are not embedded again
+        assert server.embedding_requests == embedding_requests
+        assert sorted(row["status"] for row in again) == [
+            "failed",
+            "skipped",
+            "skipped",
+            "skipped",
+        ]
+        summary = throughput_summary(rows, 1.0)
+        assert "pages/s" in summary and "2 ingested" in summary
+
+    def test_find_pdfs(self, tmp_path):
+        (tmp_path / "b").mkdir()
+        for name in ("b/x.PDF", "a.pdf", "c.txt"):
+            (tmp_path / name).write_bytes(b"")
+
+        assert [path.name for path in find_pdfs(tmp_path)] == ["a.pdf", "x.PDF"]
@@ -0,0 +1,158 @@
+"""
+Tests for the library.py module.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+from PIL import Image
+
+from backend import library as library_module
+from backend.library import BookLibrary, book_id_for
+from tests.testing_setup import MockHuggingFaceEmbeddings, make_pdf
+
+
+def make_pages(text: str, count: int) -> list[Document]:
+    return [
+        Document(page_content=f"{text} on page {i + 1}.", metadata={"page": i})
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def library(tmp_path):
+    """A library embedding with the mock embeddings."""
+    with patch("backend.RAG.HuggingFaceEndpointEmbeddings", MockHuggingFaceEmbeddings):
+        yield BookLibrary(tmp_path)
+
+
+class TestBookLibrary:
+    """Test the BookLibrary class."""
+
+    def test_book_id_is_content_hash(self):
+        assert book_id_for(b"book one") == book_id_for(b"book one")
+        assert book_id_for(b"book one") != book_id_for(b"book two")
+
+    def test_add_book_tags_chunks(self, library):
+        """Test that ingested chunks carry the book ID and source."""
+        result = library.add_book("book-a", "a.pdf", make_pages("Harry", 3))
+
+        assert result["success"] is True
+        assert result["cached"] is False
+        assert library.has_book("book-a")
+        documents = library.get_book("book-a").db.documents
+        assert all(doc.metadata["book_id"] == "book-a" for doc in documents)
+        assert all(doc.metadata["source"] == "a.pdf" for doc in documents)
+
+    def test_add_existing_book_is_not_reingested(self, library):
+        library.add_book("book-a", "a.pdf", make_pages("Harry", 3))
+        index = library.get_book("book-a").db
+
+        result = library.add_book("book-a", "a.pdf", make_pages("Harry", 3))
+
+        assert result["cached"] is True
+        assert result["pages"] == 3
+        assert library.get_book("book-a").db is index
+
+    def test_retrieval_is_filtered_by_book_and_page(self, library):
+        """Test that a book's view only sees its own chunks below the page bound."""
+        library.add_book("book-a", "a.pdf", make_pages("Harry", 3))
+        library.add_book("book-b", "b.pdf", make_pages("Frodo", 3))
+
+        book_a = library.get_book("book-a")
+        result = book_a.semantic_search("who is here", current_page=2)
+
+        assert "Harry on page 1" in result
+        assert "Harry on page 2" in result
+        assert "Harry on page 3" not in result
+        assert "Frodo" not in result
+
+        full_book = library.get_book("book-b").semantic_search("who", full_book=True)
+        assert "Frodo on page 3" in full_book
+        assert "Harry" not in full_book
+
+    def test_switching_books_reuses_views(self, library):
+        library.add_book("book-a", "a.pdf", make_pages("Harry", 2))
+
+        assert library.get_book("book-a") is library.get_book("book-a")
+        with pytest.raises(KeyError):
+            library.get_book("missing")
+
+    def test_manifest_persists(self, library, tmp_path):
+        """Test that a reopened library knows previously ingested books."""
+        library.add_book("book-a", "a.pdf", make_pages("Harry", 2))
+
+        reopened = BookLibrary(tmp_path)
+
+        assert reopened.has_book("book-a")
+        assert reopened.list_books()[0]["source"] == "a.pdf"
+        assert reopened.get_book("book-a")._total_pages == 2
+
+    def test_books_are_shared_between_processes(self, library, tmp_path):
+        """Test that a book ingested by one worker is readable by another."""
+        other_worker = BookLibrary(tmp_path)
+        assert not other_worker.has_book("book-a")
+
+        library.add_book("book-a", "a.pdf", make_pages("Harry", 3))
+
+        book = other_worker.get_book("book-a")
+        assert "Harry on page 1" in book.semantic_search("who", current_page=1)
+        # The index is memory-mapped read-only rather than loaded
+        assert not book.db.embeddings().flags.writeable
+        assert other_worker.add_book("book-a", "a.pdf", [])["cached"] is True
+
+    def test_page_texts_and_pdf_are_kept(self, library, tmp_path):
+        """Test that single pages can be read back after a restart."""
+        library.add_book("book-a", "a.pdf", make_pages("Harry", 3), b"%PDF-1.4")
+
+        reopened = BookLibrary(tmp_path)
+
+        assert reopened.page_text("book-a", 1) == "Harry on page 2."
+        assert reopened.pdf_path("book-a").read_bytes() == b"%PDF-1.4"
+        with pytest.raises(IndexError):
+            reopened.page_text("book-a", 3)
+        with pytest.raises(KeyError):
+            reopened.page_text("missing", 0)
+
+    def test_chapters_are_kept(self, library, tmp_path):
+        """Test that chapters found at ingestion survive a restart."""
+        pages = make_pages("Harry", 4)
+        pages[2].page_content = (
+            "CHAPTER TWO\nThe Vanishing Glass\n" + pages[2].page_content
+        )
+        library.add_book("book-a", "a.pdf", pages)
+
+        reopened = BookLibrary(tmp_path)
+
+        chapters = reopened.get_book("book-a").chapters
+        assert [c["title"] for c in chapters] == [
+            "Front matter",
+            "CHAPTER TWO: The Vanishing Glass",
+        ]
+        assert (tmp_path / "books" / "book-a" / "chapters.json").exists()
+
+    def test_page_image_is_rendered_once(self, library):
+        library.add_book("book-a", "a.pdf", make_pages("Harry", 2), make_pdf(2))
+
+        image_path = library.page_image("book-a", 1, 100)
+
+        assert image_path.read_bytes().startswith(b"\x89PNG")
+        with patch.object(library_module.pdfium, "PdfDocument") as document:
+            assert library.page_image("book-a", 1, 100) == image_path
+        document.assert_not_called()
+        with pytest.raises(IndexError):
+            library.page_image("book-a", 2, 100)
+
+    def test_concurrent_renders_publish_whole_images(self, library):
+        library.add_book("book-a", "a.pdf", make_pages("Harry", 2), make_pdf(2))
+
+        with ThreadPoolExecutor(4) as executor:
+            paths = set(
+                executor.map(lambda _: library.page_image("book-a", 0, 80), range(8))
+            )
+
+        (image_path,) = paths
+        assert Image.open(image_path).size[0] == 80
+        assert [path.name for path in image_path.parent.iterdir()] == [image_path.name]
@@ -0,0 +1,419 @@
+"""
+Tests for the main.py module.
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+import main
+from backend.cache import LRUCache
+from backend.embeddings import HashingEmbeddings
+from backend.library import BookLibrary
+from backend.memory import MemoryBudget
+from backend.RAG import query_embedding_caches
+from backend.session_store import SessionStore
+from tests.testing_setup import make_pdf
+
+BOOK_ID = "book-a"
+
+PAGES = [
+    Document(page_content=text, metadata={"page": i})
+    for i, text in enumerate(
+        [
+            "Harry Potter lived with the Dursleys in a cupboard under the stairs.",
+            "Hagrid gave Harry a birthday cake and told him he was a wizard.",
+            "Snape taught Potions in the dungeons and disliked Harry at once.",
+            "Snape was hiding something on the third floor corridor.",
+            "In the Forbidden Forest Harry met a centaur called Firenze.",
+            "Quirrell turned out to be hiding Voldemort under his turban.",
+        ]
+    )
+]
+
+
+class FakeChatClient:
+    """Chat completions with a fixed reply, held back until release is set."""
+
+    def __init__(self, reply: str = "Snape teaches Potions."):
+        self.reply = reply
+        self.requests: list[list[dict]] = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, messages=None, **options):
+        self.requests.append(messages)
+        self.started.set()
+        self.release.wait(5)
+        message = SimpleNamespace(content=self.reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def app_state(tmp_path):
+    """The app with a one-book library, a fresh session store and a fake model."""
+    with (
+        patch(
+            "backend.RAG.HuggingFaceEndpointEmbeddings",
+            lambda **kwargs: HashingEmbeddings(),
+        ),
+        patch.dict(
+            query_embedding_caches, {"remote": LRUCache(256, "query_embeddings")}
+        ),
+    ):
+        library = BookLibrary(tmp_path / "library")
+        library.add_book(BOOK_ID, "a.pdf", PAGES, pdf_bytes=make_pdf(len(PAGES)))
+        sessions = SessionStore(tmp_path / "sessions.db")
+        sessions.set_active_book(BOOK_ID)
+        chat = FakeChatClient()
+        with (
+            patch.object(main.app.state, "library", library),
+            patch.object(main.app.state, "sessions", sessions),
+            patch.object(main, "client", chat),
+            patch.object(main, "manager", main.ConnectionManager()),
+        ):
+            yield SimpleNamespace(library=library, sessions=sessions, chat=chat)
+        chat.release.set()
+
+
+def chat_message(content: str, current_page: int = 4, **fields) -> dict:
+    return {"type": "chat", "content": content, "current_page": current_page, **fields}
+
+
+def ask(websocket, content: str, current_page: int = 4, **fields) -> str:
+    """Send a chat message and return the reply, skipping the progress message."""
+    websocket.send_json(chat_message(content, current_page, **fields))
+    reply = websocket.receive_text()
+    if reply == "Bot is thinking...":
+        reply = websocket.receive_text()
+    return reply
+
+
+def system_messages(request: list[dict]) -> int:
+    return sum(message["role"] == "system" for message in request)
+
+
+class TestUpload:
+    """Test the upload-pdf endpoint."""
+
+    def test_refused_when_memory_stays_short(self, app_state, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        # The loaded indexes fill the budget and nothing is released
+        budget = MemoryBudget(10**12, resident=lambda: 10**12)
+        with (
+            patch.object(main, "memory_budget", budget),
+            patch.object(
+                budget, "reserve", functools.partial(budget.reserve, timeout=0.05)
+            ),
+            patch.object(main, "pdf_bytes_to_langchain_doc") as parse,
+        ):
+            response = TestClient(main.app).post(
+                "/upload-pdf",
+                files={"pdf": ("b.pdf", make_pdf(2), "application/pdf")},
+            )
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "30"
+        assert budget.stats()["queued"] == 1
+        assert budget.stats()["refused"] == 1
+        # Refused before the PDF was parsed
+        parse.assert_not_called()
+        assert len(app_state.library.list_books()) == 1
+
+
+class TestActiveBook:
+    """Test that each session keeps its own active book."""
+
+    def test_selecting_a_book_leaves_other_sessions_alone(self, app_state):
+        app_state.library.add_book("book-b", "b.pdf", PAGES[:2])
+        client = TestClient(main.app)
+
+        response = client.post("/books/book-b/select?session_id=reader-one")
+
+        assert response.status_code == 200
+        assert (
+            client.get("/books?session_id=reader-one").json()["active_book_id"]
+            == "book-b"
+        )
+        assert (
+            client.get("/books?session_id=reader-two").json()["active_book_id"]
+            == BOOK_ID
+        )
+        assert main.get_embedder(session_id="reader-one").book_id == "book-b"
+        assert main.get_embedder(session_id="reader-two").book_id == BOOK_ID
+
+    def test_chat_without_book_id_uses_the_session_book(self, app_state):
+        app_state.library.add_book(
+            "book-b",
+            "b.pdf",
+            [Document(page_content="Dobby the house-elf", metadata={"page": 0})],
+        )
+        app_state.sessions.set_active_book("book-b", "reader-one")
+
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws?session_id=reader-one") as websocket:
+                ask(websocket, "Who is Dobby?", current_page=2)
+
+        (request,) = app_state.chat.requests
+        assert "Dobby" in request[0]["content"]
+        assert "Hagrid" not in request[0]["content"]
+        assert app_state.sessions.position("reader-one") == ("book-b", 2)
+
+
+class TestBookPages:
+    """Test the cacheable page, image and PDF endpoints."""
+
+    def test_page_text_revalidates_with_etag(self, app_state):
+        client = TestClient(main.app)
+        response = client.get(f"/books/{BOOK_ID}/pages/3/text")
+
+        assert response.status_code == 200
+        assert response.json()["text"] == PAGES[2].page_content
+        assert "immutable" in response.headers["cache-control"]
+
+        etag = response.headers["etag"]
+        response = client.get(
+            f"/books/{BOOK_ID}/pages/3/text", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert client.get(f"/books/{BOOK_ID}/pages/99/text").status_code == 404
+
+    def test_pdf_byte_range(self, app_state):
+        client = TestClient(main.app)
+        pdf = client.get(f"/books/{BOOK_ID}/pdf").content
+
+        response = client.get(f"/books/{BOOK_ID}/pdf", headers={"Range": "bytes=0-9"})
+
+        assert response.status_code == 206
+        assert response.content == pdf[:10]
+        assert response.headers["content-range"] == f"bytes 0-9/{len(pdf)}"
+
+    def test_page_image(self, app_state):
+        client = TestClient(main.app)
+        response = client.get(f"/books/{BOOK_ID}/pages/2/image?width=120")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert response.content.startswith(b"\x89PNG")
+
+        response = client.get(
+            f"/books/{BOOK_ID}/pages/2/image?width=120",
+            headers={"If-None-Match": response.headers["etag"]},
+        )
+        assert response.status_code == 304
+        assert client.get(f"/books/{BOOK_ID}/pages/99/image").status_code == 404
+        assert client.get("/books/missing/pages/1/image").status_code == 404
+
+
+def turn(question: str, answer: str, context: str | None = None) -> list[dict]:
+    messages = [{"role": "system", "content": context}] if context else []
+    return messages + [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer},
+    ]
+
+
+class TestRecentHistory:
+    """Test the recent_history function."""
+
+    def test_keeps_the_latest_messages_within_budget(self):
+        history = turn("q1", "a" * 400, "c" * 400) + turn("q2", "b" * 40, "d" * 40)
+
+        assert main.recent_history(history, 1000) == history
+        assert main.recent_history(history, 30) == history[3:]
+
+    def test_does_not_start_with_an_answer(self):
+        history = turn("q1", "a" * 400) + turn("q2", "b" * 40)
+
+        # The budget reaches the first answer but not its question
+        assert main.recent_history(history, 111) == history[2:]
+
+    def test_long_conversation_is_capped(self, app_state):
+        app_state.sessions.append(
+            "history-1",
+            [m for i in range(50) for m in turn(f"q{i}", "a" * 2000, "c" * 4000)],
+        )
+        with (
+            patch.object(main, "CHAT_HISTORY_TOKEN_BUDGET", 5000),
+            TestClient(main.app) as client,
+            client.websocket_connect("/ws?session_id=history-1") as websocket,
+        ):
+            ask(websocket, "Who is Firenze?")
+
+        (request,) = app_state.chat.requests
+        sent = sum(main.estimate_tokens(m["content"]) for m in request[:-2])
+        assert 0 < sent <= 5000
+        assert request[-1]["content"] == "Who is Firenze?"
+
+
+class TestFollowUps:
+    """Test follow-up detection in answer_message."""
+
+    def test_follow_up_reuses_the_previous_retrieval(self, app_state):
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws?session_id=followup-1") as websocket:
+                ask(websocket, "What is Snape hiding?")
+                ask(websocket, "and what is he hiding?")
+                stats = main.manager.followups["followup-1"].stats()
+
+        first, follow_up = app_state.chat.requests
+        assert system_messages(first) == 1
+        # No second search and no second copy of the context
+        assert system_messages(follow_up) == 1
+        assert stats["retrievals"] == 1
+        assert stats["reused_retrievals"] == 1
+        assert main.manager.counters["reused_retrievals"] == 1
+
+    def test_unrelated_pronoun_question_is_searched(self, app_state):
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws?session_id=followup-2") as websocket:
+                ask(websocket, "What is Snape hiding?")
+                ask(websocket, "where does he live in the forest?")
+
+        assert system_messages(app_state.chat.requests[-1]) == 2
+        assert main.manager.counters["reused_retrievals"] == 0
+
+
+class TestAnswerCache:
+    """Test the answer cache lookups in answer_message."""
+
+    def ask_in(self, client, session_id: str, content: str, **fields) -> str:
+        with client.websocket_connect(f"/ws?session_id={session_id}") as websocket:
+            return ask(websocket, content, **fields)
+
+    def answers(self, app_state):
+        return app_state.library.get_book(BOOK_ID).answer_cache
+
+    def test_same_question_is_answered_from_cache(self, app_state):
+        with TestClient(main.app) as client:
+            self.ask_in(client, "answers-1", "What is Snape hiding?")
+            reply = self.ask_in(client, "answers-2", "What is Snape hiding?")
+
+        assert reply == app_state.chat.reply
+        assert len(app_state.chat.requests) == 1
+        assert main.manager.counters["cached_answers"] == 1
+        assert self.answers(app_state).stats()["hits"] == 1
+        history = app_state.sessions.history("answers-2")
+        assert [m["role"] for m in history] == ["user", "assistant"]
+
+    def test_only_questions_that_stand_on_their_own_are_stored(self, app_state):
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws?session_id=answers-1") as websocket:
+                ask(websocket, "What is Snape hiding?")
+                # Depends on the conversation, so its answer is not reused
+                ask(websocket, "What did Quirrell hide under his turban?")
+            self.ask_in(client, "answers-2", "What did Quirrell hide under his turban?")
+
+        assert len(self.answers(app_state)) == 2
+        assert len(app_state.chat.requests) == 3
+        assert main.manager.counters["cached_answers"] == 0
+
+    def test_use_cache_false_skips_the_cache(self, app_state):
+        with TestClient(main.app) as client:
+            self.ask_in(client, "answers-1", "What is Snape hiding?")
+            self.ask_in(client, "answers-2", "What is Snape hiding?", use_cache=False)
+
+        assert len(app_state.chat.requests) == 2
+        assert main.manager.counters["cached_answers"] == 0
+        assert self.answers(app_state).stats()["hits"] == 0
+
+    def test_answer_is_not_served_before_its_pages(self, app_state):
+        with TestClient(main.app) as client:
+            self.ask_in(client, "answers-1", "What is Quirrell hiding?", current_page=6)
+            self.ask_in(client, "answers-2", "What is Quirrell hiding?", current_page=3)
+
+        assert len(app_state.chat.requests) == 2
+        assert main.manager.counters["cached_answers"] == 0
+        assert self.answers(app_state).stats()["spoiler_blocked"] == 1
+
+    def test_answer_after_going_back_is_not_stored(self, app_state):
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws?session_id=answers-1") as websocket:
+                ask(websocket, "What is Quirrell hiding?", current_page=6)
+                # The conversation sent with it holds page 6
+                ask(websocket, "Who is Snape?", current_page=3)
+            self.ask_in(client, "answers-2", "Who is Snape?", current_page=3)
+
+        assert len(self.answers(app_state)) == 2
+        assert len(app_state.chat.requests) == 3
+        assert main.manager.counters["cached_answers"] == 0
+
+
+class TestChatSocket:
+    """Test the reader, worker and sender tasks of websocket_endpoint."""
+
+    def test_new_message_supersedes_the_one_in_flight(self, app_state):
+        app_state.chat.release.clear()
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws?session_id=socket-1") as websocket:
+                websocket.send_json(chat_message("Who is Hagrid?"))
+                assert websocket.receive_text() == "Bot is thinking..."
+                assert app_state.chat.started.wait(5)
+
+                websocket.send_json(chat_message("Who is Quirrell?"))
+                assert websocket.receive_text() == "Bot is thinking..."
+                app_state.chat.release.set()
+                assert websocket.receive_text() == app_state.chat.reply
+
+        counters = main.manager.counters
+        assert counters["messages"] == 2
+        assert counters["superseded"] == 1
+        assert counters["cancelled_generations"] == 1
+        # Only the answered message is kept in the conversation
+        history = app_state.sessions.history("socket-1")
+        assert [m["content"] for m in history if m["role"] == "user"] == [
+            "Who is Quirrell?"
+        ]
+
+    def test_disconnect_cancels_the_message_in_flight(self, app_state):
+        app_state.chat.release.clear()
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws?session_id=socket-2") as websocket:
+                websocket.send_json(chat_message("Who is Hagrid?"))
+                assert websocket.receive_text() == "Bot is thinking..."
+                assert app_state.chat.started.wait(5)
+
+        counters = main.manager.counters
+        assert counters["abandoned_on_disconnect"] == 1
+        assert counters["cancelled_generations"] == 1
+        assert app_state.sessions.history("socket-2") == []
+        assert main.manager.stats()["active_connections"] == 0
+
+    def test_full_send_queue_holds_back_the_worker(self, app_state):
+        gate = threading.Event()
+        send_message = main.manager.send_message
+
+        async def gated_send(message, websocket):
+            await asyncio.to_thread(gate.wait, 5)
+            await send_message(message, websocket)
+
+        with (
+            patch.object(main, "WS_SEND_QUEUE_SIZE", 1),
+            patch.object(main.manager, "send_message", gated_send),
+            TestClient(main.app) as client,
+        ):
+            with client.websocket_connect("/ws?session_id=socket-3") as websocket:
+                # The sender is stuck on the first reply, the queue holds the next
+                websocket.send_json(chat_message("Who is Hagrid?"))
+                assert app_state.chat.started.wait(5)
+                time.sleep(0.2)
+                websocket.send_json(chat_message("Who is Quirrell?"))
+                time.sleep(0.2)
+                # The second answer waits for room in the queue before generating
+                assert len(app_state.chat.requests) == 1
+
+                gate.set()
+                replies = [websocket.receive_text() for _ in range(4)]
+
+        assert replies.count(app_state.chat.reply) == 2
+        assert len(app_state.chat.requests) == 2
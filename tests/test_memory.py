@@ -0,0 +1,147 @@
+"""
+Tests for the memory.py module.
+"""
+
+import threading
+import time
+import tracemalloc
+from unittest.mock import Mock
+
+import pytest
+from langchain_core.documents import Document
+
+from backend.flat_index import FlatVectorIndex
+from backend.memory import (
+    MemoryBudget,
+    MemoryBudgetExceeded,
+    StageMemory,
+    estimate_ingestion_bytes,
+    estimate_upload_bytes,
+    index_memory,
+    recent_profiles,
+)
+from tests.testing_setup import MockHuggingFaceEmbeddings
+
+
+class TestMemoryBudget:
+    """Test the MemoryBudget class."""
+
+    def test_admits_within_budget(self):
+        budget = MemoryBudget(100, resident=lambda: 40)
+
+        with budget.reserve(60):
+            assert budget.stats()["reserved_bytes"] == 60
+            assert budget.stats()["in_progress"] == 1
+
+        assert budget.stats()["reserved_bytes"] == 0
+        assert budget.stats()["admitted"] == 1
+
+    def test_queues_until_memory_is_released(self):
+        budget = MemoryBudget(100, resident=lambda: 0)
+        admitted = threading.Event()
+
+        def second_upload():
+            with budget.reserve(60, timeout=5):
+                admitted.set()
+
+        with budget.reserve(60):
+            thread = threading.Thread(target=second_upload)
+            thread.start()
+            time.sleep(0.1)
+            assert not admitted.is_set()
+            assert budget.stats()["queued"] == 1
+
+        thread.join()
+        assert admitted.is_set()
+
+    def test_refuses_after_timeout_or_when_too_large(self):
+        budget = MemoryBudget(100, resident=lambda: 80)
+
+        with pytest.raises(MemoryBudgetExceeded, match="within"):
+            with budget.reserve(30, timeout=0.05):
+                pass
+        with pytest.raises(MemoryBudgetExceeded, match="whole"):
+            with budget.reserve(101):
+                pass
+
+        assert budget.stats()["refused"] == 2
+        assert budget.stats()["reserved_bytes"] == 0
+
+    def test_no_limit_only_accounts(self):
+        budget = MemoryBudget(None, resident=lambda: 10**12)
+
+        with budget.reserve(10**12):
+            assert budget.stats()["reserved_bytes"] == 10**12
+
+
+class TestStageMemory:
+    """Test the StageMemory class."""
+
+    def test_marks_record_traced_memory(self):
+        tracemalloc.start()
+        try:
+            memory = StageMemory("Ingesting test.pdf", top=3)
+            buffers = [bytearray(1024) for _ in range(1024)]
+            memory.mark("allocate")
+            del buffers
+            memory.mark("release")
+        finally:
+            tracemalloc.stop()
+
+        allocate, release = memory.stages
+        assert allocate["peak_bytes"] >= 1024 * 1024
+        assert release["traced_bytes"] < allocate["traced_bytes"]
+        assert len(allocate["top_growth"]) == 3
+        assert recent_profiles()[-1] == memory.as_dict()
+
+    def test_marks_without_tracing(self):
+        memory = StageMemory("Ingesting test.pdf")
+        memory.mark("parse")
+
+        assert "traced_bytes" not in memory.stages[0]
+        assert memory.stages[0]["stage"] == "parse"
+
+
+class TestEstimates:
+    """Test the memory estimates."""
+
+    def test_ingestion_estimate_grows_with_overlap(self):
+        small = estimate_ingestion_bytes(10**6, 10**6, chunk_size=1000, chunk_overlap=0)
+        overlapping = estimate_ingestion_bytes(
+            10**6, 10**6, chunk_size=1000, chunk_overlap=500
+        )
+
+        assert 10**6 < small < overlapping
+
+    def test_upload_estimate_includes_the_parsed_text(self):
+        estimate = estimate_upload_bytes(10**6, chars_per_byte=1.0)
+
+        assert estimate == 10**6 + estimate_ingestion_bytes(10**6, 10**6)
+
+    def test_flat_index_memory(self, tmp_path):
+        documents = [
+            Document(page_content=f"chunk {i}", metadata={"page": i}) for i in range(10)
+        ]
+        index = FlatVectorIndex.from_documents(documents, MockHuggingFaceEmbeddings())
+        index.save(tmp_path)
+
+        in_memory = index_memory(index)
+        mapped = index_memory(FlatVectorIndex.load(tmp_path, None))
+
+        assert in_memory["chunks"] == 10
+        assert in_memory["mapped_bytes"] == 0
+        assert mapped["mapped_bytes"] == index.nbytes
+        assert mapped["resident_bytes"] == in_memory["resident_bytes"] - index.nbytes
+
+    def test_flat_index_embeds_in_batches(self):
+        embeddings = Mock()
+        embeddings.embed_documents.side_effect = lambda texts: [[1.0, 0.0]] * len(texts)
+        documents = [
+            Document(page_content=f"chunk {i}", metadata={"page": i}) for i in range(5)
+        ]
+
+        index = FlatVectorIndex(embeddings)
+        index.add_documents(documents, batch_size=2)
+
+        assert embeddings.embed_documents.call_count == 3
+        assert len(index) == 5
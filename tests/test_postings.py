@@ -0,0 +1,129 @@
+"""
+Tests for the postings.py module and multi-probe character analysis context.
+"""
+
+from langchain_core.documents import Document
+
+from backend.postings import CharacterPostings, name_terms
+from backend.RAG import EmbeddedPDF
+
+
+def chunks(texts: list[str]) -> list[Document]:
+    return [
+        Document(page_content=text, metadata={"page": page})
+        for page, text in enumerate(texts)
+    ]
+
+
+STORY = [
+    "Mr. Dursley went to work.",
+    "Professor McGonagall watched from the wall.",
+    "Dudley threw a tantrum.",
+    "Minerva said nothing at all.",
+    "The owls flew over the town.",
+    "Harry found McGonagall in the hall.",
+    "Dudley and Mr. Dursley went to the zoo.",
+    "McGonagall gave Harry a broom.",
+]
+
+
+class TestNameTerms:
+    """Test the name_terms function."""
+
+    def test_titles_and_punctuation_dropped(self):
+        assert name_terms("Mr. Dursley") == ["dursley"]
+        assert name_terms("Professor Minerva McGonagall") == ["minerva", "mcgonagall"]
+
+
+class TestCharacterPostings:
+    """Test the CharacterPostings class."""
+
+    def test_positions_of_any_name(self):
+        postings = CharacterPostings(chunks(STORY))
+
+        assert postings.positions("Minerva McGonagall") == [1, 3, 5, 7]
+        assert postings.positions("Vernon Dursley") == [0, 6]
+        assert postings.positions("Voldemort") == []
+
+    def test_shared_family_name(self):
+        """Test that a family name only counts next to the rest of the name."""
+        postings = CharacterPostings(
+            chunks(
+                [
+                    "Vernon Dursley went to work.",
+                    "Petunia Dursley craned over the fence.",
+                    "Dudley Dursley threw a tantrum.",
+                    "Mr. Dursley shouted.",
+                    "Dudley wanted more presents.",
+                ]
+            )
+        )
+
+        assert postings.positions("Dudley Dursley") == [2, 4]
+        assert postings.positions("Vernon Dursley") == [0]
+        assert postings.positions("Mr. Dursley") == [0, 1, 2, 3]
+
+    def test_sentence_openers_are_not_given_names(self):
+        postings = CharacterPostings(
+            chunks(
+                [
+                    "Even Dursley was quiet, and even the owls kept away.",
+                    "Dudley Dursley threw a tantrum.",
+                ]
+            )
+        )
+
+        assert postings.positions("Dudley Dursley") == [0, 1]
+
+    def test_mentions_below_bound(self):
+        postings = CharacterPostings(chunks(STORY))
+
+        assert postings.mentions("McGonagall", 8, first=1, recent=2) == ([1], [5, 7])
+        assert postings.mentions("McGonagall", 6, first=1, recent=2) == ([1], [5])
+        assert postings.mentions("McGonagall", 2, first=1, recent=2) == ([1], [])
+        assert postings.mentions("McGonagall", 1, first=1, recent=2) == ([], [])
+
+
+class TestCharacterContext:
+    """Test the multi-probe context of character analyses."""
+
+    def make_embedder(self, **kwargs):
+        pdf_embedder = EmbeddedPDF(
+            index_backend="flat",
+            embedding_backend="hashing",
+            chunking_strategy="page",
+            strip_boilerplate=False,
+            **kwargs,
+        )
+        pdf_embedder.embed_pdf(chunks(STORY))
+        return pdf_embedder
+
+    def test_first_and_recent_mentions(self):
+        pdf_embedder = self.make_embedder()
+
+        context = pdf_embedder.character_context("Minerva McGonagall", current_page=6)
+
+        first, recent = context.split("Most recent mentions:")
+        assert first.startswith("First mentions:")
+        assert "[Page 2]" in first and "[Page 4]" in first
+        assert "[Page 6]" in recent
+        assert "[Page 8]" not in context
+        assert pdf_embedder.selection_stats()["searches"] == 1
+
+    def test_contexts_are_cached(self):
+        pdf_embedder = self.make_embedder()
+
+        contexts = pdf_embedder.character_contexts(["Dudley", "Harry"], full_book=True)
+        again = pdf_embedder.character_context("Dudley", full_book=True)
+
+        assert again == contexts["Dudley"]
+        assert "[Page 3]" in again
+        assert pdf_embedder.retrieval_cache.stats()["hits"] == 1
+
+    def test_single_search_when_disabled(self):
+        pdf_embedder = self.make_embedder(analysis_probes=False)
+
+        context = pdf_embedder.character_context("Dudley", full_book=True)
+
+        assert "First mentions:" not in context
+        assert "Dudley threw a tantrum." in context
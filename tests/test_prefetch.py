@@ -0,0 +1,130 @@
+"""
+Tests for the prefetch.py module.
+"""
+
+import os
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+
+from backend.prefetch import (
+    Prefetcher,
+    character_query,
+    extract_names,
+    rank_recent_names,
+)
+from backend.RAG import EmbeddedPDF
+from tests.testing_setup import MockChroma, MockHuggingFaceEmbeddings
+
+PAGES = [
+    "The Dursleys lived on Privet Drive. Mr. Dursley disliked owls.",
+    "Harry Potter was asleep. Hagrid knocked. Hagrid was huge.",
+    "Professor McGonagall watched Harry Potter. Then Hagrid arrived.",
+]
+
+
+class TestNames:
+    """Test name extraction and query canonicalisation."""
+
+    def test_extract_names(self):
+        names = extract_names(PAGES[0])
+
+        assert "Dursleys" in names
+        assert "Mr. Dursley" in names
+        assert "Privet Drive" in names
+        assert "The" not in names
+
+    def test_sentence_start_words_are_dropped(self):
+        assert extract_names("Then Hagrid arrived. She smiled.") == ["Hagrid"]
+
+    def test_rank_recent_names(self):
+        page_names = [extract_names(page) for page in PAGES]
+
+        ranked = rank_recent_names(page_names, current_page=3, lookback=2)
+
+        assert set(ranked[:2]) == {"Hagrid", "Harry Potter"}
+        assert ranked[2] == "Professor McGonagall"
+        assert "Mr. Dursley" not in ranked
+
+    def test_character_query(self):
+        known = {"Hagrid", "Harry Potter"}
+
+        assert character_query("Who is Hagrid?", known) == "Hagrid"
+        assert character_query("tell me about harry potter", known) == "Harry Potter"
+        assert character_query("Who is Voldemort?", known) == "Who is Voldemort?"
+        assert character_query("Why did Hagrid knock?", known) == (
+            "Why did Hagrid knock?"
+        )
+
+
+class TestPrefetcher:
+    """Test the Prefetcher class."""
+
+    @patch.dict(os.environ, {"HUGGINGFACE_API_TOKEN": "test_token"})
+    @patch("backend.RAG.HuggingFaceEndpointEmbeddings", MockHuggingFaceEmbeddings)
+    @patch("backend.RAG.Chroma.from_documents", MockChroma.from_documents)
+    def test_prefetch_warms_retrieval_cache(self):
+        """Test that a later search for a recent name is a cache hit."""
+        pdf_embedder = EmbeddedPDF()
+        pdf_embedder.embed_pdf(
+            [
+                Document(page_content=text, metadata={"page": i})
+                for i, text in enumerate(PAGES)
+            ]
+        )
+        prefetcher = Prefetcher(lookback_pages=2, max_names=3, budget_s=5)
+
+        prefetcher.schedule("session", pdf_embedder, current_page=3).result()
+
+        assert prefetcher.stats()["searches"] == 3
+        assert pdf_embedder.is_search_cached(
+            "Hagrid", pdf_embedder.num_return_chunks, current_page=3
+        )
+        executions = pdf_embedder.coalescing_stats()["semantic_search"]["executions"]
+        pdf_embedder.semantic_search("hagrid", current_page=3)
+        assert (
+            pdf_embedder.coalescing_stats()["semantic_search"]["executions"]
+            == executions
+        )
+        assert pdf_embedder.cache_stats()["retrieval"]["hits"] >= 1
+
+    def test_superseded_prefetch_stops(self):
+        """Test that a prefetch stops once the same session has moved on."""
+
+        class StubEmbedder:
+            num_return_chunks = 5
+
+            class search_flight:
+                @staticmethod
+                def in_flight():
+                    return 0
+
+            def __init__(self):
+                self.searched = []
+
+            def recent_names(self, current_page, lookback):
+                return ["A", "B", "C"]
+
+            def is_search_cached(self, name, k, current_page=None):
+                return False
+
+            def semantic_search(self, name, k, current_page=None):
+                self.searched.append(name)
+
+        class PageTurningEmbedder(StubEmbedder):
+            def semantic_search(self, name, k, current_page=None):
+                super().semantic_search(name, k, current_page)
+                # The reader turns the page while the first name is searched
+                if len(self.searched) == 1:
+                    prefetcher.schedule("session", next_page, current_page + 1)
+
+        prefetcher = Prefetcher(budget_s=5)
+        embedder = PageTurningEmbedder()
+        next_page = StubEmbedder()
+
+        prefetcher.schedule("session", embedder, 1).result()
+        prefetcher.schedule("other", StubEmbedder(), 1).result()
+
+        assert embedder.searched == ["A"]
+        assert next_page.searched == ["A", "B", "C"]
+        assert prefetcher.stats()["superseded"] == 1
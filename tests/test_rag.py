@@ -9,7 +9,15 @@ import pytest
 from fastapi import UploadFile
 from langchain_core.documents import Document
 
-from backend.RAG import EmbeddedPDF, chunk_langchain_pages, file_to_langchain_doc
+from backend.RAG import (
+    EmbeddedPDF,
+    chunk_langchain_pages,
+    elbow_cutoff,
+    file_to_langchain_doc,
+    select_context,
+    task_options,
+)
+from backend.config import FAST_MODEL_ID, MODEL_ID
 from tests.testing_setup import (
     MockChroma,
     MockHuggingFaceEmbeddings,
@@ -153,6 +161,111 @@ class TestChunkLangchainPages:
             assert "source" in doc.metadata
             assert "page" in doc.metadata or "total_pages" in doc.metadata
 
+    def test_sentence_strategy_keeps_sentences_whole(self):
+        """Test that the sentence strategy only cuts at sentence boundaries."""
+        text = " ".join(f"Sentence number {i} ends here." for i in range(40))
+        page = Document(page_content=text, metadata={"page": 3})
+
+        result = chunk_langchain_pages(
+            [page], chunk_size=120, chunk_overlap=40, strategy="sentence"
+        )
+
+        assert len(result) > 1
+        for doc in result:
+            assert len(doc.page_content) <= 120
+            assert doc.page_content.startswith("Sentence")
+            assert doc.page_content.endswith("ends here.")
+            assert text[doc.metadata["start_index"] :].startswith(doc.page_content)
+            assert doc.metadata["page"] == 3
+        # Consecutive chunks share their boundary sentence
+        assert result[1].metadata["start_index"] < (
+            result[0].metadata["start_index"] + len(result[0].page_content)
+        )
+
+    def test_sentence_strategy_without_overlap(self):
+        text = " ".join(f"Sentence number {i} ends here." for i in range(40))
+        page = Document(page_content=text, metadata={"page": 0})
+
+        result = chunk_langchain_pages(
+            [page], chunk_size=120, chunk_overlap=0, strategy="sentence"
+        )
+
+        assert " ".join(doc.page_content for doc in result) == text
+
+    def test_page_strategy(self, sample_documents):
+        """Test that every non-empty page becomes exactly one chunk."""
+        pages = sample_documents + [Document(page_content="  ", metadata={"page": 9})]
+
+        result = chunk_langchain_pages(pages, strategy="page")
+
+        assert [doc.page_content for doc in result] == [
+            doc.page_content for doc in sample_documents
+        ]
+        assert all(doc.metadata["start_index"] == 0 for doc in result)
+
+    def test_unknown_strategy(self, sample_documents):
+        with pytest.raises(ValueError, match="Unknown chunking strategy"):
+            chunk_langchain_pages(sample_documents, strategy="semantic")
+
+
+class TestSelectContext:
+    """Test the choice of retrieved chunks for the prompt."""
+
+    @staticmethod
+    def results(scores, length=40):
+        return [
+            (Document(page_content="x" * length, metadata={"page": i}), score)
+            for i, score in enumerate(scores)
+        ]
+
+    def test_elbow_cutoff(self):
+        assert elbow_cutoff([0.9, 0.88, 0.87, 0.3, 0.28, 0.27, 0.26]) == 3
+        # Evenly falling or flat scores have no elbow
+        assert elbow_cutoff([0.9, 0.8, 0.7, 0.6, 0.5]) == 5
+        assert elbow_cutoff([0.5, 0.5, 0.5]) == 3
+        assert elbow_cutoff([0.9, 0.1]) == 2
+
+    def test_threshold_and_elbow_keep_min_k(self):
+        results = self.results([0.9, 0.88, 0.87, 0.3, 0.28, 0.27, 0.26, -0.1])
+
+        chosen, _ = select_context(results, 0.0, None, adaptive_k=False, min_k=1)
+        assert len(chosen) == 7
+
+        chosen, _ = select_context(results, 0.0, None, adaptive_k=True, min_k=1)
+        assert [score for _, score in chosen] == [0.9, 0.88, 0.87]
+
+        chosen, _ = select_context(results, 0.95, None, adaptive_k=True, min_k=2)
+        assert [score for _, score in chosen] == [0.9, 0.88]
+
+    def test_token_budget_packs_best_first(self):
+        results = self.results([0.9, 0.8, 0.7])
+        results[1] = (Document(page_content="y" * 400, metadata={"page": 1}), 0.8)
+
+        chosen, tokens = select_context(results, None, 60, adaptive_k=False)
+
+        # The long second chunk does not fit, the shorter third one still does
+        assert [score for _, score in chosen] == [0.9, 0.7]
+        assert tokens <= 60
+
+    def test_unscored_results_are_only_packed(self):
+        chosen, tokens = select_context(self.results([None] * 4), 0.5, 40)
+
+        assert len(chosen) == 2
+        assert tokens == 36
+
+
+class TestTaskOptions:
+    """Test cases for task_options function."""
+
+    def test_unset_options_are_dropped(self):
+        options = task_options("chat")
+        assert options["model"] == MODEL_ID
+        assert "stop" not in options
+
+    def test_unknown_task(self):
+        with pytest.raises(ValueError, match="Unknown task"):
+            task_options("translation")
+
 
 class TestEmbeddedPDF:
     """Test the EmbeddedPDF class."""
@@ -238,6 +351,97 @@ class TestEmbeddedPDF:
         assert isinstance(result, str)
         assert "Harry Potter" in result or "[Page" in result
 
+    @patch.dict(os.environ, {"HUGGINGFACE_API_TOKEN": "test_token"})
+    @patch("backend.RAG.HuggingFaceEndpointEmbeddings")
+    @patch("backend.RAG.Chroma.from_documents")
+    def test_semantic_search_current_page_override(
+        self, mock_chroma, mock_embeddings, sample_documents
+    ):
+        """Test that an explicit current_page bounds the search."""
+        mock_embeddings.return_value = MockHuggingFaceEmbeddings()
+        mock_chroma.return_value = MockChroma(sample_documents)
+
+        pdf_embedder = EmbeddedPDF()
+        pdf_embedder.embed_pdf(sample_documents)
+        pdf_embedder.set_current_page(3)
+
+        result = pdf_embedder.semantic_search("Harry Potter", current_page=1)
+
+        assert "[Page 1]" in result
+        assert "[Page 2]" not in result
+        assert pdf_embedder.coalescing_stats()["semantic_search"]["executions"] == 1
+
+    @patch.dict(os.environ, {"HUGGINGFACE_API_TOKEN": "test_token"})
+    @patch("backend.RAG.HuggingFaceEndpointEmbeddings")
+    @patch("backend.RAG.Chroma.from_documents")
+    def test_semantic_search_token_budget(
+        self, mock_chroma, mock_embeddings, sample_documents
+    ):
+        """Test that the context budget limits the chunks returned."""
+        mock_embeddings.return_value = MockHuggingFaceEmbeddings()
+        mock_chroma.return_value = MockChroma(sample_documents)
+
+        pdf_embedder = EmbeddedPDF(context_token_budget=1)
+        pdf_embedder.embed_pdf(sample_documents)
+
+        assert pdf_embedder.semantic_search("Harry Potter", full_book=True) == ""
+        stats = pdf_embedder.selection_stats()
+        assert stats["searches"] == 1
+        assert stats["mean_k"] == 0
+        assert stats["mean_candidates"] > 0
+
+    @patch.dict(os.environ, {"HUGGINGFACE_API_TOKEN": "test_token"})
+    @patch("backend.RAG.HuggingFaceEndpointEmbeddings")
+    @patch("backend.RAG.Chroma.from_documents")
+    def test_semantic_search_is_cached(
+        self, mock_chroma, mock_embeddings, sample_documents
+    ):
+        """Test that a repeated search is served from the retrieval cache."""
+        mock_embeddings.return_value = MockHuggingFaceEmbeddings()
+        mock_chroma.return_value = MockChroma(sample_documents)
+
+        pdf_embedder = EmbeddedPDF()
+        pdf_embedder.embed_pdf(sample_documents)
+
+        first = pdf_embedder.semantic_search("Harry Potter", current_page=2)
+        second = pdf_embedder.semantic_search("  harry potter ", current_page=2)
+
+        assert first == second
+        assert pdf_embedder.coalescing_stats()["semantic_search"]["executions"] == 1
+        assert pdf_embedder.cache_stats()["retrieval"]["hits"] == 1
+
+        # A new index invalidates the cache
+        pdf_embedder.embed_pdf(sample_documents)
+        assert not pdf_embedder.is_search_cached("Harry Potter", current_page=2)
+
+    @patch.dict(os.environ, {"HUGGINGFACE_API_TOKEN": "test_token"})
+    @patch("backend.RAG.HuggingFaceEndpointEmbeddings")
+    @patch("backend.RAG.Chroma.from_documents")
+    def test_semantic_search_many(self, mock_chroma, mock_embeddings, sample_documents):
+        """Test that several queries share one embedding request and the cache."""
+        embeddings = MockHuggingFaceEmbeddings()
+        embeddings.embed_documents = Mock(
+            side_effect=lambda texts: [[0.1]] * len(texts)
+        )
+        mock_embeddings.return_value = embeddings
+        mock_chroma.return_value = MockChroma(sample_documents)
+
+        pdf_embedder = EmbeddedPDF()
+        pdf_embedder.embed_pdf(sample_documents)
+        cached = pdf_embedder.semantic_search("Ron Weasley", current_page=2)
+        embeddings.embed_documents.reset_mock()
+
+        names = ["Harry Potter", "Hermione Granger", "Ron Weasley"]
+        results = pdf_embedder.semantic_search_many(names, current_page=2)
+
+        assert list(results) == names
+        assert results["Ron Weasley"] == cached
+        assert "[Page 3]" not in results["Harry Potter"]
+        embeddings.embed_documents.assert_called_once_with(
+            ["Harry Potter", "Hermione Granger"]
+        )
+        assert pdf_embedder.is_search_cached("Hermione Granger", current_page=2)
+
     @patch.dict(os.environ, {"HUGGINGFACE_API_TOKEN": "test_token"})
     @patch("backend.RAG.HuggingFaceEndpointEmbeddings")
     @patch("backend.RAG.Chroma.from_documents")
@@ -262,6 +466,36 @@ class TestEmbeddedPDF:
         assert len(result) > 0
         mock_client.assert_called_once()
 
+    @patch.dict(os.environ, {"HUGGINGFACE_API_TOKEN": "test_token"})
+    @patch("backend.RAG.HuggingFaceEndpointEmbeddings")
+    @patch("backend.RAG.Chroma.from_documents")
+    @patch("backend.RAG.InferenceClient")
+    def test_tasks_are_routed_by_profile(
+        self, mock_client, mock_chroma, mock_embeddings, sample_documents
+    ):
+        """Test extraction tasks use the fast model and analysis the large one."""
+        mock_embeddings.return_value = MockHuggingFaceEmbeddings()
+        mock_chroma.return_value = MockChroma(sample_documents)
+        mock_client.return_value = MockInferenceClient()
+
+        pdf_embedder = EmbeddedPDF()
+        pdf_embedder.embed_pdf(sample_documents)
+        completions = pdf_embedder.client.chat.completions
+        with patch.object(
+            completions, "create", wraps=completions.create
+        ) as mock_create:
+            pdf_embedder.check_page_for_characters("Harry met Hagrid.")
+            pdf_embedder.get_character_first_mention("Harry Potter")
+            pdf_embedder.generate_character_analysis("Harry Potter")
+
+        page_call, mention_call, analysis_call = mock_create.call_args_list
+        assert page_call.kwargs["model"] == FAST_MODEL_ID
+        assert page_call.kwargs["max_tokens"] == 64
+        assert mention_call.kwargs["model"] == FAST_MODEL_ID
+        assert mention_call.kwargs["stop"] == ["\n"]
+        assert analysis_call.kwargs["model"] == MODEL_ID
+        assert "stop" not in analysis_call.kwargs
+
     @patch.dict(os.environ, {"HUGGINGFACE_API_TOKEN": "test_token"})
     @patch("backend.RAG.HuggingFaceEndpointEmbeddings")
     def test_has_documents_false(self, mock_embeddings):
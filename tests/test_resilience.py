@@ -0,0 +1,260 @@
+"""
+Tests for the resilience.py module, run against a local fake inference server.
+"""
+
+import threading
+import time
+
+import pytest
+from huggingface_hub import InferenceClient
+
+from backend.resilience import (
+    CallCancelledError,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientCaller,
+    is_retryable,
+)
+from tests.fake_inference_server import FakeInferenceServer
+
+
+def make_caller(**kwargs) -> ResilientCaller:
+    """Create a caller with fast test-friendly defaults."""
+    options = {
+        "timeout": 2.0,
+        "max_retries": 2,
+        "backoff_base": 0.01,
+        "backoff_max": 0.02,
+        "hedge": False,
+        "max_concurrency": 4,
+    }
+    options.update(kwargs)
+    return ResilientCaller("test", **options)
+
+
+def chat(client: InferenceClient) -> str:
+    response = client.chat.completions.create(
+        model="fake-model", messages=[{"role": "user", "content": "Who is Harry?"}]
+    )
+    return response.choices[0].message.content
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestIsRetryable:
+    """Test the is_retryable function."""
+
+    def test_timeouts_are_retryable(self):
+        assert is_retryable(TimeoutError())
+        assert is_retryable(ConnectionResetError())
+
+    def test_client_errors_are_not_retryable(self):
+        class Response:
+            status_code = 400
+
+        error = RuntimeError("bad request")
+        error.response = Response()
+        assert not is_retryable(error)
+        assert not is_retryable(ValueError("bad input"))
+
+
+class TestCircuitBreaker:
+    """Test the CircuitBreaker class."""
+
+    def test_opens_after_threshold_and_recovers(self):
+        """Test the closed -> open -> half-open -> closed cycle."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+        breaker.record_failure()
+        breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+
+        clock.now = 10
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        breaker.allow()
+        # Only one trial call is allowed while half-open
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_trial_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+        breaker.record_failure()
+        clock.now = 5
+        breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.stats()["times_opened"] == 2
+
+    def test_released_trial_admits_the_next_call(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+        breaker.record_failure()
+        clock.now = 5
+        assert breaker.allow()
+
+        breaker.release_trial()
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+class TestResilientCaller:
+    """Test the ResilientCaller class against the fake inference server."""
+
+    def test_retries_transient_errors(self):
+        """Test that injected 503s are retried until the call succeeds."""
+        with FakeInferenceServer(fail_first=2, reply="PAGE: 7") as server:
+            client = InferenceClient(base_url=server.url, api_key="test")
+            caller = make_caller()
+
+            assert caller.call(chat, client) == "PAGE: 7"
+            assert server.requests == 3
+            assert caller.stats()["retries"] == 2
+
+    def test_client_errors_are_not_retried(self):
+        with FakeInferenceServer(fail_first=1, error_status=400) as server:
+            client = InferenceClient(base_url=server.url, api_key="test")
+            caller = make_caller()
+
+            with pytest.raises(Exception) as error:
+                caller.call(chat, client)
+            assert error.value.response.status_code == 400
+            assert server.requests == 1
+
+    def test_deadline_abandons_slow_calls(self):
+        """Test that a stuck request is abandoned at its deadline."""
+        with FakeInferenceServer(latency=1.0) as server:
+            client = InferenceClient(base_url=server.url, api_key="test")
+            caller = make_caller(timeout=0.2, max_retries=0)
+
+            start = time.monotonic()
+            with pytest.raises(TimeoutError):
+                caller.call(chat, client)
+            assert time.monotonic() - start < 0.8
+            assert caller.stats()["timeouts"] == 1
+
+    def test_circuit_breaker_fails_fast(self):
+        """Test that an outage trips the breaker and later calls never reach it."""
+        with FakeInferenceServer(error_rate=1.0) as server:
+            client = InferenceClient(base_url=server.url, api_key="test")
+            caller = make_caller(
+                max_retries=0, breaker=CircuitBreaker(failure_threshold=2)
+            )
+
+            for _ in range(2):
+                with pytest.raises(Exception, match="503"):
+                    caller.call(chat, client)
+
+            with pytest.raises(CircuitOpenError):
+                caller.call(chat, client)
+            assert server.requests == 2
+
+    def test_hedged_request_wins_over_stuck_primary(self):
+        """Test that a hedge fired after the delay can answer first."""
+        attempts = []
+
+        def sometimes_stuck():
+            attempts.append(1)
+            if len(attempts) == 1:
+                time.sleep(1.0)
+                return "slow"
+            return "fast"
+
+        caller = make_caller(hedge=True, hedge_min_delay=0.05, timeout=2.0)
+
+        assert caller.call(sometimes_stuck) == "fast"
+        stats = caller.stats()
+        assert stats["hedges"] == 1
+        assert stats["hedge_wins"] == 1
+
+    def test_cancel_abandons_in_flight_call(self):
+        """Test that setting cancel frees the caller and its slot promptly."""
+        cancel = threading.Event()
+        caller = make_caller(timeout=5.0, max_concurrency=1)
+
+        def stuck():
+            time.sleep(1.0)
+            return "late"
+
+        threading.Timer(0.1, cancel.set).start()
+        start = time.monotonic()
+        with pytest.raises(CallCancelledError):
+            caller.call(stuck, cancel=cancel)
+
+        assert time.monotonic() - start < 0.5
+        stats = caller.stats()
+        assert stats["cancelled"] == 1
+        assert stats["failures"] == 0
+        assert stats["circuit"]["consecutive_failures"] == 0
+        # The single slot is released once the abandoned request has finished
+        assert caller.call(lambda: "next") == "next"
+        assert time.monotonic() - start >= 1.0
+
+    def test_abandoned_requests_count_against_concurrency(self):
+        """Test that timed-out requests still running keep their slot."""
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+
+        def slow():
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.3)
+            with lock:
+                in_flight.pop()
+
+        caller = make_caller(timeout=0.05, max_retries=1, max_concurrency=1)
+        for _ in range(2):
+            with pytest.raises(TimeoutError):
+                caller.call(slow)
+
+        assert caller.stats()["timeouts"] == 4
+        assert max(peak) == 1
+
+    def test_cancelled_trial_admits_the_next_call(self):
+        """Test that a cancelled half-open trial does not keep the circuit shut."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+        caller = make_caller(breaker=breaker)
+        breaker.record_failure()
+        clock.now = 5
+        cancel = threading.Event()
+        threading.Timer(0.05, cancel.set).start()
+
+        with pytest.raises(CallCancelledError):
+            caller.call(time.sleep, 0.3, cancel=cancel)
+
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert caller.call(lambda: "next") == "next"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_cancel_while_waiting_for_slot(self):
+        cancel = threading.Event()
+        cancel.set()
+        caller = make_caller(max_concurrency=1)
+        release = threading.Event()
+        holder = threading.Thread(target=caller.call, args=(release.wait, 5))
+        holder.start()
+        time.sleep(0.05)
+
+        with pytest.raises(CallCancelledError):
+            caller.call(lambda: "never", cancel=cancel)
+
+        release.set()
+        holder.join()
@@ -0,0 +1,93 @@
+"""
+Tests for the session_store.py module.
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+from backend.session_store import SessionStore, session_id_or_new
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(tmp_path / "sessions.db")
+
+
+class TestSessionStore:
+    """Test the SessionStore class."""
+
+    def test_history_is_per_session(self, store):
+        store.append("session-a", [{"role": "user", "content": "Who is Hagrid?"}])
+        store.append("session-a", [{"role": "assistant", "content": "A giant."}])
+        store.append("session-b", [{"role": "user", "content": "Hello"}])
+
+        assert store.history("session-a") == [
+            {"role": "user", "content": "Who is Hagrid?"},
+            {"role": "assistant", "content": "A giant."},
+        ]
+        assert store.history("session-b") == [{"role": "user", "content": "Hello"}]
+        assert store.history("unknown") == []
+
+        store.clear("session-a")
+        assert store.history("session-a") == []
+
+    def test_state_is_shared_and_survives_restarts(self, store, tmp_path):
+        """Test that a second store on the same file sees every write."""
+        store.append("session-a", [{"role": "user", "content": "Hi"}])
+        store.set_position("session-a", "book-a", 12)
+        store.set_active_book("book-a")
+
+        other_worker = SessionStore(tmp_path / "sessions.db")
+
+        assert other_worker.history("session-a") == [{"role": "user", "content": "Hi"}]
+        assert other_worker.position("session-a") == ("book-a", 12)
+        assert other_worker.position("unknown") is None
+        assert other_worker.active_book() == "book-a"
+
+    def test_active_book_is_per_session(self, store):
+        store.set_active_book("book-a")
+        store.set_position("session-a", "book-a", 12)
+        store.set_active_book("book-b", "session-b")
+
+        assert store.active_book("session-a") == "book-a"
+        assert store.active_book("session-b") == "book-b"
+        # Sessions that have not chosen a book keep the default
+        assert store.active_book("session-c") == "book-a"
+        assert store.active_book() == "book-a"
+
+        # Another book starts on its first page, a page change keeps the book
+        store.set_active_book("book-b", "session-a")
+        assert store.position("session-a") == ("book-b", 0)
+        store.set_position("session-a", None, 3)
+        assert store.position("session-a") == ("book-b", 3)
+
+    def test_first_book_becomes_the_default(self, store):
+        store.set_active_book("book-b", "session-b")
+
+        assert store.active_book("session-c") == "book-b"
+
+    def test_wal_mode(self, store, tmp_path):
+        store.set_active_book("book-a")
+
+        conn = sqlite3.connect(tmp_path / "sessions.db")
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_prune_idle_sessions(self, store):
+        store.append("old", [{"role": "user", "content": "Hi"}])
+        time.sleep(0.01)
+        store.append("new", [{"role": "user", "content": "Hi"}])
+
+        assert store.prune(max_age_s=0.005) == 1
+        assert store.history("old") == []
+        assert store.history("new") != []
+
+    def test_session_id_or_new(self):
+        assert session_id_or_new("3f2b8c1e-0000-4000-8000-000000000000").startswith(
+            "3f2b8c1e"
+        )
+        assert len(session_id_or_new(None)) == 32
+        assert session_id_or_new("'; DROP TABLE sessions; --") != (
+            "'; DROP TABLE sessions; --"
+        )
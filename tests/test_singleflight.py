@@ -0,0 +1,121 @@
+"""
+Tests for the singleflight.py module.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.singleflight import SingleFlight, normalize_query
+
+
+class TestNormalizeQuery:
+    """Test the normalize_query function."""
+
+    def test_normalize_query(self):
+        """Test that case and whitespace differences are removed."""
+        assert normalize_query("  Harry   POTTER ") == "harry potter"
+
+
+class TestSingleFlight:
+    """Test the SingleFlight class."""
+
+    def test_identical_concurrent_calls_are_coalesced(self):
+        """Test that concurrent calls with the same key share one execution."""
+        flight = SingleFlight()
+        executions = []
+        release = threading.Event()
+
+        def slow_call():
+            executions.append(1)
+            release.wait(timeout=5)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            futures = [pool.submit(flight.do, "key", slow_call) for _ in range(5)]
+
+            # Wait until every caller has registered before releasing the leader
+            deadline = time.monotonic() + 5
+            while flight.stats()["calls"] < 5 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+
+            results = [future.result() for future in futures]
+
+        assert results == ["result"] * 5
+        assert len(executions) == 1
+        stats = flight.stats()
+        assert stats["executions"] == 1
+        assert stats["coalesced"] == 4
+        assert stats["in_flight"] == 0
+
+    def test_different_keys_are_not_coalesced(self):
+        """Test that calls with different keys run independently."""
+        flight = SingleFlight()
+
+        assert flight.do("a", lambda: 1) == 1
+        assert flight.do("b", lambda: 2) == 2
+        assert flight.stats()["coalesced"] == 0
+
+    def test_sequential_calls_run_again(self):
+        """Test that results are not cached once a call has finished."""
+        flight = SingleFlight()
+        counter = iter(range(10))
+
+        assert flight.do("key", lambda: next(counter)) == 0
+        assert flight.do("key", lambda: next(counter)) == 1
+        assert flight.stats()["executions"] == 2
+
+    def test_errors_are_shared(self):
+        """Test that waiting callers receive the leader's exception."""
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def failing_call():
+            release.wait(timeout=5)
+            raise RuntimeError("provider down")
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(flight.do, "key", failing_call) for _ in range(3)]
+
+            deadline = time.monotonic() + 5
+            while flight.stats()["calls"] < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+
+            for future in futures:
+                with pytest.raises(RuntimeError, match="provider down"):
+                    future.result()
+
+        assert flight.in_flight() == 0
+
+    def test_private_errors_are_not_shared(self):
+        """Test that waiters rerun the call when the leader's error is private."""
+        flight = SingleFlight(private_errors=(KeyboardInterrupt,))
+        release = threading.Event()
+        attempts = []
+
+        def call():
+            attempts.append(1)
+            if len(attempts) == 1:
+                release.wait(timeout=5)
+                raise KeyboardInterrupt
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, "key", call)
+            deadline = time.monotonic() + 5
+            while flight.in_flight() == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            waiter = pool.submit(flight.do, "key", call)
+            while flight.stats()["calls"] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+
+            with pytest.raises(KeyboardInterrupt):
+                leader.result()
+            assert waiter.result() == "result"
+
+        assert len(attempts) == 2
@@ -0,0 +1,43 @@
+"""
+Tests for the utils.py module.
+"""
+
+from backend.utils import http_date, is_not_modified, parse_websocket_message
+
+
+class TestParseWebsocketMessage:
+    """Test the parse_websocket_message function."""
+
+    def test_defaults(self):
+        message = parse_websocket_message('{"content": "  Who is Hagrid? "}')
+
+        assert message["content"] == "Who is Hagrid?"
+        assert message["type"] == "unknown"
+        assert message["current_page"] == 1
+        assert message["book_id"] is None
+        assert message["use_cache"] is True
+
+    def test_cache_opt_out(self):
+        message = parse_websocket_message('{"content": "Hi", "use_cache": false}')
+
+        assert message["use_cache"] is False
+
+
+class TestIsNotModified:
+    """Test the is_not_modified function."""
+
+    def test_matching_etag(self):
+        assert is_not_modified({"if-none-match": '"a", "b"'}, '"b"', 0)
+        assert is_not_modified({"if-none-match": 'W/"b"'}, '"b"', 0)
+        assert is_not_modified({"if-none-match": "*"}, '"b"', 0)
+        assert not is_not_modified({"if-none-match": '"a"'}, '"b"', 0)
+
+    def test_etag_takes_precedence_over_date(self):
+        headers = {"if-none-match": '"a"', "if-modified-since": http_date(2000)}
+        assert not is_not_modified(headers, '"b"', 1000)
+
+    def test_if_modified_since(self):
+        assert is_not_modified({"if-modified-since": http_date(2000)}, '"b"', 1000)
+        assert not is_not_modified({"if-modified-since": http_date(500)}, '"b"', 1000)
+        assert not is_not_modified({"if-modified-since": "garbage"}, '"b"', 1000)
+        assert not is_not_modified({}, '"b"', 1000)
@@ -2,6 +2,21 @@
 Test utilities and fixtures for RAG tests.
 """
 
+import io
+
+import pypdfium2 as pdfium
+
+
+def make_pdf(page_count: int) -> bytes:
+    """A PDF of blank A4 pages."""
+    document = pdfium.PdfDocument.new()
+    for _ in range(page_count):
+        document.new_page(595, 842)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    document.close()
+    return buffer.getvalue()
+
 
 class MockPyPDF2Reader:
     """Mock PyPDF2.PdfReader for testing."""
@@ -23,7 +38,7 @@ class MockPage:
 class MockChroma:
     """Mock Chroma vector database for testing."""
 
-    def __init__(self, documents=None):
+    def __init__(self, documents=None, **kwargs):
         self.documents = documents or []
         self.embedding_function = None
 
@@ -33,9 +48,42 @@ class MockChroma:
         instance.embedding_function = embedding_function
         return instance
 
-    def similarity_search_with_relevance_scores(self, query, k=10):
+    def add_documents(self, documents):
+        self.documents.extend(documents)
+
+    def similarity_search_with_relevance_scores(self, query, k=10, filter=None):
         # Return mock search results
-        return [(doc, 0.9) for doc in self.documents[:k]]
+        matches = [doc for doc in self.documents if matches_filter(doc, filter)]
+        return [(doc, 0.9) for doc in matches[:k]]
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding, k=10, filter=None
+    ):
+        return self.similarity_search_with_relevance_scores(None, k=k, filter=filter)
+
+
+def matches_filter(doc, where):
+    """Evaluate the subset of Chroma metadata filters used by the backend."""
+    if not where:
+        return True
+    if "$and" in where:
+        return all(matches_filter(doc, clause) for clause in where["$and"])
+
+    operators = {
+        "$eq": lambda a, b: a == b,
+        "$lt": lambda a, b: a < b,
+        "$lte": lambda a, b: a <= b,
+        "$gte": lambda a, b: a >= b,
+        "$in": lambda a, b: a in b,
+    }
+    for field, condition in where.items():
+        value = doc.metadata.get(field)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, expected in condition.items():
+            if value is None or not operators[operator](value, expected):
+                return False
+    return True
 
 
 class MockHuggingFaceEmbeddings:
@@ -71,7 +119,7 @@ class MockChat:
 class MockChatCompletions:
     """Mock chat completions for testing."""
 
-    def create(self, model=None, messages=None, temperature=None):
+    def create(self, model=None, messages=None, temperature=None, **options):
         # Return a mock response based on the input
         user_message = messages[0]["content"] if messages else ""
 